@@ -0,0 +1,68 @@
+"""
+Benchmark of sort_geometry_files_by_distance against the original pure Python greedy sort
+on normally distributed fulvene geometries
+"""
+import argparse
+import tempfile
+import time
+from typing import List, Tuple
+import numpy as np
+
+from data.casscf import EQUILIBRIUM_GEOMETRY_PATH
+from data.utils import Atom, get_pos_matrix, read_xyz_file, sort_geometry_files_by_distance, write_xyz_file
+
+
+def reference_sort_geometry_files_by_distance(geometry_files: List[str], start_geometry_file: str) -> Tuple[List[str], List[int]]:
+  start_geometry = read_xyz_file(start_geometry_file)
+  geometries = [read_xyz_file(file) for file in geometry_files]
+  pos_matrices = [get_pos_matrix(geometry) for geometry in geometries]
+  indices = np.arange(len(geometry_files)).tolist()
+  selected_idxs = []
+  sorted_geometry_files = []
+
+  current_geometry = get_pos_matrix(start_geometry)
+  for _ in range(len(geometry_files)):
+    distances = [np.sum(np.linalg.norm(pos_matrices[idx] - current_geometry)) for idx in indices]
+    selected_idx = indices[np.argmin(distances)]
+    indices.remove(selected_idx)
+    selected_idxs.append(selected_idx)
+    current_geometry = get_pos_matrix(geometries[selected_idx])
+    sorted_geometry_files.append(geometry_files[selected_idx])
+
+  return sorted_geometry_files, selected_idxs
+
+
+def write_normal_distribution_geometries(folder: str, n: int, sigma: float = 0.05) -> List[str]:
+  equilibrium_geometry = read_xyz_file(EQUILIBRIUM_GEOMETRY_PATH)
+  geometry_files = []
+  for idx in range(n):
+    displacements = np.random.normal(loc=0, scale=sigma, size=(len(equilibrium_geometry), 3))
+    geometry = [Atom(a.type, a.x + d[0], a.y + d[1], a.z + d[2]) for a, d in zip(equilibrium_geometry, displacements)]
+    write_xyz_file(geometry, f'{folder}/geometry_{idx}.xyz')
+    geometry_files.append(f'{folder}/geometry_{idx}.xyz')
+  return geometry_files
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--sizes', type=int, nargs='+', default=[250, 500, 1000, 2000, 5000, 10000])
+  parser.add_argument('--max_reference_size', type=int, default=2000)
+  args = parser.parse_args()
+
+  np.random.seed(0)
+  print(f'{"n":>8} {"vectorized (s)":>12} {"reference (s)":>14} {"speedup":>8} {"same order":>11}')
+  for n in args.sizes:
+    with tempfile.TemporaryDirectory() as folder:
+      geometry_files = write_normal_distribution_geometries(folder, n)
+
+      tic = time.perf_counter()
+      _, selected_idxs = sort_geometry_files_by_distance(geometry_files, EQUILIBRIUM_GEOMETRY_PATH)
+      t_vectorized = time.perf_counter() - tic
+
+      if n <= args.max_reference_size:
+        tic = time.perf_counter()
+        _, reference_idxs = reference_sort_geometry_files_by_distance(geometry_files, EQUILIBRIUM_GEOMETRY_PATH)
+        t_reference = time.perf_counter() - tic
+        print(f'{n:>8} {t_vectorized:>12.3f} {t_reference:>14.3f} {t_reference / t_vectorized:>8.1f} {str(selected_idxs == reference_idxs):>11}')
+      else:
+        print(f'{n:>8} {t_vectorized:>12.3f} {"-":>14} {"-":>8} {"-":>11}')
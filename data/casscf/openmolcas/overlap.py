@@ -0,0 +1,223 @@
+"""
+In-process AO overlap matrices in the OpenMolcas AO order, computed with PySCF integrals from the
+Molcas basis library, so that S does not need a Seward run per geometry.
+
+OpenMolcas (NoSym, coord=geom.xyz) orders the AOs atom by atom in the order of the xyz file, also when
+elements are interleaved, within an atom by angular momentum, then by magnetic component (px, py, pz /
+d-2 ... d2, the same real spherical harmonics as PySCF) and then by contracted function. PySCF orders the
+contracted functions before the components, so the AOs of every atom are permuted. The order was checked
+against the overlap matrix of data/files/orb_cc-pVDZ.orb, see read_orb_overlap_matrix.
+
+Only the basis in the Molcas library gives the OpenMolcas S: the contractions of e.g. cc-pVDZ differ from
+the ones PySCF ships, so there is no fallback to PySCF basis sets.
+"""
+import argparse
+import os
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import h5py
+from pyscf import gto
+
+from data.casscf.openmolcas import MOLCAS_PATH
+from data.casscf.openmolcas.utils import read_orb_file
+from data.utils import read_xyz_file
+
+MOLCAS_BASIS_LIBRARY = os.environ.get('MOLCAS_BASIS_LIBRARY',
+                                      os.path.join(os.environ.get('MOLCAS', os.path.dirname(os.path.dirname(MOLCAS_PATH))), 'basis_library'))
+
+# basis name -> (basis library file, contraction), contraction None takes the one in the basis label
+BASIS_FAMILIES = {
+    'ANO-S-MB': ('ANO-S', 'MB'),
+    'cc-pVDZ': ('cc-pVDZ', None),
+}
+
+
+def get_minimal_basis_contraction(charge: int) -> List[int]:
+    """ number of contracted functions per angular momentum of a minimal basis: the occupied shells of the atom """
+    if charge <= 2:
+        return [1]
+    if charge <= 10:
+        return [2, 1]
+    if charge <= 18:
+        return [3, 2]
+    raise ValueError(f'No minimal basis contraction defined for charge {charge}')
+
+
+def _read_numbers(lines: List[str]) -> List[float]:
+    numbers = []
+    for line in lines:
+        numbers.extend(float(token.replace('D', 'E').replace('d', 'e')) for token in line.split())
+    return numbers
+
+
+def parse_molcas_basis_entry(lines: List[str]) -> Tuple[float, List[Tuple[np.ndarray, np.ndarray]]]:
+    """
+    Parses the lines of one /label entry of a Molcas basis library file (without the label line) into
+    the nuclear charge and a (exponents, coefficients[n_primitives, n_contracted]) pair per angular momentum
+    """
+    # two reference lines, followed by an optional Options block
+    lines = lines[2:]
+    options = []
+    if lines and lines[0].strip().lower() == 'options':
+        end = next(idx for idx, line in enumerate(lines) if line.strip().lower() == 'endoptions')
+        options = [line.strip().lower() for line in lines[1:end]]
+        lines = lines[end + 1:]
+    lines = [line for line in lines if line.strip() and not line.lstrip().startswith(('*', '#'))]
+
+    numbers = _read_numbers(lines)
+    position = 0
+    def take(n: int) -> List[float]:
+        nonlocal position
+        values = numbers[position:position + n]
+        if len(values) < n:
+            raise ValueError('Basis set entry ended unexpectedly')
+        position += n
+        return values
+
+    charge, max_l = take(2)
+    shells = []
+    for _ in range(int(max_l) + 1):
+        n_primitives, n_contracted = (int(value) for value in take(2))
+        exponents = np.array(take(n_primitives))
+        coefficients = np.array(take(n_primitives * n_contracted)).reshape(n_primitives, n_contracted)
+        # per shell orbital energies / occupations follow the coefficients as a count and the values
+        for option in ('orbitalenergies', 'occupation'):
+            if option in options:
+                take(int(take(1)[0]))
+        shells.append((exponents, coefficients))
+    return charge, shells
+
+
+def _get_label_contraction(label: str) -> Optional[List[int]]:
+    # e.g. C.cc-pVDZ...9s4p1d.3s2p1d. -> [3, 2, 1]
+    fields = [field for field in label.split('.') if field]
+    if len(fields) < 3:
+        return None
+    contraction, number = [], ''
+    for char in fields[-1].lower():
+        if char.isdigit():
+            number += char
+        else:
+            contraction.append(int(number))
+            number = ''
+    return contraction
+
+
+@lru_cache(maxsize=None)
+def load_molcas_basis(library_file: str, element: str, contraction: Optional[str] = None) -> List[List]:
+    """ returns the basis of an element from a Molcas basis library file in the PySCF format """
+    with open(library_file) as f:
+        file_lines = f.read().splitlines()
+
+    label, entry_lines = None, []
+    for idx, line in enumerate(file_lines):
+        if line.startswith('/') and line[1:].split('.')[0].lower() == element.lower():
+            label = line[1:].strip()
+            entry_lines = []
+            for entry_line in file_lines[idx + 1:]:
+                if entry_line.startswith('/'):
+                    break
+                entry_lines.append(entry_line)
+            break
+    if label is None:
+        raise KeyError(f'No basis for {element} in {library_file}')
+
+    charge, shells = parse_molcas_basis_entry(entry_lines)
+    if contraction == 'MB':
+        n_contracted = get_minimal_basis_contraction(int(charge))
+    else:
+        n_contracted = _get_label_contraction(label) or [coefficients.shape[1] for _, coefficients in shells]
+
+    basis = []
+    for l, n in enumerate(n_contracted):
+        exponents, coefficients = shells[l]
+        basis.append([l] + [[exponent] + list(row[:n]) for exponent, row in zip(exponents, coefficients)])
+    return basis
+
+
+def get_basis(elements: Tuple[str, ...], basis: str, basis_library: Optional[str] = None) -> Dict:
+    """ PySCF basis dict for the elements from the Molcas basis library """
+    library_name, contraction = BASIS_FAMILIES[basis]
+    library_file = os.path.join(basis_library or MOLCAS_BASIS_LIBRARY, library_name)
+    if not os.path.exists(library_file):
+        raise FileNotFoundError(f'Molcas basis library file {library_file} not found, set MOLCAS_BASIS_LIBRARY')
+    return {element: load_molcas_basis(library_file, element, contraction) for element in elements}
+
+
+def get_molcas_ao_permutation(molecule: gto.Mole) -> np.ndarray:
+    """ indices that reorder the spherical AOs of a PySCF molecule into the OpenMolcas order """
+    keys = []
+    for atom_idx in range(molecule.natm):
+        contraction_counts = {}
+        for shell_idx in molecule.atom_shell_ids(atom_idx):
+            l = molecule.bas_angular(shell_idx)
+            for _ in range(molecule.bas_nctr(shell_idx)):
+                contraction = contraction_counts.get(l, 0)
+                contraction_counts[l] = contraction + 1
+                keys.extend((atom_idx, l, m, contraction) for m in range(2 * l + 1))
+    # PySCF AOs are ordered atom by atom and shell by shell, so the enumeration follows the AO indices
+    return np.array(sorted(range(len(keys)), key=lambda idx: keys[idx]))
+
+
+def build_molecule(geometry_path: str, basis: str, basis_library: Optional[str] = None) -> gto.Mole:
+    geometry = read_xyz_file(geometry_path)
+    elements = tuple(sorted({atom.type for atom in geometry}))
+    return gto.M(atom=[[atom.type, (atom.x, atom.y, atom.z)] for atom in geometry],
+                 basis=get_basis(elements, basis, basis_library),
+                 unit='Angstrom',
+                 verbose=0)
+
+
+def compute_overlap_matrix(geometry_path: str, basis: str, basis_library: Optional[str] = None) -> np.ndarray:
+    """ AO overlap matrix of a geometry in the OpenMolcas AO order """
+    molecule = build_molecule(geometry_path, basis, basis_library)
+    permutation = get_molcas_ao_permutation(molecule)
+    S = molecule.intor('int1e_ovlp')
+    return S[np.ix_(permutation, permutation)]
+
+
+def read_molcas_overlap_matrix(h5_file: str) -> np.ndarray:
+    with h5py.File(h5_file, 'r') as data:
+        S = data.get('AO_OVERLAP_MATRIX')[:]
+    basis_set_size = int(np.sqrt(S.shape[0]))
+    return S.reshape(basis_set_size, basis_set_size)
+
+
+def read_orb_overlap_matrix(orb_file: str) -> np.ndarray:
+    """
+    AO overlap matrix an INPORB file with a full set of orthonormal orbitals was computed with:
+    C S C^T = 1 for the orbitals C (one per row), so S = (C^T C)^-1
+    """
+    C = read_orb_file(orb_file)
+    return np.linalg.inv(C.T @ C)
+
+
+def read_reference_overlap_matrix(file: str) -> np.ndarray:
+    """ OpenMolcas overlap matrix from a CASSCF.rasscf.h5 / CASSCF.guessorb.h5 or an INPORB file """
+    if file.endswith('.h5'):
+        return read_molcas_overlap_matrix(file)
+    return read_orb_overlap_matrix(file)
+
+
+def validate_overlap_matrix(reference_file: str, geometry_path: str, basis: str, basis_library: Optional[str] = None) -> float:
+    """ maximum absolute deviation from the overlap matrix of an OpenMolcas calculation on the same geometry """
+    S_molcas = read_reference_overlap_matrix(reference_file)
+    S = compute_overlap_matrix(geometry_path, basis, basis_library)
+    if S.shape != S_molcas.shape:
+        raise ValueError(f'Basis set size {S.shape[0]} does not match OpenMolcas ({S_molcas.shape[0]})')
+    return float(np.max(np.abs(S - S_molcas)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--reference_file', type=str, nargs='+', help='CASSCF.rasscf.h5 / CASSCF.guessorb.h5 / INPORB files')
+    parser.add_argument('--geometry_path', type=str, nargs='+', help='geometry the reference file was computed for')
+    parser.add_argument('--basis', type=str, default='ANO-S-MB')
+    parser.add_argument('--basis_library', type=str, default=None)
+    parser.add_argument('--tolerance', type=float, default=1e-8)
+    args = parser.parse_args()
+
+    for reference_file, geometry_path in zip(args.reference_file, args.geometry_path):
+        error = validate_overlap_matrix(reference_file, geometry_path, args.basis, args.basis_library)
+        print(f'{geometry_path}: max |S - S_molcas| = {error:.3e} {"OK" if error < args.tolerance else "MISMATCH"}')
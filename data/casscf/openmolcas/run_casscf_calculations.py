@@ -1,6 +1,8 @@
 
+import asyncio
 import multiprocessing
 import os
+import time
 from typing import List, Optional
 import argparse
 import numpy as np
@@ -11,16 +13,17 @@ import shutil
 import h5py
 
 from data.casscf import EQUILIBRIUM_GEOMETRY_PATH
-from data.casscf.openmolcas import MOLCAS_PATH, get_guess_orb_file, get_input_file
-from data.utils import CasscfResult, check_and_create_folder, find_all_geometry_files_in_folder, sort_geometry_files_by_distance
-from openmolcas.utils import *
+from data.casscf.openmolcas import get_guess_orb_file, get_input_file
+from data.casscf.openmolcas.runner import MolcasRunner, run_molcas_calculation
+from data.casscf.openmolcas.utils import parse_log_file, write_coeffs_to_orb_file
+from data.utils import CampaignJournal, CasscfResult, build_geometry_tree, check_and_create_folder, find_all_geometry_files_in_folder, sort_geometry_files_by_distance
 
 
-def run_fulvene_casscf_calculation(geometry_xyz_file_path: str, 
-                                   guess_orb_file_path: str,
-                                   base_path: str,
-                                   index: int,
-                                   basis: str = 'ANO-S-MB'):
+def prepare_fulvene_casscf_calculation(geometry_xyz_file_path: str, 
+                                       guess_orb_file_path: str,
+                                       base_path: str,
+                                       index: int,
+                                       basis: str = 'ANO-S-MB') -> str:
     # make dir
     dir_path = f'{base_path}/calculation_{index}/'
     if not os.path.exists(dir_path):
@@ -30,49 +33,71 @@ def run_fulvene_casscf_calculation(geometry_xyz_file_path: str,
     shutil.copy2(get_input_file(basis), f'{dir_path}/CASSCF.input')
     shutil.copy2(guess_orb_file_path, f'{dir_path}/geom.orb')
     shutil.copy2(geometry_xyz_file_path, f'{dir_path}/geom.xyz')
+    return dir_path
 
-    # create temp dir
-    temp_dir = f'{dir_path}/temp/'
-    if not os.path.exists(temp_dir):
-        os.makedirs(temp_dir)
-
-    # execute OpenMolcas
-    os.system(f'cd {dir_path} && WorkDir=./temp/ {MOLCAS_PATH} CASSCF.input > calc.log')
-
-    # remove temp dir
-    shutil.rmtree(temp_dir)
-
+def read_fulvene_casscf_calculation(dir_path: str, basis: str = 'ANO-S-MB') -> CasscfResult:
     # extract information
-    data = h5py.File(os.path.join(dir_path, 'CASSCF.rasscf.h5'))
-    basis_set_size = int(np.sqrt(data.get('AO_OVERLAP_MATRIX')[:].shape[0]))
+    with h5py.File(os.path.join(dir_path, 'CASSCF.rasscf.h5'), 'r') as data:
+        basis_set_size = int(np.sqrt(data.get('AO_OVERLAP_MATRIX')[:].shape[0]))
 
-    S = data.get('AO_OVERLAP_MATRIX')[:].reshape(basis_set_size, basis_set_size)
-    mo_energies = data.get('MO_ENERGIES')[:]
-    mo_coeffs = data.get('MO_VECTORS')[:].reshape(basis_set_size, basis_set_size)
+        S = data.get('AO_OVERLAP_MATRIX')[:].reshape(basis_set_size, basis_set_size)
+        mo_energies = data.get('MO_ENERGIES')[:]
+        mo_coeffs = data.get('MO_VECTORS')[:].reshape(basis_set_size, basis_set_size)
     F =  S @ mo_coeffs.T @ np.diag(mo_energies) @ np.linalg.inv(mo_coeffs.T)
 
-    _, _, n_iterations = read_log_file(os.path.join(dir_path, 'calc.log'))
-    s1_energy = get_s1_energy(os.path.join(dir_path, 'calc.log'))
-    s2_energy = get_s2_energy(os.path.join(dir_path, 'calc.log'))
-    e_tot = 0.5 * (s1_energy + s2_energy)
+    log = parse_log_file(os.path.join(dir_path, 'calc.log'))
+    if 1 not in log.root_energies or 2 not in log.root_energies:
+        raise ValueError(f'No S1/S2 root energies in {dir_path}calc.log')
+    e_tot = 0.5 * (log.root_energies[1] + log.root_energies[2])
 
     return CasscfResult(
-        converged=True,
+        converged=log.converged,
         basis=basis,
         e_tot=e_tot,
         mo_energies=mo_energies,
         mo_coeffs=mo_coeffs,
         S=S,
         F=F,
-        imacro=n_iterations,
-    ), dir_path
+        imacro=log.n_iterations,
+    )
+
+def run_fulvene_casscf_calculation(geometry_xyz_file_path: str, 
+                                   guess_orb_file_path: str,
+                                   base_path: str,
+                                   index: int,
+                                   basis: str = 'ANO-S-MB',
+                                   timeout: Optional[float] = None,
+                                   scratch_path: Optional[str] = None):
+    dir_path = prepare_fulvene_casscf_calculation(geometry_xyz_file_path, guess_orb_file_path, base_path, index, basis)
+    # raises MolcasCalculationError before the h5 file of a failed run is read
+    run_molcas_calculation(dir_path, timeout=timeout, scratch_path=scratch_path)
+    return read_fulvene_casscf_calculation(dir_path, basis), dir_path
+
+def get_resume_guess_orb_file(journal: CampaignJournal, name: str, base_path: str, basis: str) -> str:
+    """
+    Returns the orbital file to continue the guess chain from a finished calculation,
+    regenerating it from the stored MO coefficients if the RasOrb file is gone
+    """
+    record = journal.records[name]
+    guess_orb_file = os.path.join(record['calculation_path'], 'CASSCF.RasOrb')
+    if not os.path.exists(guess_orb_file):
+        guess_orb_file = os.path.join(base_path, f'{name}_resume.orb')
+        mo_coeffs = journal.load_result(name).mo_coeffs
+        write_coeffs_to_orb_file(mo_coeffs.flatten(), input_file_path=get_guess_orb_file(basis),
+                                 output_file_path=guess_orb_file, n=mo_coeffs.shape[0])
+    return guess_orb_file
 
 def run_casscf_calculations(geometry_folder: str, 
                             output_folder: str,
-                            basis: str) -> None:
+                            basis: str,
+                            timeout: Optional[float] = None,
+                            scratch_path: Optional[str] = None) -> None:
     check_and_create_folder(geometry_folder)
     check_and_create_folder(output_folder)
 
+    journal = CampaignJournal(output_folder)
+    resume_name = None
+
     files = find_all_geometry_files_in_folder(geometry_folder)    
     files, _ = sort_geometry_files_by_distance(files, EQUILIBRIUM_GEOMETRY_PATH)   
         
@@ -80,15 +105,114 @@ def run_casscf_calculations(geometry_folder: str,
 
     for idx, geometry_file in enumerate(tqdm(files, total=len(files))):
         calculation_name = geometry_file.split('/')[-1].split('.')[0]
-        calculation_result, curr_path = run_fulvene_casscf_calculation(geometry_xyz_file_path=geometry_file,
-                                                                       guess_orb_file_path=guess_orb_file,
-                                                                       base_path=output_folder,
-                                                                       index=idx,
-                                                                       basis=basis)
+        output_path = output_folder + calculation_name + '.npz'
+
+        if journal.is_finished(calculation_name):
+            resume_name = calculation_name
+            continue
+        if resume_name is not None:
+            guess_orb_file = get_resume_guess_orb_file(journal, resume_name, output_folder, basis)
+            resume_name = None
+
+        journal.record(calculation_name, 'started', output_path, geometry_file=geometry_file)
+        tic = time.perf_counter()
+        try:
+            calculation_result, curr_path = run_fulvene_casscf_calculation(geometry_xyz_file_path=geometry_file,
+                                                                           guess_orb_file_path=guess_orb_file,
+                                                                           base_path=output_folder,
+                                                                           index=idx,
+                                                                           basis=basis,
+                                                                           timeout=timeout,
+                                                                           scratch_path=scratch_path)
+        except Exception as e:
+            journal.record(calculation_name, 'failed', output_path, geometry_file=geometry_file, error=repr(e))
+            raise
                                                                        
         guess_orb_file = os.path.join(curr_path, 'CASSCF.RasOrb')
-        calculation_result.store_as_npz(output_folder + calculation_name + '.npz')
+        calculation_result.store_as_npz(output_path)
+        journal.record(calculation_name, 'finished', output_path, time.perf_counter() - tic, calculation_result.imacro,
+                       geometry_file=geometry_file, calculation_path=curr_path)
+
+    print('Done')
+
+def run_casscf_calculations_parallel(geometry_folder: str, 
+                                     output_folder: str,
+                                     basis: str,
+                                     n_workers: Optional[int] = None,
+                                     timeout: Optional[float] = None,
+                            scratch_path: Optional[str] = None) -> None:
+    """
+    Runs the calculations on a nearest-neighbour tree of the geometries instead of a single chain, like the
+    PySCF driver. A geometry is started as soon as its parent geometry has converged, with the parent's
+    RasOrb file as guess, so at most n_workers OpenMolcas runs of independent branches run concurrently.
+    """
+    check_and_create_folder(geometry_folder)
+    check_and_create_folder(output_folder)
 
+    journal = CampaignJournal(output_folder)
+    runner = MolcasRunner(n_workers, timeout, scratch_path)
+
+    files = find_all_geometry_files_in_folder(geometry_folder)
+    files, parents = build_geometry_tree(files, EQUILIBRIUM_GEOMETRY_PATH)
+    names = [file.split('/')[-1].split('.')[0] for file in files]
+    output_paths = [output_folder + name + '.npz' for name in names]
+
+    children = [[] for _ in files]
+    for idx, parent in enumerate(parents):
+        if parent >= 0:
+            children[parent].append(idx)
+
+    finished = [journal.is_finished(name) for name in names]
+
+    async def run_calculation(idx: int, guess_orb_file: str):
+        dir_path = prepare_fulvene_casscf_calculation(files[idx], guess_orb_file, output_folder, idx, basis)
+        log_file = await runner.run(dir_path)
+        wall_time = parse_log_file(log_file).wall_timing
+        return read_fulvene_casscf_calculation(dir_path, basis), dir_path, wall_time
+
+    async def run_tree() -> int:
+        tasks = {}
+        n_failed = 0
+
+        def submit(idx: int, guess_orb_file: str) -> None:
+            journal.record(names[idx], 'started', output_paths[idx], geometry_file=files[idx])
+            tasks[asyncio.ensure_future(run_calculation(idx, guess_orb_file))] = idx
+
+        # resume: start every unfinished geometry whose parent is the root or already finished
+        for idx, parent in enumerate(parents):
+            if finished[idx]:
+                continue
+            if parent < 0:
+                submit(idx, get_guess_orb_file(basis))
+            elif finished[parent]:
+                submit(idx, get_resume_guess_orb_file(journal, names[parent], output_folder, basis))
+
+        with tqdm(total=len(files), initial=sum(finished)) as progress_bar:
+            while tasks:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    idx = tasks.pop(task)
+                    try:
+                        calculation_result, dir_path, wall_time = task.result()
+                    except Exception as e:
+                        n_failed += 1
+                        journal.record(names[idx], 'failed', output_paths[idx], geometry_file=files[idx], error=repr(e))
+                        continue
+
+                    calculation_result.store_as_npz(output_paths[idx])
+                    journal.record(names[idx], 'finished', output_paths[idx], wall_time, calculation_result.imacro,
+                                   geometry_file=files[idx], calculation_path=dir_path)
+                    finished[idx] = True
+                    progress_bar.update(1)
+
+                    for child in children[idx]:
+                        if not finished[child]:
+                            submit(child, os.path.join(dir_path, 'CASSCF.RasOrb'))
+        return n_failed
+
+    n_failed = asyncio.run(run_tree())
+    if n_failed > 0:
+        print(f'{n_failed} calculations failed, their subtrees were skipped. Rerun to retry them.')
     print('Done')
 
 if __name__ == "__main__":
@@ -98,6 +222,15 @@ if __name__ == "__main__":
     parser.add_argument('--geometry_folder', type=str)
     parser.add_argument('--output_folder', type=str)
     parser.add_argument('--basis', type=str)
+    parser.add_argument('--parallel', dest='parallel', action='store_true')
+    parser.add_argument('--no-parallel', dest='parallel', action='store_false')
+    parser.add_argument('--n_workers', type=int, default=None)
+    parser.add_argument('--timeout', type=float, default=None, help='seconds after which an OpenMolcas run is killed')
+    parser.add_argument('--scratch_path', type=str, default=None, help='local disk / tmpfs to run on, defaults to $MOLCAS_SCRATCH or the temp dir')
+    parser.set_defaults(parallel=False)
     args = parser.parse_args()
 
-    run_casscf_calculations(base_dir + args.geometry_folder, base_dir + args.output_folder, args.basis)
\ No newline at end of file
+    if args.parallel:
+        run_casscf_calculations_parallel(base_dir + args.geometry_folder, base_dir + args.output_folder, args.basis, args.n_workers, args.timeout, args.scratch_path)
+    else:
+        run_casscf_calculations(base_dir + args.geometry_folder, base_dir + args.output_folder, args.basis, args.timeout, args.scratch_path)
\ No newline at end of file
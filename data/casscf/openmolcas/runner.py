@@ -0,0 +1,138 @@
+import asyncio
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Sequence, Union
+
+from data.casscf.openmolcas import MOLCAS_PATH
+
+# local disk or tmpfs the calculations run on, instead of the (network) output folder
+SCRATCH_PATH = os.environ.get('MOLCAS_SCRATCH', tempfile.gettempdir())
+
+# the only files of a calculation that are read afterwards
+RESULT_FILES = ('CASSCF.rasscf.h5', 'CASSCF.RasOrb', 'calc.log')
+
+
+class MolcasCalculationError(RuntimeError):
+    """ raised when an OpenMolcas run exits with a non-zero return code or times out """
+    def __init__(self, dir_path: str, message: str, returncode: Optional[int] = None, log_tail: str = '') -> None:
+        super().__init__(f'OpenMolcas calculation in {dir_path} {message}' + (f':\n{log_tail}' if log_tail else ''))
+        self.dir_path = dir_path
+        self.returncode = returncode
+        self.log_tail = log_tail
+
+
+def _read_log_tail(log_file: str, n_lines: int = 20) -> str:
+    if not os.path.exists(log_file):
+        return ''
+    with open(log_file, 'r', errors='replace') as f:
+        return ''.join(f.readlines()[-n_lines:])
+
+
+@contextmanager
+def scratch_directory(dir_path: str,
+                      scratch_path: Optional[str] = None,
+                      result_files: Sequence[str] = RESULT_FILES) -> Iterator[str]:
+    """
+    Copies the input files of the calculation in dir_path to a new directory under scratch_path and yields it.
+    Afterwards only result_files are copied back to dir_path, and the scratch directory is removed, also when
+    the calculation failed.
+    """
+    scratch_dir = tempfile.mkdtemp(prefix='molcas_', dir=scratch_path or SCRATCH_PATH)
+    try:
+        for file in os.listdir(dir_path):
+            if file not in result_files and os.path.isfile(os.path.join(dir_path, file)):
+                shutil.copy2(os.path.join(dir_path, file), scratch_dir)
+        yield scratch_dir
+    finally:
+        try:
+            for file in result_files:
+                if os.path.exists(os.path.join(scratch_dir, file)):
+                    shutil.copy2(os.path.join(scratch_dir, file), dir_path)
+        finally:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+
+async def run_molcas(dir_path: str,
+                     input_file: str = 'CASSCF.input',
+                     log_file: str = 'calc.log',
+                     timeout: Optional[float] = None,
+                     n_threads: Optional[int] = None,
+                     scratch_path: Optional[str] = None,
+                     result_files: Sequence[str] = RESULT_FILES) -> str:
+    """
+    Runs OpenMolcas on an input file in dir_path. The calculation runs in a scratch directory (see scratch_directory)
+    with its own WorkDir, the output is written to dir_path/log_file. Returns the path of the log file, raises
+    MolcasCalculationError when the run fails.
+    """
+    dir_path = os.path.abspath(dir_path)
+    if log_file not in result_files:
+        result_files = tuple(result_files) + (log_file,)
+
+    with scratch_directory(dir_path, scratch_path, result_files) as scratch_dir:
+        work_dir = os.path.join(scratch_dir, 'temp')
+        os.makedirs(work_dir)
+        log_path = os.path.join(scratch_dir, log_file)
+
+        env = dict(os.environ, WorkDir=work_dir)
+        if n_threads is not None:
+            env.update(OMP_NUM_THREADS=str(n_threads), MKL_NUM_THREADS=str(n_threads))
+
+        with open(log_path, 'w') as log:
+            process = await asyncio.create_subprocess_exec(MOLCAS_PATH, input_file, cwd=scratch_dir, env=env,
+                                                           stdout=log, stderr=asyncio.subprocess.STDOUT)
+            try:
+                returncode = await asyncio.wait_for(process.wait(), timeout)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                raise MolcasCalculationError(dir_path, f'timed out after {timeout} s', log_tail=_read_log_tail(log_path))
+            except asyncio.CancelledError:
+                process.kill()
+                await process.wait()
+                raise
+
+        if returncode != 0:
+            raise MolcasCalculationError(dir_path, f'failed with return code {returncode}', returncode, _read_log_tail(log_path))
+    return os.path.join(dir_path, log_file)
+
+
+def run_molcas_calculation(dir_path: str, **kwargs) -> str:
+    """ blocking run_molcas, for a single calculation """
+    return asyncio.run(run_molcas(dir_path, **kwargs))
+
+
+class MolcasRunner:
+    """
+    Runs OpenMolcas calculations concurrently on an asyncio event loop, at most max_concurrency at a time
+    with an equal share of the cores each. Calculations are prepared directories (see run_molcas).
+    """
+    def __init__(self,
+                 max_concurrency: Optional[int] = None,
+                 timeout: Optional[float] = None,
+                 scratch_path: Optional[str] = None) -> None:
+        if max_concurrency is None:
+            max_concurrency = os.cpu_count()
+        self.max_concurrency = max_concurrency
+        self.n_threads = max(1, os.cpu_count() // max_concurrency)
+        self.timeout = timeout
+        self.scratch_path = scratch_path
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def run(self, dir_path: str, **kwargs) -> str:
+        # created lazily so that it belongs to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        kwargs.setdefault('timeout', self.timeout)
+        kwargs.setdefault('n_threads', self.n_threads)
+        kwargs.setdefault('scratch_path', self.scratch_path)
+        async with self._semaphore:
+            return await run_molcas(dir_path, **kwargs)
+
+    def run_all(self, dir_paths: Sequence[str], **kwargs) -> List[Union[str, Exception]]:
+        """ runs all calculations, returning the log file or the raised error of every calculation in order """
+        async def run_all() -> List[Union[str, Exception]]:
+            self._semaphore = None
+            return await asyncio.gather(*[self.run(dir_path, **kwargs) for dir_path in dir_paths], return_exceptions=True)
+        return asyncio.run(run_all())
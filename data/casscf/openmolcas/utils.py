@@ -1,52 +1,74 @@
+from typing import Dict, List, Optional, Tuple
+import os
 import numpy as np
 
 
-def read_log_file(file, read_iterations=True):
-  n_iterations = None
-  rasscf_timing = None
-  wall_timing = None
-
-  with open(file, 'r') as f:
-    while True:
-      line = f.readline()
-
-      if read_iterations:
-        if "Convergence after" in line:
-          for el in line.split():
-            if el.isdigit():
-              n_iterations = int(el)
-              break
+class MolcasLogResult:
+  """
+  Quantities read from an OpenMolcas calc.log, None (or no root energies) for everything that is missing,
+  e.g. because the run did not converge or was killed
+  """
+  def __init__(self,
+               n_iterations: Optional[int] = None,
+               rasscf_timing: Optional[float] = None,
+               wall_timing: Optional[float] = None,
+               root_energies: Optional[Dict[int, float]] = None) -> None:
+    self.n_iterations = n_iterations
+    self.rasscf_timing = rasscf_timing
+    self.wall_timing = wall_timing
+    self.root_energies = root_energies if root_energies is not None else {}
+
+  @property
+  def converged(self) -> bool:
+    return self.n_iterations is not None
+
+
+def _first_number(tokens: List[str]) -> Optional[float]:
+  for token in tokens:
+    try:
+      return float(token)
+    except ValueError:
+      continue
+  return None
+
+
+def parse_log_file(file: str) -> MolcasLogResult:
+  """ reads calc.log in a single pass, later occurrences of a quantity overwrite earlier ones """
+  result = MolcasLogResult()
+
+  with open(file, 'r', errors='replace') as f:
+    for line in f:
+      if 'Convergence after' in line:
+        n_iterations = _first_number(line.split('after', 1)[1].split())
+        if n_iterations is not None:
+          result.n_iterations = int(n_iterations)
+      elif 'RASSCF root number' in line and 'Total energy' in line:
+        root = _first_number(line.split('number', 1)[1].split())
+        energy = _first_number(line.split('energy', 1)[1].replace(':', ' ').replace('=', ' ').split())
+        if root is not None and energy is not None:
+          result.root_energies[int(root)] = energy
+      elif '--- Module rasscf spent' in line:
+        result.rasscf_timing = _first_number(line.split('spent', 1)[1].split())
+      elif 'Timing: Wall' in line:
+        result.wall_timing = _first_number(line.split('Wall', 1)[1].replace('=', ' ').split())
+
+  return result
 
-      if "--- Module rasscf spent" in line:
-        for el in line.split():
-          if el.isdigit():
-            rasscf_timing = float(el)
-            break
 
-      if "Timing: Wall" in line:
-        wall_timing = float(line.replace("=", " ").split()[2])
-        break
-
-  return rasscf_timing, wall_timing, n_iterations
+def read_log_file(file, read_iterations=True):
+  result = parse_log_file(file)
+  n_iterations = result.n_iterations if read_iterations else None
+  return result.rasscf_timing, result.wall_timing, n_iterations
 
 def get_s1_energy(calc_log_file):
-  with open(calc_log_file, 'r') as f:
-    while True:
-      line = f.readline()
-
-      if 'RASSCF root number  1 Total energy' in line:
-        return float(line.replace('\n', '').split(' ')[-1])
+  return parse_log_file(calc_log_file).root_energies.get(1)
 
 def get_s2_energy(calc_log_file):
-  with open(calc_log_file, 'r') as f:
-    while True:
-      line = f.readline()
-
-      if 'RASSCF root number  2 Total energy' in line:
-        return float(line.replace('\n', '').split(' ')[-1])
+  return parse_log_file(calc_log_file).root_energies.get(2)
 
 
 def numpy_to_string(array: np.ndarray) -> str:
+  """ element-wise formatting of an orbital block, only kept as the reference for OrbFileTemplate.format """
   string = ''
 
   for idx, elem in enumerate(array):
@@ -64,34 +86,58 @@ def numpy_to_string(array: np.ndarray) -> str:
 
   return string
 
+class OrbFileTemplate:
+  """
+  Header (everything before the first orbital) and footer (from #OCC on) of an INPORB file, parsed once
+  and reused for every guess orbital file written from it
+  """
+  def __init__(self, header: str, footer: str) -> None:
+    self.header = header
+    self.footer = footer
+
+  @classmethod
+  def from_file(cls, file: str) -> 'OrbFileTemplate':
+    with open(file, 'r') as f:
+      text = f.read()
+    orbitals_start = text.index('* ORBITAL')
+    footer_start = text.find('#OCC', orbitals_start)
+    return cls(text[:orbitals_start], '' if footer_start < 0 else text[footer_start:])
+
+  def format(self, coeffs: np.ndarray, n: int) -> str:
+    # '%22.14E' gives the same columns as numpy_to_string, one %-format call per orbital
+    n_lines, n_rest = divmod(n, 5)
+    block_format = ('%22.14E' * 5 + '\n') * n_lines + ('%22.14E' * n_rest + '\n' if n_rest else '\n')
+    # + 0.0 turns -0.0 into 0.0, which keeps its field 22 wide (numpy_to_string writes '  -0.0...', one column more)
+    orbitals = (np.asarray(coeffs, dtype=np.float64).reshape(n, n) + 0.0).tolist()
+    blocks = [f'* ORBITAL \t 1 \t {i} \n' + block_format % tuple(orbital) for i, orbital in enumerate(orbitals, start=1)]
+    return self.header + ''.join(blocks) + self.footer
+
+  def write(self, coeffs: np.ndarray, output_file_path: str, n: int) -> None:
+    with open(output_file_path, 'w+') as f:
+      f.write(self.format(coeffs, n))
+
+
+_orb_file_templates: Dict[Tuple[str, float], OrbFileTemplate] = {}
+
+def get_orb_file_template(file: str) -> OrbFileTemplate:
+  key = (os.path.abspath(file), os.path.getmtime(file))
+  if key not in _orb_file_templates:
+    _orb_file_templates[key] = OrbFileTemplate.from_file(file)
+  return _orb_file_templates[key]
+
+
 def write_coeffs_to_orb_file(coeffs: np.ndarray, input_file_path: str, output_file_path: str, n: int) -> None:
-  lines = []
-
-  with open(input_file_path, 'r') as f:
-    # add initial lines
-    while True:
-      line = f.readline()
-      if '* ORBITAL' not in line:
-        lines.append(line)
-      else:
-        break
-
-    # add orbitals
-    for i in range(1, n+1):
-      lines.append(f'* ORBITAL \t 1 \t {i} \n')
-      lines.append(numpy_to_string(coeffs[(i-1)*n:i*n]))
-
-    append = False
-    while True:
-      line = f.readline()
-      if '#OCC' in line:
-        append = True
-
-      if append:
-        lines.append(line)
-
-      if line == '':
-        break
-      
-  with open(output_file_path, 'w+') as f:
-    f.writelines(lines)
+  get_orb_file_template(input_file_path).write(coeffs, output_file_path, n)
+
+
+def read_orb_file(file: str) -> np.ndarray:
+  """ reads the MO coefficients of an INPORB file (e.g. CASSCF.RasOrb), one orbital per row """
+  with open(file, 'r') as f:
+    text = f.read()
+  start = text.index('#ORB')
+  end = text.find('\n#', start)
+  lines = text[start:end if end >= 0 else len(text)].splitlines()[1:]
+
+  n_orbitals = sum(1 for line in lines if line.startswith('*'))
+  coeffs = np.array(' '.join(line for line in lines if not line.startswith('*')).split(), dtype=np.float64)
+  return coeffs.reshape(n_orbitals, -1)
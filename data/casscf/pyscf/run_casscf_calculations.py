@@ -1,13 +1,15 @@
 
 import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from typing import List, Optional, Tuple
 import argparse
 import numpy as np
-from pyscf import gto, mcscf
+from pyscf import gto, lib, mcscf
 from tqdm import tqdm
 
 from data.casscf import EQUILIBRIUM_GEOMETRY_PATH
-from data.utils import CasscfResult, check_and_create_folder, find_all_geometry_files_in_folder, sort_geometry_files_by_distance
+from data.utils import CampaignJournal, CasscfResult, build_geometry_tree, check_and_create_folder, find_all_geometry_files_in_folder, sort_geometry_files_by_distance
 
 
 def run_fulvene_casscf_calculation(geometry_xyz_file_path: str, 
@@ -48,6 +50,14 @@ def run_fulvene_casscf_calculation(geometry_xyz_file_path: str,
   ), mo_coeffs
 
 
+def run_timed_fulvene_casscf_calculation(geometry_xyz_file_path: str, 
+                                         basis: str = 'sto_6g',
+                                         guess_mos: Optional[np.ndarray] = None) -> Tuple[CasscfResult, np.ndarray, float]:
+  tic = time.perf_counter()
+  calculation_result, mo_coeffs = run_fulvene_casscf_calculation(geometry_xyz_file_path, basis, guess_mos)
+  return calculation_result, mo_coeffs, time.perf_counter() - tic
+
+
 def run_casscf_calculations(geometry_folder: str, 
                             output_folder: str,
                             basis: str) -> None:
@@ -55,20 +65,114 @@ def run_casscf_calculations(geometry_folder: str,
   check_and_create_folder(geometry_folder)
   check_and_create_folder(output_folder)
 
+  journal = CampaignJournal(output_folder)
   guess_mos = None
+  resume_name = None
 
   files = find_all_geometry_files_in_folder(geometry_folder)    
   files, _ = sort_geometry_files_by_distance(files, EQUILIBRIUM_GEOMETRY_PATH)   
       
   for file in tqdm(files, total=len(files)):
     calculation_name = file.split('/')[-1].split('.')[0]
-    calculation_result, mo_coeffs = run_fulvene_casscf_calculation(file, basis, guess_mos)
+    output_path = output_folder + calculation_name + '.npz'
+
+    if journal.is_finished(calculation_name):
+      resume_name = calculation_name
+      continue
+    if resume_name is not None:
+      guess_mos = journal.load_result(resume_name).mo_coeffs
+      resume_name = None
+
+    journal.record(calculation_name, 'started', output_path, geometry_file=file)
+    try:
+      calculation_result, mo_coeffs, wall_time = run_timed_fulvene_casscf_calculation(file, basis, guess_mos)
+    except Exception as e:
+      journal.record(calculation_name, 'failed', output_path, geometry_file=file, error=repr(e))
+      raise
     guess_mos = mo_coeffs
-    calculation_result.store_as_npz(output_folder + calculation_name + '.npz')
+    calculation_result.store_as_npz(output_path)
+    journal.record(calculation_name, 'finished', output_path, wall_time, calculation_result.imacro, geometry_file=file)
   
   print('Done')
 
 
+def _init_worker(n_threads: int) -> None:
+  lib.num_threads(n_threads)
+
+
+def run_casscf_calculations_parallel(geometry_folder: str, 
+                                     output_folder: str,
+                                     basis: str,
+                                     n_workers: Optional[int] = None) -> None:
+  """
+  Runs the calculations on a nearest-neighbour tree of the geometries instead of a single chain.
+  A geometry is submitted to the process pool as soon as its parent geometry has converged and
+  uses the parent's orbitals as guess, so independent branches of the tree run concurrently.
+  """
+  check_and_create_folder(geometry_folder)
+  check_and_create_folder(output_folder)
+
+  if n_workers is None:
+    n_workers = os.cpu_count()
+  n_threads = max(1, os.cpu_count() // n_workers)
+
+  journal = CampaignJournal(output_folder)
+
+  files = find_all_geometry_files_in_folder(geometry_folder)
+  files, parents = build_geometry_tree(files, EQUILIBRIUM_GEOMETRY_PATH)
+  names = [file.split('/')[-1].split('.')[0] for file in files]
+  output_paths = [output_folder + name + '.npz' for name in names]
+
+  children = [[] for _ in files]
+  for idx, parent in enumerate(parents):
+    if parent >= 0:
+      children[parent].append(idx)
+
+  finished = [journal.is_finished(name) for name in names]
+  n_failed = 0
+
+  with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(n_threads,)) as executor, \
+       tqdm(total=len(files), initial=sum(finished)) as progress_bar:
+    futures = {}
+
+    def submit(idx: int, guess_mos: Optional[np.ndarray]) -> None:
+      journal.record(names[idx], 'started', output_paths[idx], geometry_file=files[idx])
+      futures[executor.submit(run_timed_fulvene_casscf_calculation, files[idx], basis, guess_mos)] = idx
+
+    # resume: start every unfinished geometry whose parent is the root or already finished
+    for idx, parent in enumerate(parents):
+      if finished[idx]:
+        continue
+      if parent < 0:
+        submit(idx, None)
+      elif finished[parent]:
+        submit(idx, journal.load_result(names[parent]).mo_coeffs)
+
+    while futures:
+      done, _ = wait(futures, return_when=FIRST_COMPLETED)
+      for future in done:
+        idx = futures.pop(future)
+        try:
+          calculation_result, mo_coeffs, wall_time = future.result()
+        except Exception as e:
+          n_failed += 1
+          journal.record(names[idx], 'failed', output_paths[idx], geometry_file=files[idx], error=repr(e))
+          continue
+
+        calculation_result.store_as_npz(output_paths[idx])
+        journal.record(names[idx], 'finished', output_paths[idx], wall_time, calculation_result.imacro, geometry_file=files[idx])
+        finished[idx] = True
+        progress_bar.update(1)
+
+        for child in children[idx]:
+          if not finished[child]:
+            submit(child, mo_coeffs)
+
+  if n_failed > 0:
+    print(f'{n_failed} calculations failed, their subtrees were skipped. Rerun to retry them.')
+  print('Done')
+
+
 if __name__ == "__main__":
   base_dir = os.environ['base_dir']
 
@@ -76,6 +180,13 @@ if __name__ == "__main__":
   parser.add_argument('--geometry_folder', type=str)
   parser.add_argument('--output_folder', type=str)
   parser.add_argument('--basis', type=str)
+  parser.add_argument('--parallel', dest='parallel', action='store_true')
+  parser.add_argument('--no-parallel', dest='parallel', action='store_false')
+  parser.add_argument('--n_workers', type=int, default=None)
+  parser.set_defaults(parallel=False)
   args = parser.parse_args()
 
-  run_casscf_calculations(base_dir + args.geometry_folder, base_dir + args.output_folder, args.basis)
\ No newline at end of file
+  if args.parallel:
+    run_casscf_calculations_parallel(base_dir + args.geometry_folder, base_dir + args.output_folder, args.basis, args.n_workers)
+  else:
+    run_casscf_calculations(base_dir + args.geometry_folder, base_dir + args.output_folder, args.basis)
\ No newline at end of file
@@ -0,0 +1,78 @@
+import os
+import json
+import argparse
+import numpy as np
+from ase.db import connect
+from numpy.lib.format import open_memmap
+from tqdm import tqdm
+from typing import List, Optional
+
+"""
+
+Converts an ASE training database into the packed dataset format read by model/packed_dataset.py.
+A packed dataset is a folder with one contiguous .npy array per quantity, concatenated over all
+structures, which can be opened with np.load(..., mmap_mode='r'):
+  - index.json:       number of structures & atoms, property names and per-structure shapes
+  - atom_offsets.npy: (N + 1,) start of every structure in the per-atom arrays
+  - Z.npy, R.npy:     atomic numbers (n_atoms_total,) and float32 positions (n_atoms_total, 3)
+  - cell.npy, pbc.npy: (N, 3, 3) float32 cells and (N, 3) periodic boundary flags
+  - {property}.npy:   (N, ...) float32 arrays of the molecular properties (F, S, mo_coeffs, ...)
+
+"""
+
+def pack_ase_db(db_path: str, packed_path: str, properties: Optional[List[str]] = None) -> None:
+  with connect(db_path, use_lock_file=False) as conn:
+    n_structures = conn.count()
+    metadata = conn.metadata
+    first_row = conn.get(1)
+    if properties is None:
+      properties = list(first_row.data.keys())
+
+    if not os.path.exists(packed_path):
+      os.makedirs(packed_path)
+
+    property_arrays = {
+      name: open_memmap(os.path.join(packed_path, f'{name}.npy'), mode='w+', dtype=np.float32,
+                        shape=(n_structures, *np.shape(first_row.data[name])))
+      for name in properties
+    }
+    cell = open_memmap(os.path.join(packed_path, 'cell.npy'), mode='w+', dtype=np.float32, shape=(n_structures, 3, 3))
+    pbc = open_memmap(os.path.join(packed_path, 'pbc.npy'), mode='w+', dtype=bool, shape=(n_structures, 3))
+    numbers, positions = [], []
+    atom_offsets = np.zeros(n_structures + 1, dtype=np.int64)
+
+    for idx, row in enumerate(tqdm(conn.select(sort='id'), total=n_structures, desc='packing ase db')):
+      for name in properties:
+        property_arrays[name][idx] = row.data[name]
+      cell[idx] = row.cell
+      pbc[idx] = row.pbc
+      numbers.append(row.numbers)
+      positions.append(row.positions)
+      atom_offsets[idx + 1] = atom_offsets[idx] + len(row.numbers)
+
+  np.save(os.path.join(packed_path, 'Z.npy'), np.concatenate(numbers).astype(np.int64))
+  np.save(os.path.join(packed_path, 'R.npy'), np.concatenate(positions).astype(np.float32))
+  np.save(os.path.join(packed_path, 'atom_offsets.npy'), atom_offsets)
+  for array in [*property_arrays.values(), cell, pbc]:
+    array.flush()
+
+  with open(os.path.join(packed_path, 'index.json'), 'w') as f:
+    json.dump({
+      'n_structures': n_structures,
+      'n_atoms_total': int(atom_offsets[-1]),
+      'properties': {name: list(array.shape[1:]) for name, array in property_arrays.items()},
+      'distance_unit': metadata.get('_distance_unit', 'angstrom'),
+      'property_unit_dict': {name: metadata.get('_property_unit_dict', {}).get(name, 1.0) for name in properties},
+    }, f)
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--db_name', type=str)
+  parser.add_argument('--properties', type=str, nargs='*', default=None)
+  args = parser.parse_args()
+
+  db_path = './data_storage/' + args.db_name
+  packed_path = db_path.replace('.db', '.packed')
+
+  pack_ase_db(db_path, packed_path, args.properties)
@@ -1,11 +1,10 @@
 import os
 import argparse
 import numpy as np
-from ase.db import connect
 from typing import List, Tuple
 
 from data.casscf import EQUILIBRIUM_GEOMETRY_PATH
-from data.db.utils import xyz_to_db
+from data.db.utils import atoms_to_db, xyz_files_to_atoms
 from data.utils import find_all_files_in_output_folder, find_all_geometry_files_in_folder, sort_geometry_files_by_distance, sort_geometry_files_by_idx
 
 def phase_correct_orbitals(ref, target):
@@ -42,35 +41,30 @@ def save_casscf_calculations_to_db(geometry_folder: str, output_folder: str, db_
                                                                                      target=casscf_results[distance_idxs[idx]].mo_coeffs)
 
   # save geometry files & calculated properties
-  for idx, geometry_file in enumerate(geometry_files):
-    xyz_to_db(geometry_file,
+  atoms_to_db(xyz_files_to_atoms(geometry_files),
               db_path,
-              idx,
-              atomic_properties="",
-              molecular_properties=[{'mo_coeffs': casscf_results[idx].mo_coeffs.flatten(), 
-                                     'mo_coeffs_adjusted': casscf_results[idx].mo_coeffs_adjusted.flatten(), 
-                                     'mo_energies': casscf_results[idx].mo_energies,
-                                     'F': casscf_results[idx].F.flatten(),
-                                     'S': casscf_results[idx].S.flatten(),
-                                     }])
-
-  with connect(db_path) as conn:
-    conn.metadata = {"_distance_unit": 'angstrom',
-                     "_property_unit_dict": {
-                      "mo_coeffs": 1.0, 
-                      "mo_coeffs_adjusted": 1.0, 
-                      'mo_energies': 1.0,
-                      "F": 1.0, 
-                      "S": 1.0,
-                    },
-                     "atomrefs": {
-                      'mo_coeffs': [0.0 for _ in range(36)],
-                      "mo_coeffs_adjusted": [0.0 for _ in range(36)],
-                      'mo_energies': [0.0 for _ in range(36)],
-                      'F': [0.0 for _ in range(36)],
-                      'S': [0.0 for _ in range(36)],
-                      }
-                    }
+              molecular_properties=[{'mo_coeffs': result.mo_coeffs.flatten(), 
+                                     'mo_coeffs_adjusted': result.mo_coeffs_adjusted.flatten(), 
+                                     'mo_energies': result.mo_energies,
+                                     'F': result.F.flatten(),
+                                     'S': result.S.flatten(),
+                                     } for result in casscf_results],
+              metadata={"_distance_unit": 'angstrom',
+                        "_property_unit_dict": {
+                          "mo_coeffs": 1.0, 
+                          "mo_coeffs_adjusted": 1.0, 
+                          'mo_energies': 1.0,
+                          "F": 1.0, 
+                          "S": 1.0,
+                        },
+                        "atomrefs": {
+                          'mo_coeffs': [0.0 for _ in range(36)],
+                          "mo_coeffs_adjusted": [0.0 for _ in range(36)],
+                          'mo_energies': [0.0 for _ in range(36)],
+                          'F': [0.0 for _ in range(36)],
+                          'S': [0.0 for _ in range(36)],
+                        }
+                      })
 
 if __name__ == "__main__":
   base_dir = os.environ['base_dir']
@@ -1,5 +1,6 @@
 import os
-from typing import List
+from typing import Dict, List, Optional
+from ase import Atoms
 from ase.db import connect
 from ase.io.extxyz import read_xyz
 from tqdm import tqdm
@@ -8,6 +9,8 @@ import numpy as np
 import re
 import h5py
 
+from data.utils import get_pos_matrix, read_xyz_file
+
 def parse_property_string(prop_str):
     """
     Generate valid property string for extended xyz files.
@@ -92,4 +95,41 @@ def xyz_to_db(
     extxyz_path = os.path.join(tempfile.mkdtemp(), "temp.extxyz")
     xyz_to_extxyz(xyz_path, extxyz_path, atomic_properties)
     # build database from extended xyz
-    extxyz_to_db(extxyz_path, db_path, idx, molecular_properties)
\ No newline at end of file
+    extxyz_to_db(extxyz_path, db_path, idx, molecular_properties)
+
+
+def xyz_files_to_atoms(xyz_paths: List[str]) -> List[Atoms]:
+    """
+    Builds ase Atoms objects directly from xyz-files, without the extxyz round trip.
+    Args:
+        xyz_paths (list): paths to the xyz files
+    """
+    atoms_list = []
+    for xyz_path in xyz_paths:
+        geometry = read_xyz_file(xyz_path)
+        atoms_list.append(Atoms(symbols=[atom.type for atom in geometry], positions=get_pos_matrix(geometry)))
+    return atoms_list
+
+
+def atoms_to_db(atoms_list: List[Atoms], 
+                db_path: str, 
+                molecular_properties: List[Dict[str, np.ndarray]],
+                metadata: Optional[dict] = None):
+    """
+    Writes a list of ase Atoms objects to an ase database using a single connection and transaction.
+    Rows get the same idx key as written by xyz_to_db.
+    Args:
+        atoms_list (list): ase Atoms objects
+        db_path(str): path to sqlite database
+        molecular_properties (list): dict of molecular properties for every Atoms object
+        metadata (dict): database metadata, written in the same transaction
+    """
+    assert len(atoms_list) == len(molecular_properties)
+
+    with connect(db_path, use_lock_file=False) as conn:
+        for idx, (atoms, properties) in enumerate(tqdm(zip(atoms_list, molecular_properties), 
+                                                       total=len(atoms_list), desc="creating ase db")):
+            conn.write(atoms, data=properties, idx=idx)
+
+        if metadata is not None:
+            conn.metadata = metadata
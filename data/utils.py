@@ -1,4 +1,6 @@
-from typing import List
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import json
 import numpy as np
 import os
 from tqdm import tqdm
@@ -51,6 +53,58 @@ class CasscfResult:
                data['S'], data['F'], data['imacro'], index)
 
 
+class CampaignJournal:
+  """
+  Append-only JSON-lines journal of a CASSCF campaign, kept in the output folder so that
+  an interrupted campaign can be resumed. The last record written for a calculation wins.
+  """
+  def __init__(self, output_folder: str, file_name: str = 'campaign.jsonl') -> None:
+    self.path = os.path.join(output_folder, file_name)
+    self.records: Dict[str, dict] = {}
+    self._terminate_last_line = False
+
+    if os.path.exists(self.path):
+      with open(self.path, 'r') as f:
+        for line in f:
+          self._terminate_last_line = not line.endswith('\n')
+          try:
+            record = json.loads(line)
+          except json.JSONDecodeError:
+            # line was cut off when the previous job died
+            continue
+          self.records[record['name']] = record
+
+  def record(self, 
+             name: str, 
+             status: str, 
+             output_path: str, 
+             wall_time: Optional[float] = None, 
+             imacro: Optional[int] = None,
+             **kwargs) -> None:
+    record = {'name': name, 
+              'status': status, 
+              'output_path': output_path, 
+              'wall_time': None if wall_time is None else float(wall_time), 
+              'imacro': None if imacro is None else int(imacro)}
+    record.update(kwargs)
+    self.records[name] = record
+
+    with open(self.path, 'a') as f:
+      if self._terminate_last_line:
+        f.write('\n')
+        self._terminate_last_line = False
+      f.write(json.dumps(record) + '\n')
+      f.flush()
+      os.fsync(f.fileno())
+
+  def is_finished(self, name: str) -> bool:
+    record = self.records.get(name)
+    return record is not None and record['status'] == 'finished' and os.path.exists(record['output_path'])
+
+  def load_result(self, name: str) -> CasscfResult:
+    return CasscfResult.load_from_npz(self.records[name]['output_path'])
+
+
 def find_all_geometry_files_in_folder(geometry_folder: str) -> List[str]:
   geometry_files = []
   for _, _, files in os.walk(geometry_folder):
@@ -71,24 +125,90 @@ def sort_geometry_files_by_idx(geometry_files: List[str]) -> List[str]:
 def get_pos_matrix(geom):
   return np.array([[atom.x, atom.y, atom.z] for atom in geom])
 
-def sort_geometry_files_by_distance(geometry_files: List[str], start_geometry_file: str) -> List[str]:
-  start_geometry = read_xyz_file(start_geometry_file)
-  geometries = [read_xyz_file(file) for file in geometry_files]
-  pos_matrices = [get_pos_matrix(geometry) for geometry in geometries]
-  indices = np.arange(len(geometry_files)).tolist()
+def read_xyz_positions(geometry_files: List[str]) -> np.ndarray:
+  """
+  Reads the positions of a set of geometries with equal atom counts into a single (N, n_atoms, 3) array
+  """
+  if len(geometry_files) == 0:
+    return np.empty((0, 0, 3))
+  positions = []
+  for file in geometry_files:
+    with open(file) as f:
+      n_atoms = int(f.readline())
+      _ = f.readline()
+      lines = [f.readline() for _ in range(n_atoms)]
+    positions.append(np.array(' '.join(lines).split()).reshape(n_atoms, 4)[:, 1:].astype(np.float64))
+  return np.stack(positions)
+
+
+def sort_geometry_files_by_distance(geometry_files: List[str], start_geometry_file: str) -> Tuple[List[str], List[int]]:
+  """
+  Orders the geometries in a greedy nearest-neighbour chain starting from the start geometry,
+  using the Frobenius norm between position matrices as distance. Every step is a single
+  matrix-vector product over the flattened geometries (|x - c|^2 = |x|^2 - 2 x.c + |c|^2),
+  positions are taken relative to the start geometry to keep the expansion well conditioned.
+  Visited geometries get an infinite norm and are compacted away once half of them are visited.
+  """
+  n = len(geometry_files)
+  if n == 0:
+    return [], []
+  start_geometry = read_xyz_positions([start_geometry_file]).reshape(-1)
+  pos_matrices = read_xyz_positions(geometry_files).reshape(n, -1) - start_geometry
+  squared_norms = np.einsum('ij,ij->i', pos_matrices, pos_matrices)
+  remaining_idxs = np.arange(n)
+  n_remaining = n
+
   selected_idxs = []
-  sorted_geometry_files = []
+  current_geometry = np.zeros_like(start_geometry)
+  for _ in tqdm(range(n), total=n):
+    distances = squared_norms - 2 * (pos_matrices @ current_geometry)
+    idx = int(np.argmin(distances))
+    selected_idxs.append(int(remaining_idxs[idx]))
+    current_geometry = pos_matrices[idx]
+    squared_norms[idx] = np.inf
+    n_remaining -= 1
+
+    if n_remaining < len(remaining_idxs) // 2:
+      mask = np.isfinite(squared_norms)
+      pos_matrices, squared_norms, remaining_idxs = pos_matrices[mask], squared_norms[mask], remaining_idxs[mask]
 
-  current_geometry = get_pos_matrix(start_geometry)
-  for _ in tqdm(range(len(geometry_files)), total=len(geometry_files)):
-    distances = [np.sum(np.linalg.norm(pos_matrices[idx] - current_geometry)) for idx in indices]
-    selected_idx = indices[np.argmin(distances)]
-    indices.remove(selected_idx)
+  return [geometry_files[idx] for idx in selected_idxs], selected_idxs
+
+
+def build_geometry_tree(geometry_files: List[str], start_geometry_file: str) -> Tuple[List[str], List[int]]:
+  """
+  Builds a nearest-neighbour tree over the geometries. The geometry closest to the start geometry
+  becomes the root, after which geometries are added one by one (Prim's algorithm), each one being
+  attached to the closest geometry already in the tree. Returns the geometry files in the order
+  they were added together with the index (in that order) of each geometry's parent, -1 for the root.
+  """
+  n = len(geometry_files)
+  if n == 0:
+    return [], []
+  start_geometry = read_xyz_positions([start_geometry_file]).reshape(-1)
+  pos_matrices = read_xyz_positions(geometry_files).reshape(n, -1)
+
+  in_tree = np.zeros(n, dtype=bool)
+  closest_distances = np.linalg.norm(pos_matrices - start_geometry, axis=-1)
+  closest_nodes = np.full(n, -1)
+
+  selected_idxs = []
+  parents = []
+  for _ in tqdm(range(n), total=n):
+    selected_idx = int(np.argmin(np.where(in_tree, np.inf, closest_distances)))
+    in_tree[selected_idx] = True
+    parents.append(closest_nodes[selected_idx])
     selected_idxs.append(selected_idx)
-    current_geometry = get_pos_matrix(geometries[selected_idx])
-    sorted_geometry_files.append(geometry_files[selected_idx])
 
-  return sorted_geometry_files, selected_idxs
+    # the start geometry is only used to pick the root, afterwards nodes attach to each other
+    if len(selected_idxs) == 1:
+      closest_distances[:] = np.inf
+    distances = np.linalg.norm(pos_matrices - pos_matrices[selected_idx], axis=-1)
+    closer = distances < closest_distances
+    closest_distances[closer] = distances[closer]
+    closest_nodes[closer] = len(selected_idxs) - 1
+
+  return [geometry_files[idx] for idx in selected_idxs], [int(parent) for parent in parents]
 
 
 def find_all_files_in_output_folder(output_folder: str) -> List[CasscfResult]:
@@ -154,4 +274,19 @@ def read_xyz_file(filename):
       data = list(filter(lambda a: a != '', data))
       atoms.append(Atom(data[0], float(data[1]), float(data[2]), float(data[3])))
 
-  return atoms
\ No newline at end of file
+  return atoms
+
+def hash_geometry(atom_types: List[str], positions: np.ndarray) -> str:
+  """
+  Hash of the atom types and positions of a geometry, rounded to the 5 decimals written to xyz files,
+  so the same geometry hashes the same whether it is read from an xyz file or an ASE database.
+  """
+  positions = np.round(np.asarray(positions, dtype=np.float64), 5) + 0.0 # + 0.0 turns -0.0 into 0.0
+  sha = hashlib.sha1(''.join(atom_types).encode())
+  sha.update(np.ascontiguousarray(positions).tobytes())
+  return sha.hexdigest()
+
+
+def get_geometry_hash(geometry_file: str) -> str:
+  geometry = read_xyz_file(geometry_file)
+  return hash_geometry([atom.type for atom in geometry], get_pos_matrix(geometry))
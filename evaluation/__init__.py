@@ -1,4 +1,6 @@
+from collections import OrderedDict
 from typing import Tuple, Optional, Any
+from data.utils import CasscfResult, get_geometry_hash
 from model.inference import infer_orbitals_from_F_model, infer_orbitals_from_mo_model, infer_orbitals_from_phisnet_model
 from pyscf import gto, scf, mcscf
 import numpy as np
@@ -8,62 +10,100 @@ basis_dict = {
   'sto_6g': 36,
 }
 
+class MoleculeContext:
+  """
+  PySCF objects of one geometry in one basis: the built Mole, its overlap S, core Hamiltonian and an RHF
+  object that returns those precomputed integrals. Shared by all guess and energy routines of a geometry.
+  """
+  def __init__(self, geometry_path: str, basis: str) -> None:
+    self.molecule = gto.M(atom=geometry_path,
+                          basis=basis,
+                          spin=0,
+                          symmetry=True)
+    self.molecule.verbose = 0
+
+    self.hartree_fock = self.molecule.RHF()
+    self.S = self.hartree_fock.get_ovlp(self.molecule)
+    self.hcore = self.hartree_fock.get_hcore(self.molecule)
+    # CASSCF / CASCI objects built on this RHF ask it for the integrals again on every call
+    self.hartree_fock.get_ovlp = lambda *args: self.S
+    self.hartree_fock.get_hcore = lambda *args: self.hcore
+
+  def run_hartree_fock(self) -> scf.hf.RHF:
+    """ Converged RHF of the geometry, only computed on first request """
+    if self.hartree_fock.mo_coeff is None:
+      self.hartree_fock.kernel()
+      self.release_eri()
+    return self.hartree_fock
+
+  def get_guess_fock(self, guess_dm: np.ndarray) -> np.ndarray:
+    F = self.hartree_fock.get_fock(h1e=self.hcore, s1e=self.S, dm=guess_dm)
+    self.release_eri()
+    return F
+
+  def release_eri(self) -> None:
+    """ Drops the in-core two-electron integrals the RHF object keeps after a Fock build (~170 MB in cc-pVDZ) """
+    self.hartree_fock._eri = None
+
+
+MOLECULE_CONTEXT_CACHE_SIZE = 64
+_molecule_contexts: "OrderedDict[Tuple[str, str], MoleculeContext]" = OrderedDict()
+
+def get_molecule_context(geometry_path: str, basis: str) -> MoleculeContext:
+  """ MoleculeContext memoized by geometry hash and basis, least recently used contexts are dropped """
+  key = (get_geometry_hash(geometry_path), basis)
+  if key in _molecule_contexts:
+    _molecule_contexts.move_to_end(key)
+  else:
+    _molecule_contexts[key] = MoleculeContext(geometry_path, basis)
+    while len(_molecule_contexts) > MOLECULE_CONTEXT_CACHE_SIZE:
+      _molecule_contexts.popitem(last=False)
+  return _molecule_contexts[key]
+
+
+def clear_molecule_contexts() -> None:
+  _molecule_contexts.clear()
+
+
 def compute_ao_min_orbitals(model_path: str,
                             geometry_path: str,
                             basis: str) -> Tuple[np.ndarray, np.ndarray]:
-  molecule = gto.M(atom=geometry_path,
-                   basis=basis,
-                   spin=0,
-                   symmetry=True)
-  myscf = molecule.RHF()
-  guess_dm = scf.hf.init_guess_by_minao(molecule)
-  S = myscf.get_ovlp(molecule)
-  F = myscf.get_fock(dm=guess_dm)
-  mo_e, mo = scipy.linalg.eigh(F, S)
+  context = get_molecule_context(geometry_path, basis)
+  guess_dm = scf.hf.init_guess_by_minao(context.molecule)
+  F = context.get_guess_fock(guess_dm)
+  mo_e, mo = scipy.linalg.eigh(F, context.S)
   return mo_e, mo
   
 def compute_huckel_orbitals(model_path: str,
                             geometry_path: str,
                             basis: str) -> Tuple[np.ndarray, np.ndarray]:
-  molecule = gto.M(atom=geometry_path,
-                   basis=basis,
-                   spin=0,
-                   symmetry=True)
-  myscf = molecule.RHF()
-  guess_dm = scf.hf.init_guess_by_huckel(molecule)
-  S = myscf.get_ovlp(molecule)
-  F = myscf.get_fock(dm=guess_dm)
-  mo_e, mo = scipy.linalg.eigh(F, S)
+  context = get_molecule_context(geometry_path, basis)
+  guess_dm = scf.hf.init_guess_by_huckel(context.molecule)
+  F = context.get_guess_fock(guess_dm)
+  mo_e, mo = scipy.linalg.eigh(F, context.S)
   return mo_e, mo
 
 def compute_hf_orbitals(model_path: str,
                         geometry_path: str,
                         basis: str) -> Tuple[np.ndarray, np.ndarray]:
-  molecule = gto.M(atom=geometry_path,
-                   basis=basis,
-                   spin=0,
-                   symmetry=True)
-  hartree_fock = molecule.RHF()
-  hartree_fock.kernel()
+  hartree_fock = get_molecule_context(geometry_path, basis).run_hartree_fock()
   return hartree_fock.mo_energy, hartree_fock.mo_coeff
 
 def compute_mo_model_orbitals(model_path: str,
                               geometry_path: str,
                               basis: str):
   basis_set_size = basis_dict[basis]
-  return infer_orbitals_from_mo_model(model_path, 
-                                      geometry_path,
-                                      basis,
-                                      basis_set_size)
+  mo = infer_orbitals_from_mo_model(model_path, geometry_path, basis_set_size)
+  return np.zeros(len(mo)), mo
 
 def compute_F_model_orbitals(model_path: str,
-                              geometry_path: str,
-                              basis: str):
+                             geometry_path: str,
+                             basis: str):
   basis_set_size = basis_dict[basis]
-  return infer_orbitals_from_F_model(model_path, 
-                                      geometry_path,
-                                      basis,
-                                      basis_set_size)
+  F = infer_orbitals_from_F_model(model_path, geometry_path, basis_set_size)
+  S = get_molecule_context(geometry_path, basis).S
+  mo_e, mo = scipy.linalg.eigh(F, S)
+  return mo_e, mo
 
 def compute_phisnet_model_orbitals(model_path: str,
                                    geometry_path: str,
@@ -82,37 +122,30 @@ initial_guess_dict = {
 
 N_STATES = 3
 
-def run_casscf_calculation(geometry_file: str,
-                           guess_orbitals: np.ndarray,
-                           basis='sto-6g'):
-  molecule = gto.M(atom=geometry_file,
-                   basis=basis,
-                   spin=0,
-                   symmetry=True)
-  molecule.verbose = 0
-
-  hartree_fock = molecule.RHF()
+def get_casscf_object(geometry_file: str,
+                      basis='sto-6g') -> mcscf.mc1step.CASSCF:
+  """ State-averaged CAS(6,6) object of the geometry, ready for kernel(guess_orbitals) """
+  hartree_fock = get_molecule_context(geometry_file, basis).hartree_fock
   n_states = N_STATES
   weights = np.ones(n_states) / n_states
   casscf = hartree_fock.CASSCF(ncas=6, nelecas=6).state_average(weights)
   casscf.conv_tol = 1e-8
+  return casscf
 
+def run_casscf_calculation(geometry_file: str,
+                           guess_orbitals: np.ndarray,
+                           basis='sto-6g'):
+  casscf = get_casscf_object(geometry_file, basis)
   conv, e_tot, imacro, imicro, iinner, _, _, _, _ = casscf.kernel(guess_orbitals)
+  get_molecule_context(geometry_file, basis).release_eri()
   return conv, e_tot, imacro, imicro, iinner
 
 
-def compute_converged_casscf_orbitals(model_path: str,
-                                      geometry_path: str,
-                                      basis: str):
-  molecule = gto.M(atom=geometry_path,
-                   basis=basis,
-                   spin=0,
-                   symmetry=True)
-  molecule.verbose = 0
-
-  hartree_fock = molecule.RHF()
-  hartree_fock.kernel()
-  S = hartree_fock.get_ovlp(molecule)
+def compute_reference_casscf_result(geometry_path: str,
+                                    basis: str) -> CasscfResult:
+  """ Converged SA-CASSCF starting from the projected RHF orbitals, the reference for all guess methods """
+  context = get_molecule_context(geometry_path, basis)
+  hartree_fock = context.run_hartree_fock()
 
   n_states = N_STATES
   weights = np.ones(n_states) / n_states
@@ -122,49 +155,41 @@ def compute_converged_casscf_orbitals(model_path: str,
   mo = mcscf.project_init_guess(casscf, hartree_fock.mo_coeff)
   mo = casscf.sort_mo([19, 20, 21, 22, 23, 24], mo)
 
-  _, _, _, _, _, _, _, mo_coeffs, mo_energies = casscf.kernel(mo)
-  return mo_energies, mo_coeffs
+  conv, e_tot, imacro, _, _, _, _, mo_coeffs, mo_energies = casscf.kernel(mo)
+  F = casscf.get_fock()
+  context.release_eri()
+  return CasscfResult(converged=conv,
+                      basis=basis,
+                      e_tot=e_tot,
+                      mo_energies=mo_energies,
+                      mo_coeffs=mo_coeffs,
+                      S=context.S,
+                      F=F,
+                      imacro=imacro)
+
+
+def compute_converged_casscf_orbitals(model_path: str,
+                                      geometry_path: str,
+                                      basis: str):
+  result = compute_reference_casscf_result(geometry_path, basis)
+  return result.mo_energies, result.mo_coeffs
 
 
 def compute_casci_energy(geometry_path: str,
                          orbitals: np.ndarray,
                          basis: str) -> float: 
-  molecule = gto.M(atom=geometry_path,
-                   basis=basis,
-                   spin=0,
-                   symmetry=True)
-  molecule.verbose = 0
-
-  hartree_fock = molecule.RHF()
+  context = get_molecule_context(geometry_path, basis)
 
   n_states = N_STATES
   weights = np.ones(n_states) / n_states
-  casci = hartree_fock.CASCI(ncas=6, nelecas=6).state_average(weights)
+  casci = context.hartree_fock.CASCI(ncas=6, nelecas=6).state_average(weights)
   casci.conv_tol = 1e-8
 
   output = casci.kernel(orbitals)
+  context.release_eri()
   return output[0]
 
 
 def compute_casscf_energy(geometry_path: str,
                                    basis: str) -> float: 
-  molecule = gto.M(atom=geometry_path,
-                   basis=basis,
-                   spin=0,
-                   symmetry=True)
-  molecule.verbose = 0
-
-  hartree_fock = molecule.RHF()
-  hartree_fock.kernel()
-  S = hartree_fock.get_ovlp(molecule)
-
-  n_states = N_STATES
-  weights = np.ones(n_states) / n_states
-  casscf = hartree_fock.CASSCF(ncas=6, nelecas=6).state_average(weights)
-  casscf.conv_tol = 1e-8
-
-  mo = mcscf.project_init_guess(casscf, hartree_fock.mo_coeff)
-  mo = casscf.sort_mo([19, 20, 21, 22, 23, 24], mo)
-
-  _, e_tot, _, _, _, _, _, _, _ = casscf.kernel(mo)
-  return e_tot
\ No newline at end of file
+  return compute_reference_casscf_result(geometry_path, basis).e_tot
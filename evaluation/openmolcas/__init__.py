@@ -1,16 +1,19 @@
 import os
 import shutil
+import tempfile
 import numpy as np
 import h5py
 import torch
-from typing import Tuple
+from typing import Dict, Optional, Tuple
 import scipy
 import scipy.linalg
 
 from model.inference import infer_orbitals_from_phisnet_model
 from data.utils import read_xyz_file
 from phisnet_fork.utils.transform_hamiltonians import transform_hamiltonians_from_lm_to_ao
-from data.casscf.openmolcas import get_seward_input_file, MOLCAS_PATH
+from data.casscf.openmolcas import get_seward_input_file
+from data.casscf.openmolcas.runner import SCRATCH_PATH, run_molcas_calculation
+from data.casscf.openmolcas.overlap import compute_overlap_matrix
 # from openmolcas.utils import *
 
 basis_dict = {
@@ -20,38 +23,45 @@ convention = {
     'ANO-S-MB': 'fulvene_minimal_basis'
 }
 
+# opt-in: S from data/casscf/openmolcas/overlap.py instead of a Seward run, only for basis sets for which
+# validate_overlap_matrix matches the OpenMolcas outputs
+IN_PROCESS_OVERLAP = os.environ.get('MOLCAS_IN_PROCESS_OVERLAP', '0') == '1'
+
 """
 Overlap matrix
 """
 
-def calculate_overlap_matrix(base_path, geometry_xyz_file_path: str, basis: str) -> np.ndarray:
-    # make dir
-    dir_path = f'{base_path}/temporary/'
-    if not os.path.exists(dir_path):
-        os.makedirs(dir_path)
-
-    # copy files
-    shutil.copy2(get_seward_input_file(basis), f'{dir_path}/CASSCF.input')
-    shutil.copy2(geometry_xyz_file_path, f'{dir_path}/geom.xyz')
-
-    # create temp dir
-    temp_dir = f'{dir_path}/temp/'
-    if not os.path.exists(temp_dir):
-        os.makedirs(temp_dir)
-
-    # execute OpenMolcas
-    os.system(f'cd {dir_path} && WorkDir=./temp/ {MOLCAS_PATH} CASSCF.input > calc.log')
-
-    # extract overlap matrix
-    data = h5py.File(os.path.join(dir_path, 'CASSCF.guessorb.h5'))
-    basis_set_size = int(np.sqrt(data.get('AO_OVERLAP_MATRIX')[:].shape[0]))
-
-    S = data.get('AO_OVERLAP_MATRIX')[:].reshape(basis_set_size, basis_set_size)
-
-    # remove dir
-    shutil.rmtree(dir_path)
-
-    return S
+def run_seward(geometry_xyz_file_path: str,
+               basis: str,
+               timeout: Optional[float] = None,
+               scratch_path: Optional[str] = None) -> Dict[str, np.ndarray]:
+    """
+    Runs Seward / GuessOrb on a geometry in a temporary directory under scratch_path, so nothing is written
+    to the output folder, and returns the overlap matrix and guess orbitals of CASSCF.guessorb.h5
+    """
+    with tempfile.TemporaryDirectory(prefix='seward_', dir=scratch_path or SCRATCH_PATH) as dir_path:
+        # copy files
+        shutil.copy2(get_seward_input_file(basis), f'{dir_path}/CASSCF.input')
+        shutil.copy2(geometry_xyz_file_path, f'{dir_path}/geom.xyz')
+
+        # execute OpenMolcas
+        run_molcas_calculation(dir_path, result_files=['CASSCF.guessorb.h5'], timeout=timeout, scratch_path=scratch_path)
+
+        with h5py.File(os.path.join(dir_path, 'CASSCF.guessorb.h5'), 'r') as data:
+            return {key: data.get(key)[:] for key in ('AO_OVERLAP_MATRIX', 'MO_VECTORS', 'MO_ENERGIES')}
+
+def calculate_overlap_matrix(base_path,
+                             geometry_xyz_file_path: str,
+                             basis: str,
+                             in_process: bool = IN_PROCESS_OVERLAP,
+                             timeout: Optional[float] = None,
+                             scratch_path: Optional[str] = None) -> np.ndarray:
+    if in_process:
+        return compute_overlap_matrix(geometry_xyz_file_path, basis)
+
+    S = run_seward(geometry_xyz_file_path, basis, timeout, scratch_path)['AO_OVERLAP_MATRIX']
+    basis_set_size = int(np.sqrt(S.shape[0]))
+    return S.reshape(basis_set_size, basis_set_size)
 
 """
 Fn's to compute orbitals using different methods
@@ -60,43 +70,25 @@ Fn's to compute orbitals using different methods
 def compute_huckel_orbitals(base_path: str,
                             model_path: str, 
                             geometry_path: str,
-                            basis: str = 'sto_6g') -> Tuple[np.ndarray, np.ndarray]:
-    # make dir
-    dir_path = f'{base_path}/temporary/'
-    if not os.path.exists(dir_path):
-        os.makedirs(dir_path)
-
-    # copy files
-    shutil.copy2(get_seward_input_file(basis), f'{dir_path}/CASSCF.input')
-    shutil.copy2(geometry_path, f'{dir_path}/geom.xyz')
-
-    # create temp dir
-    temp_dir = f'{dir_path}/temp/'
-    if not os.path.exists(temp_dir):
-        os.makedirs(temp_dir)
-
-    # execute OpenMolcas
-    os.system(f'cd {dir_path} && WorkDir=./temp/ {MOLCAS_PATH} CASSCF.input > calc.log')
-
-    # extract overlap matrix
-    data = h5py.File(os.path.join(dir_path, 'CASSCF.guessorb.h5'))
-    basis_set_size = int(np.sqrt(data.get('AO_OVERLAP_MATRIX')[:].shape[0]))
-
-    mo = data.get('MO_VECTORS')[:].reshape(basis_set_size, basis_set_size)
-    mo_e = data.get('MO_ENERGIES')[:]
-
-    # remove dir
-    shutil.rmtree(dir_path)
-
+                            basis: str = 'sto_6g',
+                            timeout: Optional[float] = None,
+                            scratch_path: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+    data = run_seward(geometry_path, basis, timeout, scratch_path)
+    basis_set_size = int(np.sqrt(data['AO_OVERLAP_MATRIX'].shape[0]))
+
+    mo = data['MO_VECTORS'].reshape(basis_set_size, basis_set_size)
+    mo_e = data['MO_ENERGIES']
     return mo_e, mo
 
 def compute_phisnet_model_orbitals(base_path: str,
                                    model_path: str, 
                                    geometry_path: str,
-                                   basis: str = 'sto_6g') -> Tuple[np.ndarray, np.ndarray]:
+                                   basis: str = 'sto_6g',
+                                   timeout: Optional[float] = None,
+                                   scratch_path: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
     orbital_convention = convention[basis]
     F = infer_orbitals_from_phisnet_model(model_path, geometry_path, orbital_convention)
-    S = calculate_overlap_matrix(base_path, geometry_path, basis)
+    S = calculate_overlap_matrix(base_path, geometry_path, basis, timeout=timeout, scratch_path=scratch_path)
     mo_e, mo = scipy.linalg.eigh(F, S)
     return mo_e, mo.T
 
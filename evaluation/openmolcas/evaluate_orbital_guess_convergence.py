@@ -1,20 +1,21 @@
 import argparse
 import os
-from typing import Callable, List
+from typing import Callable, List, Optional
 import numpy as np
 import shutil
 
-from data.casscf.openmolcas import MOLCAS_PATH, get_guess_orb_file, get_input_file
+from data.casscf.openmolcas import get_guess_orb_file, get_input_file
+from data.casscf.openmolcas.runner import MolcasRunner, run_molcas_calculation
 from data.casscf.openmolcas.utils import read_log_file, write_coeffs_to_orb_file
 from data.utils import find_all_geometry_files_in_folder, sort_geometry_files_by_idx
 from evaluation.openmolcas import initial_guess_dict, basis_dict
 
 
-def run_casscf_calculation(geometry_xyz_file_path: str, 
-                           guess_orbs: np.ndarray,
-                           base_path: str,
-                           index: int,
-                           basis: str = 'ANO-S-MB') -> int:
+def prepare_casscf_calculation(geometry_xyz_file_path: str, 
+                               guess_orbs: np.ndarray,
+                               base_path: str,
+                               index: int,
+                               basis: str = 'ANO-S-MB') -> str:
     # make dir
     dir_path = f'{base_path}/calculation_{index}/'
     if not os.path.exists(dir_path):
@@ -25,19 +26,18 @@ def run_casscf_calculation(geometry_xyz_file_path: str,
     shutil.copy2(geometry_xyz_file_path, f'{dir_path}/geom.xyz')
     write_coeffs_to_orb_file(guess_orbs.flatten(), input_file_path=get_guess_orb_file(basis), 
                              output_file_path=f'{dir_path}/geom.orb', n=basis_dict[basis])
+    return dir_path
 
-    # create temp dir
-    temp_dir = f'{dir_path}/temp/'
-    if not os.path.exists(temp_dir):
-        os.makedirs(temp_dir)
-
-    # execute OpenMolcas
-    os.system(f'cd {dir_path} && WorkDir=./temp/ {MOLCAS_PATH} CASSCF.input > calc.log')
-
-    # remove temp dir
-    shutil.rmtree(temp_dir)
 
-    return read_log_file(os.path.join(dir_path, 'calc.log'))
+def run_casscf_calculation(geometry_xyz_file_path: str, 
+                           guess_orbs: np.ndarray,
+                           base_path: str,
+                           index: int,
+                           basis: str = 'ANO-S-MB',
+                           timeout: Optional[float] = None,
+                           scratch_path: Optional[str] = None) -> int:
+    dir_path = prepare_casscf_calculation(geometry_xyz_file_path, guess_orbs, base_path, index, basis)
+    return read_log_file(run_molcas_calculation(dir_path, timeout=timeout, scratch_path=scratch_path))
 
 
 def evaluate_and_print_initial_guess_convergence(geometry_files: List[str],
@@ -45,21 +45,58 @@ def evaluate_and_print_initial_guess_convergence(geometry_files: List[str],
                                                  model_path: str, 
                                                  key: str, 
                                                  method: Callable, 
-                                                 basis: str):
+                                                 basis: str,
+                                                 timeout: Optional[float] = None,
+                                                 scratch_path: Optional[str] = None):
   n_its, rasscf_ts, wall_ts = [], [], []
   for idx, geometry_file in enumerate(geometry_files):
-    _, mo = method(output_folder, model_path, geometry_file, basis)
+    _, mo = method(output_folder, model_path, geometry_file, basis, timeout=timeout, scratch_path=scratch_path)
 
     rasscf_t, wall_t, n_it = run_casscf_calculation(geometry_xyz_file_path=geometry_file,
                                                                       guess_orbs=mo,
                                                                       base_path=output_folder,
                                                                       index=idx,
-                                                                      basis=basis)
+                                                                      basis=basis,
+                                                                      timeout=timeout,
+                                                                      scratch_path=scratch_path)
+    print(f'{key} at calc {idx}: converged: {n_it} - {wall_t} - {rasscf_t}')
+    n_its.append(n_it)
+    wall_ts.append(wall_t)
+    rasscf_ts.append(rasscf_t)
+
+  print_convergence_summary(key, n_its, wall_ts, rasscf_ts)
+
+
+def evaluate_and_print_initial_guess_convergence_parallel(geometry_files: List[str],
+                                                          output_folder: str,
+                                                          model_path: str, 
+                                                          key: str, 
+                                                          method: Callable, 
+                                                          basis: str,
+                                                          n_workers: Optional[int] = None,
+                                                          timeout: Optional[float] = None,
+                                                          scratch_path: Optional[str] = None):
+  # the calculations do not depend on each other, so all OpenMolcas runs of a method are started at once
+  dir_paths = []
+  for idx, geometry_file in enumerate(geometry_files):
+    _, mo = method(output_folder, model_path, geometry_file, basis, timeout=timeout, scratch_path=scratch_path)
+    dir_paths.append(prepare_casscf_calculation(geometry_file, mo, output_folder, idx, basis))
+
+  n_its, rasscf_ts, wall_ts = [], [], []
+  for idx, log_file in enumerate(MolcasRunner(n_workers, timeout, scratch_path).run_all(dir_paths)):
+    if isinstance(log_file, Exception):
+      print(f'{key} at calc {idx}: failed: {log_file}')
+      continue
+    rasscf_t, wall_t, n_it = read_log_file(log_file)
     print(f'{key} at calc {idx}: converged: {n_it} - {wall_t} - {rasscf_t}')
     n_its.append(n_it)
     wall_ts.append(wall_t)
     rasscf_ts.append(rasscf_t)
 
+  print_convergence_summary(key, n_its, wall_ts, rasscf_ts)
+
+
+def print_convergence_summary(key: str, n_its: List[int], wall_ts: List[float], rasscf_ts: List[float]) -> None:
   print(f'Method {key} convergence: \n Macro iterations: {np.mean(np.array(n_its))} +/- {np.std(np.array(n_its))} \
                                     \n Wall timing: {np.mean(np.array(wall_ts))} +/- {np.std(np.array(wall_ts))} \
                                     \n Rasscf timing: {np.mean(np.array(rasscf_ts))} +/- {np.std(np.array(rasscf_ts))}')
@@ -75,6 +112,10 @@ if __name__ == "__main__":
   parser.add_argument('--phisnet_model', type=str)
   parser.add_argument('--basis', type=str)
   parser.add_argument('--all', type=bool)
+  parser.add_argument('--parallel', action='store_true')
+  parser.add_argument('--n_workers', type=int, default=None)
+  parser.add_argument('--timeout', type=float, default=None, help='seconds after which an OpenMolcas run is killed')
+  parser.add_argument('--scratch_path', type=str, default=None, help='local disk / tmpfs to run on, defaults to $MOLCAS_SCRATCH or the temp dir')
   args = parser.parse_args()
 
   geometry_folder = base_dir + args.geometry_folder
@@ -92,7 +133,10 @@ if __name__ == "__main__":
     geometry_files = np.array(geometry_files)[np.load(split_file)['test_idx']]
 
   for key, method in initial_guess_dict.items():
-    evaluate_and_print_initial_guess_convergence(geometry_files, output_folder, phisnet_model, key, method, basis)
+    if args.parallel:
+      evaluate_and_print_initial_guess_convergence_parallel(geometry_files, output_folder, phisnet_model, key, method, basis, args.n_workers, args.timeout, args.scratch_path)
+    else:
+      evaluate_and_print_initial_guess_convergence(geometry_files, output_folder, phisnet_model, key, method, basis, args.timeout, args.scratch_path)
 
 
 
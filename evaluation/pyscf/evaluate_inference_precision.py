@@ -0,0 +1,97 @@
+"""
+Accuracy report of reduced precision (int8 dynamic quantization / bf16 autocast) CPU inference of an F model:
+latency per guess, deviation of F from the fp32 prediction, CASCI energy error of the guessed orbitals
+and the number of CASSCF iterations starting from them.
+"""
+import argparse
+import os
+import time
+from typing import Dict, List
+import numpy as np
+import scipy.linalg
+import torch
+from pyscf import gto
+
+from data.utils import find_all_geometry_files_in_folder, sort_geometry_files_by_idx
+from evaluation import basis_dict, compute_casci_energy, run_casscf_calculation
+from evaluation.reference_store import ReferenceStore
+from model.inference import Predictor
+from model.quantization import PRECISIONS
+
+
+def predict_F_matrices(model_path: str, geometry_files: List[str], basis: str, precision: str) -> Dict[str, np.ndarray]:
+  predictor = Predictor(model_path, property='F', basis_set_size=basis_dict[basis], precision=precision, device=torch.device('cpu'))
+  predictor.predict(geometry_files[:1])
+
+  # one geometry per call, as a guess is requested in a CASSCF pipeline
+  F_matrices, timings = [], []
+  for geometry_file in geometry_files:
+    tic = time.perf_counter()
+    F_matrices.append(predictor.predict([geometry_file])[0])
+    timings.append(time.perf_counter() - tic)
+  return {'F': np.stack(F_matrices), 'timings': np.array(timings)}
+
+
+def evaluate_precision(geometry_files: List[str], F_matrices: np.ndarray, casscf_energies: np.ndarray, basis: str) -> Dict[str, np.ndarray]:
+  casci_errors, macro_iterations, micro_iterations, inner_iterations, converged = [], [], [], [], []
+  for geometry_file, F, e_casscf in zip(geometry_files, F_matrices, casscf_energies):
+    molecule = gto.M(atom=geometry_file, basis=basis, spin=0, symmetry=True)
+    S = molecule.intor('int1e_ovlp')
+    _, mo = scipy.linalg.eigh(F, S)
+
+    casci_errors.append(np.abs(e_casscf - compute_casci_energy(geometry_file, mo, basis)))
+    conv, _, imacro, imicro, iinner = run_casscf_calculation(geometry_file, mo, basis=basis)
+    converged.append(conv)
+    macro_iterations.append(imacro)
+    micro_iterations.append(imicro)
+    inner_iterations.append(iinner)
+  return {
+    'casci_errors': np.array(casci_errors),
+    'macro_iterations': np.array(macro_iterations),
+    'micro_iterations': np.array(micro_iterations),
+    'inner_iterations': np.array(inner_iterations),
+    'converged': np.array(converged),
+  }
+
+
+if __name__ == "__main__":
+  base_dir = os.environ['base_dir']
+
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--geometry_folder', type=str)
+  parser.add_argument('--split_name', type=str)
+  parser.add_argument('--F_model', type=str)
+  parser.add_argument('--basis', type=str)
+  parser.add_argument('--precisions', type=str, nargs='+', default=PRECISIONS)
+  parser.add_argument('--n_threads', type=int, default=None)
+  parser.add_argument('--output_folder', type=str, default=None)
+  args = parser.parse_args()
+
+  geometry_folder = base_dir + args.geometry_folder
+  split_file = './data_storage/' + args.split_name
+  f_model = './checkpoints/' + args.F_model + '.pt'
+  basis = args.basis
+  if args.n_threads is not None:
+    torch.set_num_threads(args.n_threads)
+
+  geometry_files = find_all_geometry_files_in_folder(geometry_folder)
+  geometry_files = sort_geometry_files_by_idx(geometry_files)
+  geometry_files = np.array(geometry_files)[np.load(split_file)['test_idx']].tolist()
+
+  reference_store = ReferenceStore()
+  if args.output_folder is not None:
+    reference_store.add_output_folder(geometry_folder, base_dir + args.output_folder, basis)
+  casscf_energies = np.array([reference_store.get_casscf_energy(geometry_file, basis) for geometry_file in geometry_files])
+  predictions = {precision: predict_F_matrices(f_model, geometry_files, basis, precision) for precision in args.precisions}
+  # |dF| is always relative to the fp32 prediction, also when fp32 itself is not reported
+  reference_F = predictions['fp32']['F'] if 'fp32' in predictions else predict_F_matrices(f_model, geometry_files, basis, 'fp32')['F']
+
+  print(f'{"precision":>9} {"latency (ms)":>12} {"max |dF|":>10} {"CASCI MAE":>10} {"macro":>12} {"micro":>12} {"inner":>12} {"converged":>9}')
+  for precision, prediction in predictions.items():
+    results = evaluate_precision(geometry_files, prediction['F'], casscf_energies, basis)
+    print(f'{precision:>9} {1e3 * np.median(prediction["timings"]):>12.2f} {np.max(np.abs(prediction["F"] - reference_F)):>10.2e} '
+          f'{np.mean(results["casci_errors"]):>10.2e} '
+          f'{np.mean(results["macro_iterations"]):>6.2f}+/-{np.std(results["macro_iterations"]):<4.1f}'
+          f'{np.mean(results["micro_iterations"]):>6.2f}+/-{np.std(results["micro_iterations"]):<4.1f}'
+          f'{np.mean(results["inner_iterations"]):>6.2f}+/-{np.std(results["inner_iterations"]):<4.1f}'
+          f'{np.sum(results["converged"]):>5}/{len(geometry_files)}')
@@ -4,72 +4,40 @@ import torch
 from ase.db import connect
 import numpy as np
 from phisnet_fork.utils.transform_hamiltonians import transform_hamiltonians_from_lm_to_ao
-import schnetpack as spk
+
+from model.inference import Predictor
+
+
+def calculate_predictor_loss(predictor: Predictor, db_path: str, indices: np.ndarray, property: str) -> float:
+    with connect(db_path) as conn:
+        rows = [conn.get(int(idx) + 1) for idx in indices]
+    targets = np.stack([row.data[property] for row in rows])
+    preds = predictor.predict([row.toatoms() for row in rows]).reshape(len(rows), -1)
+    return np.sum((preds - targets)**2) / (len(indices) * preds.shape[1])
+
 
 def evaluate_mo_model_loss(model_path, db_path, split_path):
-    
-    def calculate_loss(model, db_path, indices):
-        loss = 0
-        for idx in indices:
-            with connect(db_path) as conn:
-                target = conn.get(int(idx) + 1).data['mo_coeffs_adjusted']
-                atoms = conn.get_atoms(idx=int(idx))
-            converter = spk.interfaces.AtomsConverter(neighbor_list=spk.transform.ASENeighborList(cutoff=5.0), dtype=torch.float32, device=device)
-            input = converter(atoms)
-            pred = model(input)['mo_coeffs_adjusted'].detach().cpu().numpy()
-            loss += np.sum((pred - target)**2)
-        loss /= len(train_idx) * pred.shape[0]
-        return loss
-        
-    if torch.cuda.is_available():
-        device = torch.device('cuda')
-    else:
-        device = torch.device('cpu')
-    model = torch.load(model_path, map_location=device).to(device)
+    predictor = Predictor(model_path, property='mo')
     
     split = np.load(split_path)
     train_idx, val_idx, test_idx = split['train_idx'], split['val_idx'], split['test_idx']
     
-    model.train()
-    train_loss = calculate_loss(model, db_path, train_idx)
-
-    model.eval()
-    val_loss = calculate_loss(model, db_path, val_idx)
-    test_loss = calculate_loss(model, db_path, test_idx)
+    train_loss = calculate_predictor_loss(predictor, db_path, train_idx, 'mo_coeffs_adjusted')
+    val_loss = calculate_predictor_loss(predictor, db_path, val_idx, 'mo_coeffs_adjusted')
+    test_loss = calculate_predictor_loss(predictor, db_path, test_idx, 'mo_coeffs_adjusted')
 
     return train_loss, val_loss, test_loss
 
 
 def evaluate_f_model_loss(model_path, db_path, split_path):
-    
-    def calculate_loss(model, db_path, indices):
-        loss = 0
-        for idx in indices:
-            with connect(db_path) as conn:
-                target = conn.get(int(idx) + 1).data['F']
-                atoms = conn.get_atoms(idx=int(idx))
-            converter = spk.interfaces.AtomsConverter(neighbor_list=spk.transform.ASENeighborList(cutoff=5.0), dtype=torch.float32, device=device)
-            input = converter(atoms)
-            pred = model(input)['F'].detach().cpu().numpy()
-            loss += np.sum((pred - target)**2)
-        loss /= len(train_idx) * pred.shape[0]
-        return loss
-        
-    if torch.cuda.is_available():
-        device = torch.device('cuda')
-    else:
-        device = torch.device('cpu')
-    model = torch.load(model_path, map_location=device).to(device)
+    predictor = Predictor(model_path, property='F')
     
     split = np.load(split_path)
     train_idx, val_idx, test_idx = split['train_idx'], split['val_idx'], split['test_idx']
     
-    model.train()
-    train_loss = calculate_loss(model, db_path, train_idx)
-
-    model.eval()
-    val_loss = calculate_loss(model, db_path, val_idx)
-    test_loss = calculate_loss(model, db_path, test_idx)
+    train_loss = calculate_predictor_loss(predictor, db_path, train_idx, 'F')
+    val_loss = calculate_predictor_loss(predictor, db_path, val_idx, 'F')
+    test_loss = calculate_predictor_loss(predictor, db_path, test_idx, 'F')
 
     return train_loss, val_loss, test_loss
 
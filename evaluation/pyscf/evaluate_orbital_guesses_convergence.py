@@ -1,15 +1,27 @@
 import argparse
-from code import InteractiveInterpreter
-from mimetypes import init
+import json
+import multiprocessing
 import os
-from typing import Callable, List, Optional
-from phisnet_fork.training.parse_command_line_arguments import parse_command_line_arguments
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Tuple
 import numpy as np
-from data.utils import find_all_geometry_files_in_folder, sort_geometry_files_by_idx
-from pyscf import mcscf, gto
+import torch
+from pyscf import lib
+from tqdm import tqdm
 
-from evaluation import initial_guess_dict, run_casscf_calculation
+from data.utils import find_all_geometry_files_in_folder, sort_geometry_files_by_idx
+from model.model_registry import model_registry
+from evaluation import compute_ao_min_orbitals, compute_F_model_orbitals, compute_hf_orbitals, compute_huckel_orbitals, compute_mo_model_orbitals, compute_phisnet_model_orbitals, initial_guess_dict, run_casscf_calculation
 
+guess_methods = {
+  'ao_min': compute_ao_min_orbitals,
+  'huckel': compute_huckel_orbitals,
+  'hartree-fock': compute_hf_orbitals,
+  'ML-MO': compute_mo_model_orbitals,
+  'ML-F': compute_F_model_orbitals,
+  'phisnet': compute_phisnet_model_orbitals,
+}
 
 def evaluate_and_print_initial_guess_convergence(geometry_files: List[str],
                                                  model_path: str, 
@@ -34,6 +46,102 @@ def evaluate_and_print_initial_guess_convergence(geometry_files: List[str],
         Inner iterations: {np.mean(np.array(inner_iterations))} +/- {np.std(np.array(inner_iterations))} \n')
   print(e_tots)
 
+
+def _init_worker(n_threads: int) -> None:
+  lib.num_threads(n_threads)
+  torch.set_num_threads(n_threads)
+
+
+def run_convergence_job(key: str, model_path: Optional[str], geometry_file: str, basis: str) -> Dict:
+  tic = time.perf_counter()
+  _, mo = guess_methods[key](model_path, geometry_file, basis)
+  guess_time = time.perf_counter() - tic
+  conv, e_tot, imacro, imicro, iinner = run_casscf_calculation(geometry_file, mo, basis=basis)
+  wall_time = time.perf_counter() - tic
+  return {'method': key, 'model_path': model_path, 'basis': basis, 'geometry_file': geometry_file, 'conv': bool(conv), 'e_tot': float(np.mean(e_tot)),
+          'imacro': int(imacro), 'imicro': int(imicro), 'iinner': int(iinner),
+          'guess_time': guess_time, 'wall_time': wall_time}
+
+
+def read_convergence_results(results_file: str) -> List[Dict]:
+  if not os.path.exists(results_file):
+    return []
+  with open(results_file) as f:
+    return [json.loads(line) for line in f if line.strip()]
+
+
+def _get_job_key(record: Dict) -> Tuple:
+  return (record['method'], record.get('model_path'), record.get('basis'), record['geometry_file'])
+
+
+def evaluate_initial_guess_convergence_parallel(geometry_files: List[str],
+                                                model_paths: Dict[str, Optional[str]],
+                                                basis: str,
+                                                results_file: str,
+                                                n_workers: Optional[int] = None) -> List[Dict]:
+  """
+  Runs the (method x geometry) CASSCF calculations on a process pool, every worker with an equal share of
+  the cores. Every finished job is appended to results_file as a JSON line as soon as it completes, jobs
+  already in results_file are skipped, so an interrupted benchmark can be resumed.
+  """
+  if n_workers is None:
+    n_workers = os.cpu_count()
+  n_threads = max(1, os.cpu_count() // n_workers)
+
+  # records of other models, bases or geometries in the same results file are neither reused nor returned
+  job_keys = {(key, model_path, basis, geometry_file) for geometry_file in geometry_files for key, model_path in model_paths.items()}
+  done = {_get_job_key(r) for r in read_convergence_results(results_file) if 'error' not in r}
+  jobs = [(key, model_path, geometry_file) for geometry_file in geometry_files 
+          for key, model_path in model_paths.items() if (key, model_path, basis, geometry_file) not in done]
+
+  # BLAS / OpenMP read the thread count when they are loaded, so it has to be in the environment of the spawned workers
+  thread_variables = ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS']
+  previous_environment = {variable: os.environ.get(variable) for variable in thread_variables}
+  os.environ.update({variable: str(n_threads) for variable in thread_variables})
+  try:
+    with ProcessPoolExecutor(max_workers=n_workers, mp_context=multiprocessing.get_context('spawn'), 
+                             initializer=_init_worker, initargs=(n_threads,)) as executor, \
+         open(results_file, 'a') as f, \
+         tqdm(total=len(jobs)) as progress_bar:
+      futures = {executor.submit(run_convergence_job, key, model_path, geometry_file, basis): (key, geometry_file)
+                 for key, model_path, geometry_file in jobs}
+      while futures:
+        finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+        for future in finished:
+          key, geometry_file = futures.pop(future)
+          try:
+            record = future.result()
+          except Exception as e:
+            record = {'method': key, 'model_path': model_paths[key], 'basis': basis, 'geometry_file': geometry_file, 'error': repr(e)}
+          f.write(json.dumps(record) + '\n')
+          f.flush()
+          progress_bar.update(1)
+  finally:
+    for variable, value in previous_environment.items():
+      if value is None:
+        os.environ.pop(variable, None)
+      else:
+        os.environ[variable] = value
+
+  # the last record of a job wins, so an earlier failure that was retried is not reported
+  results = {_get_job_key(r): r for r in read_convergence_results(results_file) if _get_job_key(r) in job_keys}
+  return list(results.values())
+
+
+def print_convergence_results(results: List[Dict]) -> None:
+  for key in dict.fromkeys(r['method'] for r in results):
+    method_results = [r for r in results if r['method'] == key and 'error' not in r]
+    n_failed = len([r for r in results if r['method'] == key and 'error' in r])
+    macro_iterations = np.array([r['imacro'] for r in method_results])
+    micro_iterations = np.array([r['imicro'] for r in method_results])
+    inner_iterations = np.array([r['iinner'] for r in method_results])
+    wall_times = np.array([r['wall_time'] for r in method_results])
+    print(f'Method {key} convergence ({sum(r["conv"] for r in method_results)}/{len(method_results)} converged, {n_failed} failed): \n \
+        Macro iterations: {np.mean(macro_iterations)} +/- {np.std(macro_iterations)} \n \
+        Micro iterations: {np.mean(micro_iterations)} +/- {np.std(micro_iterations)} \n \
+        Inner iterations: {np.mean(inner_iterations)} +/- {np.std(inner_iterations)} \n \
+        Wall time: {np.mean(wall_times)} +/- {np.std(wall_times)} s \n')
+
 if __name__ == "__main__":
   base_dir = os.environ['base_dir']
 
@@ -45,14 +153,21 @@ if __name__ == "__main__":
   parser.add_argument('--phisnet_model', type=str)
   parser.add_argument('--basis', type=str)
   parser.add_argument('--all', type=bool)
+  parser.add_argument('--parallel', action='store_true')
+  parser.add_argument('--methods', type=str, nargs='+', default=list(initial_guess_dict.keys()))
+  parser.add_argument('--n_workers', type=int, default=None)
+  parser.add_argument('--results_file', type=str, default='./convergence_results.jsonl')
   args = parser.parse_args()
 
   geometry_folder = base_dir + args.geometry_folder
   split_file = './data_storage/' + args.split_name
-  mo_model = './checkpoints/' + args.mo_model + '.pt'
-  f_model = './checkpoints/' + args.F_model + '.pt'
-  phisnet_model = './checkpoints/' + args.phisnet_model + '.pt'
   basis = args.basis
+  model_files = {
+    'ML-MO': args.mo_model,
+    'ML-F': args.F_model,
+    'phisnet': args.phisnet_model,
+  }
+  model_paths = {key: None if model_files.get(key) is None else './checkpoints/' + model_files[key] + '.pt' for key in args.methods}
 
   geometry_files = find_all_geometry_files_in_folder(geometry_folder)
   geometry_files = sort_geometry_files_by_idx(geometry_files)
@@ -62,15 +177,11 @@ if __name__ == "__main__":
   else:
     geometry_files = np.array(geometry_files)[np.load(split_file)['test_idx']]
 
-  for key, method in initial_guess_dict.items():
-    if key == 'ao_min' or 'hartree-fock':
-      evaluate_and_print_initial_guess_convergence(geometry_files, None, key, method, basis)
-    elif key == 'ML-MO':
-      evaluate_and_print_initial_guess_convergence(geometry_files, mo_model, key, method, basis)
-    elif key == 'ML-F':
-      evaluate_and_print_initial_guess_convergence(geometry_files, f_model, key, method, basis)
-    if key == 'phisnet':
-      evaluate_and_print_initial_guess_convergence(geometry_files, phisnet_model, key, method, basis)
-
-
+  if args.parallel:
+    results = evaluate_initial_guess_convergence_parallel(geometry_files.tolist(), model_paths, basis, args.results_file, args.n_workers)
+    print_convergence_results(results)
+  else:
+    for key, model_path in model_paths.items():
+      evaluate_and_print_initial_guess_convergence(geometry_files, model_path, key, guess_methods[key], basis)
 
+  print(f'Model registry: {model_registry.stats()}')
@@ -1,4 +1,4 @@
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 from data.utils import find_all_geometry_files_in_folder, sort_geometry_files_by_idx
 from pyscf import gto
 from pyscf.tools import molden
@@ -7,35 +7,39 @@ import argparse
 import os
 import matplotlib.pyplot as plt
 
-from evaluation import initial_guess_dict, compute_casci_energy, compute_casscf_energy, compute_converged_casscf_orbitals
+from model.model_registry import model_registry
+from evaluation import initial_guess_dict, compute_casci_energy
+from evaluation.reference_store import ReferenceStore
 
 
 def plot_mo_energies_errors(geometry_files: List[str],
                             method_name: str,
                             model_path: str,
-                            basis: str) -> Tuple[np.ndarray, str]:
+                            basis: str,
+                            reference_store: ReferenceStore) -> Tuple[np.ndarray, str]:
   mo_e_errors = []
   for geometry_file in geometry_files:
-    mo_e_converged, _ = compute_converged_casscf_orbitals(model_path='', 
-                                                          geometry_path=geometry_file,
-                                                          basis=basis)
+    mo_e_converged, _ = reference_store.get_converged_orbitals(geometry_file, basis)
     mo_e, _ = initial_guess_dict[method_name](model_path, geometry_file, basis)
     mo_e_errors.append(np.abs(mo_e_converged - mo_e))
   mo_e_errors = np.mean(mo_e_errors, axis=0)
   return mo_e_errors, method_name
 
-def print_casci_energies_errors(geometry_files: List[str], 
-                         method_name: str, 
-                         model_path: str, 
-                         basis: str) -> None:
-  errors = []
+def print_casci_energies_errors(geometry_files: List[str],
+                                model_paths: Dict[str, Optional[str]],
+                                basis: str,
+                                reference_store: ReferenceStore) -> None:
+  # geometries in the outer loop, so every method reuses the MoleculeContext of the geometry while it is cached
+  errors = {method_name: [] for method_name in model_paths}
   for idx, geometry_file in enumerate(geometry_files):
-    e_casscf = compute_casscf_energy(geometry_file, basis)
-    _, mo = initial_guess_dict[method_name](model_path, geometry_file, basis)
-    e_casci = compute_casci_energy(geometry_file, mo , basis)
-    print(f'geometry {idx}, error: {np.abs(e_casscf - e_casci)}')
-    errors.append(np.abs(e_casscf - e_casci))
-  print(f'Method {method_name} CASCI MAE: {np.mean(np.array(errors))} +/- {np.std(np.array(errors))} \n')
+    e_casscf = reference_store.get_casscf_energy(geometry_file, basis)
+    for method_name, model_path in model_paths.items():
+      _, mo = initial_guess_dict[method_name](model_path, geometry_file, basis)
+      e_casci = compute_casci_energy(geometry_file, mo , basis)
+      print(f'{method_name} geometry {idx}, error: {np.abs(e_casscf - e_casci)}')
+      errors[method_name].append(np.abs(e_casscf - e_casci))
+  for method_name, method_errors in errors.items():
+    print(f'Method {method_name} CASCI MAE: {np.mean(np.array(method_errors))} +/- {np.std(np.array(method_errors))} \n')
 
 if __name__ == "__main__":
   base_dir = os.environ['base_dir']
@@ -48,6 +52,8 @@ if __name__ == "__main__":
   parser.add_argument('--phisnet_model', type=str)
   parser.add_argument('--basis', type=str)
   parser.add_argument('--all', type=bool)
+  parser.add_argument('--output_folder', type=str, default=None)
+  parser.add_argument('--db_name', type=str, default=None)
   args = parser.parse_args()
 
   geometry_folder = base_dir + args.geometry_folder
@@ -57,6 +63,13 @@ if __name__ == "__main__":
   phisnet_model = './checkpoints/' + args.phisnet_model + '.pt'
   basis = args.basis
 
+  # converged references are looked up from earlier campaigns instead of recomputed for every method
+  reference_store = ReferenceStore()
+  if args.output_folder is not None:
+    reference_store.add_output_folder(geometry_folder, base_dir + args.output_folder, basis)
+  if args.db_name is not None:
+    reference_store.add_database('./data_storage/' + args.db_name, basis)
+
   geometry_files = find_all_geometry_files_in_folder(geometry_folder)
   geometry_files = sort_geometry_files_by_idx(geometry_files)
   if args.all:
@@ -64,28 +77,14 @@ if __name__ == "__main__":
   else:
     geometry_files = np.array(geometry_files)[np.load(split_file)['test_idx']]
 
-  for key, method in initial_guess_dict.items():
-    if key == 'ao_min' or 'hartree-fock':
-      print_casci_energies_errors(geometry_files, key, None, basis)
-      # print('Calculating orbital energy differences.....\n')
-      # mo_e_errors, method_name = plot_mo_energies_errors(geometry_files, key, None, basis)
-      # plt.plot(np.arange(len(mo_e_errors)), mo_e_errors, label=method_name)
-      # plt.show()
-    elif key == 'ML-MO':
-      print_casci_energies_errors(geometry_files, key, mo_model, basis)
-      # print('Calculating orbital energy differences.....\n')
-      # mo_e_errors, method_name = plot_mo_energies_errors(geometry_files, key, mo_model, basis)
-      # plt.plot(np.arange(len(mo_e_errors)), mo_e_errors, label=method_name)
-      # plt.show()
-    elif key == 'ML-F':
-      print_casci_energies_errors(geometry_files, key, f_model, basis)
-      # print('Calculating orbital energy differences.....\n')
-      # mo_e_errors, method_name = plot_mo_energies_errors(geometry_files, key, f_model, basis)
-      # plt.plot(np.arange(len(mo_e_errors)), mo_e_errors, label=method_name)
-      # plt.show()
-    if key == 'phisnet':
-      print_casci_energies_errors(geometry_files, key, phisnet_model, basis)
-      # print('Calculating orbital energy differences.....\n')
-      # mo_e_errors, method_name = plot_mo_energies_errors(geometry_files, key, phisnet_model, basis)
-      # plt.plot(np.arange(len(mo_e_errors)), mo_e_errors, label=method_name)
-      # plt.show()
\ No newline at end of file
+  model_paths = {'ao_min': None, 'hartree-fock': None, 'ML-MO': mo_model, 'ML-F': f_model, 'phisnet': phisnet_model}
+  model_paths = {key: model_paths[key] for key in initial_guess_dict}
+  print_casci_energies_errors(geometry_files, model_paths, basis, reference_store)
+  # print('Calculating orbital energy differences.....\n')
+  # for key, model_path in model_paths.items():
+  #   mo_e_errors, method_name = plot_mo_energies_errors(geometry_files, key, model_path, basis, reference_store)
+  #   plt.plot(np.arange(len(mo_e_errors)), mo_e_errors, label=method_name)
+  # plt.show()
+
+  print(f'Model registry: {model_registry.stats()}')
+  print(f'Reference store: {reference_store.stats()}')
@@ -1,58 +1,133 @@
+"""
+Timing benchmark of initial guess methods: for every method and geometry the time to set up the molecule,
+to generate the guess and to converge the SA-CASSCF from it are measured separately, together with the
+iteration counts, so the inference cost of a guess can be weighed against the CASSCF time it saves.
+"""
+import argparse
+import csv
+import json
 import os
 import time
+from typing import Dict, List, Optional
 import numpy as np
-from pyscf import mcscf, gto
-import multiprocessing
-from tqdm import tqdm
 
-from evaluation.utils import compute_F_model_orbitals, compute_ao_min_orbitals
+from data.utils import find_all_geometry_files_in_folder, sort_geometry_files_by_idx
+from evaluation import clear_molecule_contexts, get_casscf_object, get_molecule_context
+from evaluation.pyscf.evaluate_orbital_guesses_convergence import guess_methods
 
-def run_casscf_calculation(args):
-  geometry_file, basis, guess_orbitals = args
+TIMINGS = ['setup_time', 'guess_time', 'casscf_time', 'total_time']
+ITERATIONS = ['imacro', 'imicro', 'iinner']
 
-  molecule = gto.M(atom=geometry_file,
-                   basis=basis,
-                   spin=0,
-                   symmetry=True)
-  molecule.verbose = 0
 
-  hartree_fock = molecule.RHF()
-  n_states = 2
-  weights = np.ones(n_states) / n_states
-  casscf = hartree_fock.CASSCF(ncas=6, nelecas=6).state_average(weights)
-  casscf.conv_tol = 1e-8
+def time_guess_method(key: str, model_path: Optional[str], geometry_file: str, basis: str) -> Dict:
+  # every run starts from an unbuilt molecule, as a pipeline meeting a new geometry would
+  clear_molecule_contexts()
+  tic = time.perf_counter()
+  get_molecule_context(geometry_file, basis)
+  setup_time = time.perf_counter() - tic
+
+  tic = time.perf_counter()
+  _, mo = guess_methods[key](model_path, geometry_file, basis)
+  guess_time = time.perf_counter() - tic
 
+  casscf = get_casscf_object(geometry_file, basis)
   tic = time.perf_counter()
-  _, _, _, iinner, _, _, _, _ = casscf.kernel(guess_orbitals)
-  toc = time.perf_counter()
-  return iinner, toc - tic
-
-def construct_casscf_object(geometry_file: str, basis='sto-6g'):
-  molecule = gto.M(atom=geometry_file,
-                   basis=basis,
-                   spin=0,
-                   symmetry=True)
-  molecule.verbose = 0
-
-  hartree_fock = molecule.RHF()
-  n_states = 2
-  weights = np.ones(n_states) / n_states
-  casscf = hartree_fock.CASSCF(ncas=6, nelecas=6).state_average(weights)
-  casscf.conv_tol = 1e-8
-  return casscf
+  conv, _, imacro, imicro, iinner, _, _, _, _ = casscf.kernel(mo)
+  casscf_time = time.perf_counter() - tic
+
+  return {'method': key, 'geometry_file': geometry_file, 'conv': bool(conv),
+          'imacro': int(imacro), 'imicro': int(imicro), 'iinner': int(iinner),
+          'setup_time': setup_time, 'guess_time': guess_time, 'casscf_time': casscf_time,
+          'total_time': setup_time + guess_time + casscf_time}
+
+
+def benchmark_guess_methods(geometry_files: List[str],
+                            model_paths: Dict[str, Optional[str]],
+                            basis: str,
+                            n_warmup: int = 1,
+                            n_repeats: int = 3) -> List[Dict]:
+  records = []
+  for key, model_path in model_paths.items():
+    # warmup loads models and initializes libraries, it is not recorded
+    for _ in range(n_warmup):
+      time_guess_method(key, model_path, geometry_files[0], basis)
+
+    for geometry_file in geometry_files:
+      for repeat in range(n_repeats):
+        record = time_guess_method(key, model_path, geometry_file, basis)
+        record['repeat'] = repeat
+        records.append(record)
+        print(f"{key} {geometry_file} [{repeat}]: guess {record['guess_time']:.3f} s, casscf {record['casscf_time']:.3f} s, "
+              f"iterations {record['imacro']} - {record['imicro']} - {record['iinner']}")
+  return records
+
+
+def summarize_records(records: List[Dict]) -> List[Dict]:
+  summaries = []
+  for key in dict.fromkeys(record['method'] for record in records):
+    method_records = [record for record in records if record['method'] == key]
+    summary = {'method': key, 'n_runs': len(method_records),
+               'converged_fraction': float(np.mean([record['conv'] for record in method_records]))}
+    for timing in TIMINGS:
+      values = np.array([record[timing] for record in method_records])
+      summary[f'{timing}_median'] = float(np.median(values))
+      summary[f'{timing}_p95'] = float(np.percentile(values, 95))
+    for iterations in ITERATIONS:
+      values = np.array([record[iterations] for record in method_records])
+      summary[f'{iterations}_mean'] = float(np.mean(values))
+      summary[f'{iterations}_median'] = float(np.median(values))
+    summaries.append(summary)
+  return summaries
+
+
+def write_benchmark_results(output_prefix: str, records: List[Dict], summaries: List[Dict], settings: Dict) -> None:
+  with open(output_prefix + '.json', 'w') as f:
+    json.dump({'settings': settings, 'summary': summaries, 'records': records}, f, indent=2)
+
+  with open(output_prefix + '.csv', 'w', newline='') as f:
+    writer = csv.DictWriter(f, fieldnames=list(summaries[0].keys()))
+    writer.writeheader()
+    writer.writerows(summaries)
+
 
 if __name__ == "__main__":
   base_dir = os.environ['base_dir']
-  geometry_file: str = base_dir + 'geometries/geom_scan_200/geometry_197.xyz'
-  F_model = './checkpoints/' + 'gs200_sto_6g_F' + '.pt'
-  basis = 'sto_6g'
 
-  _, mo = compute_ao_min_orbitals('', geometry_file, 'sto_6g')
-  for _ in range(4):
-    print(run_casscf_calculation((geometry_file, basis, mo)))
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--geometry_folder', type=str)
+  parser.add_argument('--split_name', type=str, default=None)
+  parser.add_argument('--n_geometries', type=int, default=None)
+  parser.add_argument('--methods', type=str, nargs='+', default=['ao_min', 'huckel', 'ML-F'])
+  parser.add_argument('--mo_model', type=str, default=None)
+  parser.add_argument('--F_model', type=str, default=None)
+  parser.add_argument('--phisnet_model', type=str, default=None)
+  parser.add_argument('--basis', type=str)
+  parser.add_argument('--n_warmup', type=int, default=1)
+  parser.add_argument('--n_repeats', type=int, default=3)
+  parser.add_argument('--output', type=str, default='./timing_benchmark')
+  args = parser.parse_args()
+
+  model_files = {
+    'ML-MO': args.mo_model,
+    'ML-F': args.F_model,
+    'phisnet': args.phisnet_model,
+  }
+  model_paths = {key: None if model_files.get(key) is None else './checkpoints/' + model_files[key] + '.pt' for key in args.methods}
+
+  geometry_files = find_all_geometry_files_in_folder(base_dir + args.geometry_folder)
+  geometry_files = sort_geometry_files_by_idx(geometry_files)
+  if args.split_name is not None:
+    geometry_files = np.array(geometry_files)[np.load('./data_storage/' + args.split_name)['test_idx']].tolist()
+  if args.n_geometries is not None:
+    geometry_files = geometry_files[:args.n_geometries]
 
-  print('\n\n')
+  records = benchmark_guess_methods(geometry_files, model_paths, args.basis, args.n_warmup, args.n_repeats)
+  summaries = summarize_records(records)
+  write_benchmark_results(args.output, records, summaries, settings=vars(args))
 
-  _, mo = compute_F_model_orbitals(F_model, geometry_file, basis)
-  for _ in range(4):
-    print(run_casscf_calculation((geometry_file, basis, mo)))
\ No newline at end of file
+  print(f'{"method":>10} {"guess median/p95 (s)":>22} {"casscf median/p95 (s)":>23} {"total median/p95 (s)":>22} {"imacro":>7} {"conv":>5}')
+  for summary in summaries:
+    print(f"{summary['method']:>10} {summary['guess_time_median']:>10.3f} / {summary['guess_time_p95']:<9.3f} "
+          f"{summary['casscf_time_median']:>11.3f} / {summary['casscf_time_p95']:<9.3f} "
+          f"{summary['total_time_median']:>10.3f} / {summary['total_time_p95']:<9.3f} "
+          f"{summary['imacro_mean']:>7.2f} {summary['converged_fraction']:>5.2f}")
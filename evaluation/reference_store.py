@@ -0,0 +1,96 @@
+import os
+from typing import Dict, Optional, Tuple
+import numpy as np
+from ase.db import connect
+
+from data.utils import CasscfResult, check_and_create_folder, get_geometry_hash, hash_geometry
+from evaluation import compute_reference_casscf_result
+
+
+def normalize_basis(basis: str) -> str:
+  return basis.lower().replace('-', '_')
+
+
+class ReferenceStore:
+  """
+  Converged SA-CASSCF reference results, keyed by geometry hash and basis. Results are looked up in the
+  store folder, in registered CASSCF output folders (CasscfResult .npz files) and ASE databases, and are
+  only computed, and persisted to the store folder, when missing or not converged. ASE databases hold no
+  total energies, so they only serve orbital lookups.
+  """
+  def __init__(self, store_folder: str = './data_storage/casscf_references/') -> None:
+    self.store_folder = store_folder
+    self.hits = 0
+    self.misses = 0
+    # (hash, basis) -> .npz path / (db path, row id)
+    self._npz_files: Dict[Tuple[str, str], str] = {}
+    self._db_rows: Dict[Tuple[str, str], Tuple[str, int]] = {}
+    self._results: Dict[Tuple[str, str], CasscfResult] = {}
+
+    if os.path.isdir(store_folder):
+      for file in os.listdir(store_folder):
+        if file.endswith('.npz'):
+          basis, geometry_hash = file[:-len('.npz')].rsplit('__', 1)
+          self._npz_files[(geometry_hash, basis)] = os.path.join(store_folder, file)
+
+  def add_output_folder(self, geometry_folder: str, output_folder: str, basis: str) -> None:
+    """ Registers the results of a CASSCF campaign, .npz files are matched to geometries by file name """
+    for file in os.listdir(output_folder):
+      geometry_file = os.path.join(geometry_folder, file.replace('.npz', '.xyz'))
+      if file.endswith('.npz') and os.path.exists(geometry_file):
+        key = (get_geometry_hash(geometry_file), normalize_basis(basis))
+        self._npz_files.setdefault(key, os.path.join(output_folder, file))
+
+  def add_database(self, db_path: str, basis: str) -> None:
+    with connect(db_path) as conn:
+      for row in conn.select():
+        key = (hash_geometry(list(row.symbols), row.positions), normalize_basis(basis))
+        self._db_rows.setdefault(key, (db_path, row.id))
+
+  def _get_result(self, geometry_path: str, basis: str, require_energy: bool) -> CasscfResult:
+    key = (get_geometry_hash(geometry_path), normalize_basis(basis))
+    result = self._results.get(key)
+    # an orbitals-only database result does not answer energy lookups
+    if result is not None and (result.e_tot is not None or not require_energy):
+      self.hits += 1
+      return result
+
+    result = None
+    if key in self._npz_files:
+      result = CasscfResult.load_from_npz(self._npz_files[key])
+      # non-converged campaign points are no reference, they are recomputed
+      if not bool(result.converged):
+        result = None
+    if result is None and key in self._db_rows and not require_energy:
+      db_path, row_id = self._db_rows[key]
+      with connect(db_path) as conn:
+        data = conn.get(id=row_id).data
+      n = int(np.sqrt(len(data['mo_coeffs'])))
+      # orbitals only, see class docstring
+      result = CasscfResult(converged=True, basis=basis, e_tot=None,
+                            mo_energies=data.get('mo_energies'), mo_coeffs=data['mo_coeffs'].reshape(n, n),
+                            S=data['S'].reshape(n, n) if 'S' in data else None,
+                            F=data['F'].reshape(n, n) if 'F' in data else None, imacro=None)
+
+    if result is not None:
+      self.hits += 1
+    else:
+      self.misses += 1
+      result = compute_reference_casscf_result(geometry_path, basis)
+      check_and_create_folder(self.store_folder)
+      path = os.path.join(self.store_folder, f'{key[1]}__{key[0]}.npz')
+      result.store_as_npz(path)
+      self._npz_files[key] = path
+
+    self._results[key] = result
+    return result
+
+  def get_casscf_energy(self, geometry_path: str, basis: str) -> float:
+    return float(self._get_result(geometry_path, basis, require_energy=True).e_tot)
+
+  def get_converged_orbitals(self, geometry_path: str, basis: str) -> Tuple[np.ndarray, np.ndarray]:
+    result = self._get_result(geometry_path, basis, require_energy=False)
+    return np.asarray(result.mo_energies), np.asarray(result.mo_coeffs)
+
+  def stats(self) -> Dict[str, int]:
+    return {'hits': self.hits, 'misses': self.misses, 'known': len(set(self._npz_files) | set(self._db_rows))}
@@ -1,4 +1,4 @@
-from evaluation.utils import compute_F_model_orbitals, compute_ao_min_orbitals, compute_converged_casscf_orbitals, compute_huckel_orbitals, compute_mo_model_orbitals
+from evaluation import compute_F_model_orbitals, compute_ao_min_orbitals, compute_converged_casscf_orbitals, compute_huckel_orbitals, compute_mo_model_orbitals, get_molecule_context
 from pyscf import gto
 from pyscf.tools import molden
 import numpy as np
@@ -19,10 +19,7 @@ def write_orbitals_to_molden(molden_file: str,
                              orbitals: np.ndarray, 
                              energies: np.ndarray) -> None:
 
-  molecule = gto.M(atom=geometry_file,
-                   basis=basis,
-                   spin=0,
-                   symmetry=True)
+  molecule = get_molecule_context(geometry_file, basis).molecule
 
   with open(molden_file, 'w') as f:
       molden.header(molecule, f)
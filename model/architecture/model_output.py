@@ -8,7 +8,22 @@ from torchmetrics import Metric
 import schnetpack as spk
 import schnetpack.nn as snn
 
+def upper_triangle_index(basis_set_size: int) -> torch.Tensor:
+    """
+    (n, n) map from matrix element to its position in the row-major upper triangle of length n(n+1)/2,
+    so that values[..., index] scatters upper-triangular values into a symmetric matrix.
+    """
+    rows, cols = torch.triu_indices(basis_set_size, basis_set_size)
+    index = torch.zeros(basis_set_size, basis_set_size, dtype=torch.long)
+    index[rows, cols] = torch.arange(rows.shape[0])
+    index[cols, rows] = torch.arange(rows.shape[0])
+    return index
+
+
 class MatrixOutput(nn.Module):
+    # class level defaults for models pickled before the options existed
+    symmetric = False
+    n_atoms_fixed = None
 
     def __init__(
         self,
@@ -20,6 +35,8 @@ class MatrixOutput(nn.Module):
         n_layers: int = 2,
         aggregation_mode: str = 'sum',
         activation: Callable = F.silu,
+        symmetric: bool = False,
+        n_atoms_fixed: Optional[int] = None,
     ):
         """
         Args:
@@ -32,8 +49,14 @@ class MatrixOutput(nn.Module):
             n_layers: number of layers.
             activation: activation function
             polarizability_key: the key under which the predicted polarizability will be stored
+            symmetric: only predict the n(n+1)/2 upper-triangular elements (n_out is set accordingly)
+                and scatter them into a symmetric matrix. Only for symmetric targets such as F or S.
+            n_atoms_fixed: number of atoms of every molecule, if all molecules have the same composition.
+                Atom contributions are then summed by a reshape instead of a scatter over idx_m.
         """
         super(MatrixOutput, self).__init__()
+        if symmetric:
+            n_out = basis_set_size * (basis_set_size + 1) // 2
         self.n_in = n_in
         self.n_out = n_out
         self.n_layers = n_layers
@@ -41,6 +64,10 @@ class MatrixOutput(nn.Module):
         self.output_key = output_key
         self.model_outputs = [output_key]
         self.basis_set_size = basis_set_size
+        self.symmetric = symmetric
+        self.n_atoms_fixed = n_atoms_fixed
+        if symmetric:
+            self.register_buffer('triu_index', upper_triangle_index(basis_set_size))
 
         self.aggregation_mode = aggregation_mode
 
@@ -56,6 +83,16 @@ class MatrixOutput(nn.Module):
         self.requires_dr = False
         self.requires_stress = False
 
+    def _aggregate(self, l0, inputs):
+        if self.n_atoms_fixed is not None:
+            # static shapes, no scatter and no device sync on idx_m
+            l0 = l0.reshape(-1, self.n_atoms_fixed, l0.shape[-1]).sum(dim=1)
+        else:
+            # number of molecules from a shape, so that it stays symbolic when the model is traced
+            maxm = inputs[spk.properties.n_atoms].shape[0]
+            l0 = snn.scatter_add(l0, inputs[spk.properties.idx_m], dim_size=maxm)
+        return torch.squeeze(l0, -1)
+
     def forward(self, inputs):
         l0 = inputs["scalar_representation"]
         l1 = inputs["vector_representation"]
@@ -63,19 +100,22 @@ class MatrixOutput(nn.Module):
         l0, l1 = self.outnet((l0, l1))
 
         if self.aggregation_mode is not None:
-            idx_m = inputs[spk.properties.idx_m]
-            maxm = int(idx_m[-1]) + 1
-            l0 = snn.scatter_add(l0, idx_m, dim_size=maxm)
-            l0 = torch.squeeze(l0, -1)
+            l0 = self._aggregate(l0, inputs)
 
             if self.aggregation_mode == "avg":
                 l0 = l0 / inputs[spk.properties.n_atoms]
 
+        if self.symmetric:
+            l0 = l0.reshape(-1, self.n_out)[:, self.triu_index]
+
         inputs[self.output_key] = l0.reshape(-1)
         return inputs
 
 
 class HamiltonianOutput(nn.Module):
+    # class level defaults for models pickled before the options existed
+    symmetric = False
+    n_atoms_fixed = None
 
     def __init__(
         self,
@@ -87,6 +127,8 @@ class HamiltonianOutput(nn.Module):
         n_layers: int = 2,
         aggregation_mode: str = 'sum',
         activation: Callable = F.silu,
+        symmetric: bool = False,
+        n_atoms_fixed: Optional[int] = None,
     ):
         """
         Args:
@@ -99,8 +141,14 @@ class HamiltonianOutput(nn.Module):
             n_layers: number of layers.
             activation: activation function
             polarizability_key: the key under which the predicted polarizability will be stored
+            symmetric: only predict the n(n+1)/2 upper-triangular elements (n_out is set accordingly)
+                and scatter them into a symmetric matrix. Only for symmetric targets such as F or S.
+            n_atoms_fixed: number of atoms of every molecule, if all molecules have the same composition.
+                Atom contributions are then summed by a reshape instead of a scatter over idx_m.
         """
         super(HamiltonianOutput, self).__init__()
+        if symmetric:
+            n_out = basis_set_size * (basis_set_size + 1) // 2
         self.n_in = n_in
         self.n_out = n_out
         self.n_layers = n_layers
@@ -108,6 +156,10 @@ class HamiltonianOutput(nn.Module):
         self.output_key = output_key
         self.model_outputs = [output_key]
         self.basis_set_size = basis_set_size
+        self.symmetric = symmetric
+        self.n_atoms_fixed = n_atoms_fixed
+        if symmetric:
+            self.register_buffer('triu_index', upper_triangle_index(basis_set_size))
 
         self.aggregation_mode = aggregation_mode
 
@@ -123,6 +175,16 @@ class HamiltonianOutput(nn.Module):
         self.requires_dr = False
         self.requires_stress = False
 
+    def _aggregate(self, l0, inputs):
+        if self.n_atoms_fixed is not None:
+            # static shapes, no scatter and no device sync on idx_m
+            l0 = l0.reshape(-1, self.n_atoms_fixed, l0.shape[-1]).sum(dim=1)
+        else:
+            # number of molecules from a shape, so that it stays symbolic when the model is traced
+            maxm = inputs[spk.properties.n_atoms].shape[0]
+            l0 = snn.scatter_add(l0, inputs[spk.properties.idx_m], dim_size=maxm)
+        return torch.squeeze(l0, -1)
+
     def forward(self, inputs):
         l0 = inputs["scalar_representation"]
         l1 = inputs["vector_representation"]
@@ -130,17 +192,137 @@ class HamiltonianOutput(nn.Module):
         l0, l1 = self.outnet((l0, l1))
 
         if self.aggregation_mode is not None:
-            idx_m = inputs[spk.properties.idx_m]
-            maxm = int(idx_m[-1]) + 1
-            l0 = snn.scatter_add(l0, idx_m, dim_size=maxm)
-            l0 = torch.squeeze(l0, -1)
+            l0 = self._aggregate(l0, inputs)
 
             if self.aggregation_mode == "avg":
                 l0 = l0 / inputs[spk.properties.n_atoms]
 
-        H = l0.reshape(-1, self.basis_set_size, self.basis_set_size)
-        H = H + torch.transpose(H, -1, -2)
+        if self.symmetric:
+            H = l0.reshape(-1, self.n_out)[:, self.triu_index]
+        else:
+            H = l0.reshape(-1, self.basis_set_size, self.basis_set_size)
+            H = H + torch.transpose(H, -1, -2)
         H = H.reshape(-1)
 
         inputs[self.output_key] = H
-        return inputs
\ No newline at end of file
+        return inputs
+
+class AtomPairHamiltonianOutput(nn.Module):
+
+    def __init__(
+        self,
+        output_key: str,
+        n_in: int,
+        basis_set_size: int,
+        orbitals_per_element: Dict[int, int],
+        n_hidden: Optional[Union[int, Sequence[int]]] = None,
+        n_layers: int = 2,
+        n_rbf: int = 20,
+        cutoff: float = 5.0,
+        activation: Callable = F.silu,
+        atomic_numbers: Optional[Sequence[int]] = None,
+    ):
+        """
+        Builds the matrix from atom blocks instead of predicting it as one global vector. Every atom predicts
+        its on-site block from its scalar representation and every neighbour-list edge (i, j) predicts the
+        off-site block coupling the orbitals of atom i to those of atom j from both representations and the
+        interatomic distance. Blocks are placed at the AO offsets of the atoms (AOs ordered atom by atom, as
+        in PySCF) and the result is symmetrized, so compute scales with the number of atom pairs.
+
+        Args:
+            n_in: input dimension of representation
+            basis_set_size: number of basis functions of the (fixed) molecule
+            orbitals_per_element: number of basis functions of every element, keyed by atomic number
+            n_hidden: size of hidden layers of the block networks.
+            n_layers: number of layers of the block networks.
+            n_rbf: number of radial basis functions of the pair distance
+            cutoff: cutoff radius, off-site blocks are smoothly switched off towards it
+            activation: activation function
+            atomic_numbers: atomic numbers of the molecule, to check orbitals_per_element against basis_set_size
+        """
+        super(AtomPairHamiltonianOutput, self).__init__()
+        if atomic_numbers is not None:
+            missing = sorted({int(Z) for Z in atomic_numbers} - set(orbitals_per_element.keys()))
+            if missing:
+                raise ValueError(f'orbitals_per_element has no entry for atomic numbers {missing}')
+            n_basis_functions = sum(orbitals_per_element[int(Z)] for Z in atomic_numbers)
+            if n_basis_functions != basis_set_size:
+                raise ValueError(f'orbitals_per_element gives {n_basis_functions} basis functions for the molecule, '
+                                 f'but basis_set_size is {basis_set_size}')
+        self.n_in = n_in
+        self.output_key = output_key
+        self.model_outputs = [output_key]
+        self.basis_set_size = basis_set_size
+        self.max_orbitals = max(orbitals_per_element.values())
+
+        n_orbitals = torch.zeros(max(orbitals_per_element.keys()) + 1, dtype=torch.long)
+        for Z, n in orbitals_per_element.items():
+            n_orbitals[Z] = n
+        self.register_buffer('n_orbitals', n_orbitals)
+
+        self.onsite_net = spk.nn.build_mlp(
+            n_in=n_in,
+            n_out=self.max_orbitals**2,
+            n_hidden=n_hidden,
+            n_layers=n_layers,
+            activation=activation,
+        )
+        self.pair_net = spk.nn.build_mlp(
+            n_in=2 * n_in + n_rbf,
+            n_out=self.max_orbitals**2,
+            n_hidden=n_hidden,
+            n_layers=n_layers,
+            activation=activation,
+        )
+        self.radial_basis = snn.GaussianRBF(n_rbf=n_rbf, cutoff=cutoff)
+        self.cutoff_fn = snn.CosineCutoff(cutoff)
+
+        self.requires_dr = False
+        self.requires_stress = False
+
+    def _block_indices(self, idx_m, ao_offset_i, ao_offset_j, n_orbitals_i, n_orbitals_j):
+        """
+        Flat indices into the (n_molecules * n * n) output of all elements of a set of (padded) blocks,
+        together with the mask of elements that fall inside the actual block
+        """
+        n = self.basis_set_size
+        a = torch.arange(self.max_orbitals, device=idx_m.device)
+        rows = ao_offset_i[:, None, None] + a[None, :, None]
+        cols = ao_offset_j[:, None, None] + a[None, None, :]
+        mask = (a[None, :, None] < n_orbitals_i[:, None, None]) & (a[None, None, :] < n_orbitals_j[:, None, None])
+        flat_idx = idx_m[:, None, None] * n * n + rows * n + cols
+        return flat_idx[mask], mask
+
+    def forward(self, inputs):
+        l0 = inputs["scalar_representation"]
+        Z = inputs[spk.properties.Z]
+        idx_m = inputs[spk.properties.idx_m]
+        idx_i = inputs[spk.properties.idx_i]
+        idx_j = inputs[spk.properties.idx_j]
+        n_molecules = inputs[spk.properties.n_atoms].shape[0]
+
+        # AO offset of every atom within its molecule
+        n_orbitals = self.n_orbitals[Z]
+        ao_start = torch.cumsum(n_orbitals, dim=0) - n_orbitals
+        first_atom = torch.cumsum(inputs[spk.properties.n_atoms], dim=0) - inputs[spk.properties.n_atoms]
+        ao_offset = ao_start - ao_start[first_atom][idx_m]
+
+        # on-site blocks
+        onsite_blocks = self.onsite_net(l0).reshape(-1, self.max_orbitals, self.max_orbitals)
+        onsite_idx, onsite_mask = self._block_indices(idx_m, ao_offset, ao_offset, n_orbitals, n_orbitals)
+
+        # off-site blocks of neighbour-list pairs
+        d_ij = torch.norm(inputs[spk.properties.Rij], dim=1)
+        pair_features = torch.cat([l0[idx_i], l0[idx_j], self.radial_basis(d_ij)], dim=-1)
+        pair_blocks = self.pair_net(pair_features) * self.cutoff_fn(d_ij)[:, None]
+        pair_blocks = pair_blocks.reshape(-1, self.max_orbitals, self.max_orbitals)
+        pair_idx, pair_mask = self._block_indices(idx_m[idx_i], ao_offset[idx_i], ao_offset[idx_j], n_orbitals[idx_i], n_orbitals[idx_j])
+
+        H = l0.new_zeros(n_molecules * self.basis_set_size**2)
+        H = H.index_add(0, onsite_idx, onsite_blocks[onsite_mask])
+        H = H.index_add(0, pair_idx, pair_blocks[pair_mask])
+
+        H = H.reshape(-1, self.basis_set_size, self.basis_set_size)
+        H = 0.5 * (H + torch.transpose(H, -1, -2))
+        inputs[self.output_key] = H.reshape(-1)
+        return inputs
@@ -0,0 +1,98 @@
+"""
+Benchmark of _atoms_collate_fn against the original key-by-key collate function on fulvene-sized samples
+"""
+import argparse
+import time
+from typing import Dict, List
+import torch
+
+import schnetpack.properties as structure
+
+from model.data_loader import CollateBuffers, _atoms_collate_fn
+
+
+def reference_atoms_collate_fn(batch):
+    elem = batch[0]
+    idx_keys = {structure.idx_i, structure.idx_j, structure.idx_i_triples}
+    idx_triple_keys = {structure.idx_j_triples, structure.idx_k_triples}
+
+    coll_batch = {}
+    for key in elem:
+        if (key not in idx_keys) and (key not in idx_triple_keys):
+            coll_batch[key] = torch.cat([d[key] for d in batch], 0)
+        elif key in idx_keys:
+            coll_batch[key + "_local"] = torch.cat([d[key] for d in batch], 0)
+
+    seg_m = torch.cumsum(coll_batch[structure.n_atoms], dim=0)
+    seg_m = torch.cat([torch.zeros((1,), dtype=seg_m.dtype), seg_m], dim=0)
+    idx_m = torch.repeat_interleave(
+        torch.arange(len(batch)), repeats=coll_batch[structure.n_atoms], dim=0
+    )
+    coll_batch[structure.idx_m] = idx_m
+
+    for key in idx_keys:
+        if key in elem.keys():
+            coll_batch[key] = torch.cat(
+                [d[key] + off for d, off in zip(batch, seg_m)], 0
+            )
+
+    for key in idx_triple_keys:
+        if key in elem.keys():
+            indices = []
+            offset = 0
+            for idx, d in enumerate(batch):
+                indices.append(d[key] + offset)
+                offset += d[structure.idx_j].shape[0]
+            coll_batch[key] = torch.cat(indices, 0)
+
+    return coll_batch
+
+
+def random_sample(idx: int, n_atoms: int = 12, basis_set_size: int = 36, with_triples: bool = False) -> Dict[str, torch.Tensor]:
+    """ Sample with the keys of a fully connected molecule, as produced by ASEAtomsData + neighbour list """
+    idx_i, idx_j = torch.where(~torch.eye(n_atoms, dtype=torch.bool))
+    sample = {
+        structure.idx: torch.tensor([idx]),
+        structure.n_atoms: torch.tensor([n_atoms]),
+        structure.Z: torch.randint(1, 7, (n_atoms,)),
+        structure.R: torch.randn(n_atoms, 3),
+        structure.cell: torch.zeros(1, 3, 3),
+        structure.pbc: torch.zeros(3, dtype=torch.bool),
+        structure.idx_i: idx_i,
+        structure.idx_j: idx_j,
+        structure.offsets: torch.zeros(len(idx_i), 3),
+        'F': torch.randn(basis_set_size**2),
+    }
+    if with_triples:
+        n_pairs = len(idx_i)
+        sample[structure.idx_i_triples] = torch.randint(0, n_atoms, (2 * n_pairs,))
+        sample[structure.idx_j_triples] = torch.randint(0, n_pairs, (2 * n_pairs,))
+        sample[structure.idx_k_triples] = torch.randint(0, n_pairs, (2 * n_pairs,))
+    return sample
+
+
+def time_collate(collate_fn, batch: List[Dict[str, torch.Tensor]], repeats: int) -> float:
+    collate_fn(batch)
+    tic = time.perf_counter()
+    for _ in range(repeats):
+        collate_fn(batch)
+    return (time.perf_counter() - tic) / repeats
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--batch_sizes', type=int, nargs='+', default=[16, 32, 64, 128, 256])
+  parser.add_argument('--repeats', type=int, default=200)
+  parser.add_argument('--with_triples', action='store_true')
+  args = parser.parse_args()
+
+  torch.manual_seed(0)
+  torch.set_num_threads(1)
+  buffers = CollateBuffers()
+  print(f'{"batch":>6} {"reference (ms)":>15} {"vectorized (ms)":>16} {"buffered (ms)":>14} {"speedup":>8}')
+  for batch_size in args.batch_sizes:
+    batch = [random_sample(idx, with_triples=args.with_triples) for idx in range(batch_size)]
+    t_reference = time_collate(reference_atoms_collate_fn, batch, args.repeats)
+    t_vectorized = time_collate(_atoms_collate_fn, batch, args.repeats)
+    t_buffered = time_collate(lambda b: _atoms_collate_fn(b, buffers=buffers), batch, args.repeats)
+    print(f'{batch_size:>6} {1e3 * t_reference:>15.3f} {1e3 * t_vectorized:>16.3f} {1e3 * t_buffered:>14.3f} {t_reference / min(t_vectorized, t_buffered):>8.2f}')
@@ -1,10 +1,62 @@
-from typing import Callable
+from typing import Callable, Dict, List, Optional, Sequence
 import torch
 import schnetpack as spk
-from model.architecture.model_output import HamiltonianOutput, MatrixOutput
+from model.architecture.model_output import AtomPairHamiltonianOutput, HamiltonianOutput, MatrixOutput
 from schnetpack import ModelOutput
 
 from torch.optim.lr_scheduler import _LRScheduler
+
+# number of basis functions per atomic number, AOs of a molecule are ordered atom by atom
+ORBITALS_PER_ELEMENT = {
+    'sto_6g': {1: 1, 6: 5},
+    'ANO-S-MB': {1: 1, 6: 5},
+    'cc-pVDZ': {1: 5, 6: 14},
+}
+
+def get_orbitals_per_element(basis_set_size: int, atomic_numbers: Sequence[int]) -> Dict[int, int]:
+    """ the map of ORBITALS_PER_ELEMENT that gives basis_set_size basis functions for the molecule """
+    for orbitals_per_element in ORBITALS_PER_ELEMENT.values():
+        if all(int(Z) in orbitals_per_element for Z in atomic_numbers) and \
+           sum(orbitals_per_element[int(Z)] for Z in atomic_numbers) == basis_set_size:
+            return orbitals_per_element
+    raise ValueError(f'No basis in ORBITALS_PER_ELEMENT has {basis_set_size} basis functions for this molecule, pass orbitals_per_element')
+
+class OverlapWeightedModelOutput(ModelOutput):
+    """
+    ModelOutput for losses that also take the AO overlap matrices of the batch, loss_fn(pred, target, S),
+    e.g. overlap_weighted_mse. The task only collects the target properties of its outputs from the batch,
+    so S needs an output of its own, see get_overlap_outputs.
+    """
+    def __init__(self, *args, overlap_property: str = 'S', **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.overlap_property = overlap_property
+
+    def calculate_loss(self, pred, target):
+        if self.loss_weight == 0 or self.loss_fn is None:
+            return 0.0
+
+        return self.loss_weight * self.loss_fn(
+            pred[self.name], target[self.target_property], target[self.overlap_property]
+        )
+
+def get_overlap_outputs(output_property_key: str, loss_function: Callable, overlap_property: str) -> List[ModelOutput]:
+    return [
+        OverlapWeightedModelOutput(
+            name=output_property_key,
+            loss_fn=loss_function,
+            loss_weight=1.0,
+            metrics={},
+            overlap_property=overlap_property
+        ),
+        # no loss and no metrics, only makes the task pass the overlap matrices of the batch on as a target
+        ModelOutput(
+            name=overlap_property,
+            loss_fn=None,
+            loss_weight=0.0,
+            metrics={}
+        )
+    ]
+
 class NoamLR(_LRScheduler):
     """
     Implements the Noam Learning rate schedule. This corresponds to increasing the learning rate
@@ -29,7 +81,14 @@ def create_orbital_model(loss_function: Callable,
                          lr: float = 5e-4,
                          output_property_key: str = 'F',
                          basis_set_size: int = 36,
-                         cutoff: float = 5.0):
+                         cutoff: float = 5.0,
+                         symmetric_output: bool = False,
+                         atom_pair_output: bool = False,
+                         orbitals_per_element: Optional[Dict[int, int]] = None,
+                         n_atoms_fixed: Optional[int] = None,
+                         basis: Optional[str] = None,
+                         overlap_property: Optional[str] = None,
+                         atomic_numbers: Optional[Sequence[int]] = None):
 
     pairwise_distance = spk.atomistic.PairwiseDistances()
     representation = spk.representation.PaiNN(
@@ -38,13 +97,33 @@ def create_orbital_model(loss_function: Callable,
         radial_basis=spk.nn.GaussianRBF(n_rbf=20, cutoff=cutoff),
         cutoff_fn=spk.nn.CosineCutoff(cutoff)
     )
-    if output_property_key == 'F':
+    if output_property_key == 'F' and atom_pair_output:
+        # the blocks are laid out for the atoms of the molecule in the dataset, in their order
+        if atomic_numbers is None:
+            raise ValueError('atom_pair_output needs the atomic_numbers of the molecule, see get_first_atomic_numbers')
+        if orbitals_per_element is None:
+            if basis is not None:
+                orbitals_per_element = ORBITALS_PER_ELEMENT[basis]
+            else:
+                orbitals_per_element = get_orbitals_per_element(basis_set_size, atomic_numbers)
+        pred_module = AtomPairHamiltonianOutput(
+            output_key=output_property_key,
+            n_in=representation.n_atom_basis,
+            basis_set_size=basis_set_size,
+            orbitals_per_element=orbitals_per_element,
+            n_layers=2,
+            cutoff=cutoff,
+            atomic_numbers=atomic_numbers
+        )
+    elif output_property_key == 'F':
         pred_module = HamiltonianOutput(
             output_key=output_property_key,
             n_in=representation.n_atom_basis,
             n_layers=2,
             n_out=basis_set_size**2,
-            basis_set_size=basis_set_size
+            basis_set_size=basis_set_size,
+            symmetric=symmetric_output,
+            n_atoms_fixed=n_atoms_fixed
         )
     else:
         pred_module = MatrixOutput(
@@ -52,7 +131,9 @@ def create_orbital_model(loss_function: Callable,
             n_in=representation.n_atom_basis,
             n_layers=2,
             n_out=basis_set_size**2,
-            basis_set_size=basis_set_size
+            basis_set_size=basis_set_size,
+            symmetric=symmetric_output,
+            n_atoms_fixed=n_atoms_fixed
         )
     nnp = spk.model.NeuralNetworkPotential(
         representation=representation,
@@ -60,17 +141,21 @@ def create_orbital_model(loss_function: Callable,
         output_modules=[pred_module],
     )
 
-    output = ModelOutput(
-        name=output_property_key,
-        loss_fn=loss_function,
-        loss_weight=1.0,
-        metrics={}
-    )
+    if overlap_property is not None:
+        # loss_function(pred, target, S), the dataset has to load overlap_property
+        outputs = get_overlap_outputs(output_property_key, loss_function, overlap_property)
+    else:
+        outputs = [ModelOutput(
+            name=output_property_key,
+            loss_fn=loss_function,
+            loss_weight=1.0,
+            metrics={}
+        )]
 
     # Putting it in the Atomistic Task framework
     task = spk.AtomisticTask(
         model=nnp,
-        outputs=[output],
+        outputs=outputs,
         optimizer_cls=torch.optim.Adam,
         optimizer_args={"lr": lr},
         # scheduler_cls=torch.optim.lr_scheduler.ReduceLROnPlateau,
@@ -13,53 +13,117 @@ def _default_collate_fn(batch):
         coll_batch[key] = torch.stack([d[key] for d in batch])
     return coll_batch
 
-def _atoms_collate_fn(batch):
+class CollateBuffers:
+    """
+    Reusable output storage for _atoms_collate_fn, every key keeps one tensor whose storage grows to the
+    largest batch seen. A collated batch is only valid until the next call using the same buffers,
+    so these should only be used with num_workers=0 and without holding on to previous batches.
+    """
+
+    def __init__(self):
+        self._storage = {}
+
+    def get(self, key: str, dtype: torch.dtype) -> torch.Tensor:
+        buffer = self._storage.get(key)
+        if buffer is None or buffer.dtype != dtype:
+            buffer = torch.empty(0, dtype=dtype)
+            self._storage[key] = buffer
+        # shrinking to zero keeps the storage, the out= argument of the caller resizes it without reallocating
+        return buffer.resize_(0)
+
+
+def _atoms_collate_fn(batch, buffers: Optional[CollateBuffers] = None):
     """
     Build batch from systems and properties & apply padding
 
     Args:
         examples (list):
+        buffers (CollateBuffers): optional preallocated output buffers
 
     Returns:
         dict[str->torch.Tensor]: mini-batch of atomistic systems
     """
-    # print(batch[0][properties.Z].shape)
-
     elem = batch[0]
     idx_keys = {structure.idx_i, structure.idx_j, structure.idx_i_triples}
-    # Atom triple indices must be treated separately
+    # Atom triple indices are shifted by the number of pairs instead of atoms
     idx_triple_keys = {structure.idx_j_triples, structure.idx_k_triples}
 
+    def collate(buffer_key, values):
+        if buffers is None:
+            return torch.cat(values, 0)
+        return torch.cat(values, 0, out=buffers.get(buffer_key, values[0].dtype))
+
     coll_batch = {}
+    local_indices = {}
+    counts = {}
     for key in elem:
-        if (key not in idx_keys) and (key not in idx_triple_keys):
-            coll_batch[key] = torch.cat([d[key] for d in batch], 0)
-        elif key in idx_keys:
-            coll_batch[key + "_local"] = torch.cat([d[key] for d in batch], 0)
-
-    seg_m = torch.cumsum(coll_batch[structure.n_atoms], dim=0)
-    seg_m = torch.cat([torch.zeros((1,), dtype=seg_m.dtype), seg_m], dim=0)
-    idx_m = torch.repeat_interleave(
-        torch.arange(len(batch)), repeats=coll_batch[structure.n_atoms], dim=0
+        values = [d[key] for d in batch]
+        if key in idx_keys or key in idx_triple_keys:
+            local_indices[key] = collate(key + "_local", values)
+            counts[key] = torch.tensor([v.shape[0] for v in values])
+        else:
+            coll_batch[key] = collate(key, values)
+
+    n_atoms = coll_batch[structure.n_atoms]
+    coll_batch[structure.idx_m] = torch.repeat_interleave(
+        torch.arange(len(batch)), repeats=n_atoms, dim=0
     )
-    coll_batch[structure.idx_m] = idx_m
-
-    for key in idx_keys:
-        if key in elem.keys():
-            coll_batch[key] = torch.cat(
-                [d[key] + off for d, off in zip(batch, seg_m)], 0
-            )
-
-    # Shift the indices for the atom triples
-    for key in idx_triple_keys:
-        if key in elem.keys():
-            indices = []
-            offset = 0
-            for idx, d in enumerate(batch):
-                indices.append(d[key] + offset)
-                offset += d[structure.idx_j].shape[0]
-            coll_batch[key] = torch.cat(indices, 0)
-
-    # print(coll_batch[properties.Z].shape)
-
-    return coll_batch
\ No newline at end of file
+
+    # offsets of every sample's first atom / pair within the batch
+    atom_offsets = torch.cumsum(n_atoms, dim=0) - n_atoms
+    if structure.idx_j in counts:
+        n_pairs = counts[structure.idx_j]
+        pair_offsets = torch.cumsum(n_pairs, dim=0) - n_pairs
+
+    shifts = {}
+    for key, local in local_indices.items():
+        offsets = atom_offsets if key in idx_keys else pair_offsets
+        # samples share the count for keys of the same kind (e.g. idx_i / idx_j), so one shift serves both
+        count_key = (key in idx_keys, tuple(counts[key].tolist()))
+        if count_key not in shifts:
+            shifts[count_key] = torch.repeat_interleave(offsets, counts[key])
+        out = None if buffers is None else buffers.get(key, local.dtype)
+        coll_batch[key] = torch.add(local, shifts[count_key], out=out)
+        if key in idx_keys:
+            coll_batch[key + "_local"] = local
+
+    return coll_batch
+
+
+def _fixed_size_atoms_collate_fn(batch):
+    """
+    Collate for batches in which every system has the same atoms (e.g. a single molecule at different
+    geometries). Atom offsets and idx_m follow from the fixed number of atoms instead of cumulative sums,
+    only the neighbour pairs (whose number may vary with the geometry) are shifted per sample.
+
+    Returns:
+        dict[str->torch.Tensor]: mini-batch of atomistic systems, identical to _atoms_collate_fn
+    """
+    elem = batch[0]
+    idx_keys = {structure.idx_i, structure.idx_j, structure.idx_i_triples}
+    idx_triple_keys = {structure.idx_j_triples, structure.idx_k_triples}
+
+    n_atoms = elem[structure.n_atoms].item()
+    molecules = torch.arange(len(batch))
+
+    coll_batch = {}
+    counts = {}
+    for key in elem:
+        values = [d[key] for d in batch]
+        coll_batch[key] = torch.cat(values, 0)
+        if key in idx_keys or key in idx_triple_keys:
+            counts[key] = torch.tensor([v.shape[0] for v in values])
+
+    coll_batch[structure.idx_m] = torch.repeat_interleave(molecules, n_atoms)
+    atom_offsets = molecules * n_atoms
+    if structure.idx_j in counts:
+        n_pairs = counts[structure.idx_j]
+        pair_offsets = torch.cumsum(n_pairs, dim=0) - n_pairs
+
+    for key in counts:
+        offsets = atom_offsets if key in idx_keys else pair_offsets
+        local = coll_batch[key]
+        coll_batch[key] = local + torch.repeat_interleave(offsets, counts[key])
+        if key in idx_keys:
+            coll_batch[key + "_local"] = local
+    return coll_batch
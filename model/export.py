@@ -0,0 +1,118 @@
+"""
+Exports a trained orbital model (PaiNN representation + matrix output head) with torch.export to a .pt2
+program, which loads without unpickling the schnetpack objects and runs as a flat graph of tensor ops.
+TorchScript tracing is not used, as PaiNN passes the number of atoms around as a Python int, which a
+trace would fix to the batch size it was traced with.
+"""
+import argparse
+from typing import Dict
+import torch
+from torch import nn
+import schnetpack as spk
+import schnetpack.properties as structure
+from ase import io
+
+from data.casscf import EQUILIBRIUM_GEOMETRY_PATH
+
+# positional inputs of an exported model, in order
+EXPORTED_INPUT_KEYS = [
+    structure.Z,
+    structure.R,
+    structure.offsets,
+    structure.idx_i,
+    structure.idx_j,
+    structure.idx_m,
+    structure.n_atoms,
+]
+
+
+class ExportableOrbitalModel(nn.Module):
+    """
+    Tensor-in / tensor-out wrapper around a NeuralNetworkPotential, returning the flat prediction of one output key
+    """
+
+    def __init__(self, model: spk.model.NeuralNetworkPotential, output_key: str):
+        super().__init__()
+        self.input_modules = model.input_modules
+        self.representation = model.representation
+        self.output_modules = model.output_modules
+        self.output_key = output_key
+
+    def forward(self, Z, R, offsets, idx_i, idx_j, idx_m, n_atoms):
+        inputs = dict(zip(EXPORTED_INPUT_KEYS, [Z, R, offsets, idx_i, idx_j, idx_m, n_atoms]))
+        for module in self.input_modules:
+            inputs = module(inputs)
+        inputs = self.representation(inputs)
+        for module in self.output_modules:
+            inputs = module(inputs)
+        return inputs[self.output_key]
+
+
+def get_output_key(model: spk.model.NeuralNetworkPotential) -> str:
+    output_keys = [key for module in model.output_modules for key in module.model_outputs]
+    if len(output_keys) != 1:
+        raise ValueError(f'Can only export models with a single output, got {output_keys}')
+    return output_keys[0]
+
+
+def get_example_inputs(cutoff: float, device: torch.device, geometry_path: str = EQUILIBRIUM_GEOMETRY_PATH) -> Dict[str, torch.Tensor]:
+    """ Batch of two copies of a geometry, so that the traced graph contains the batch offsets """
+    converter = spk.interfaces.AtomsConverter(neighbor_list=spk.transform.ASENeighborList(cutoff=cutoff), dtype=torch.float32, device=device)
+    atoms = io.read(geometry_path)
+    return converter([atoms, atoms.copy()])
+
+
+def get_dynamic_shapes() -> Dict[str, Dict[int, torch.export.Dim]]:
+    """ Number of atoms, pairs and molecules of a batch are symbolic in the exported graph """
+    atoms = torch.export.Dim('atoms', min=2)
+    pairs = torch.export.Dim('pairs', min=2)
+    molecules = torch.export.Dim('molecules', min=1)
+    return {
+        'Z': {0: atoms},
+        'R': {0: atoms},
+        'offsets': {0: pairs},
+        'idx_i': {0: pairs},
+        'idx_j': {0: pairs},
+        'idx_m': {0: atoms},
+        'n_atoms': {0: molecules},
+    }
+
+
+def export_model(model_path: str, export_path: str, cutoff: float = 5.0, device: torch.device = torch.device('cpu')) -> torch.export.ExportedProgram:
+    """
+    Exports the model saved at model_path with torch.export and writes the program to export_path (.pt2).
+    The exported graph is specific to the device it was exported on.
+    """
+    model = torch.load(model_path, map_location=device)
+    if isinstance(model, spk.AtomisticTask):
+        model = model.model
+    model = model.to(device).eval()
+
+    wrapper = ExportableOrbitalModel(model, get_output_key(model)).eval()
+    inputs = get_example_inputs(cutoff, device)
+    example_inputs = tuple(inputs[key] for key in EXPORTED_INPUT_KEYS)
+    with torch.no_grad():
+        program = torch.export.export(wrapper, example_inputs, dynamic_shapes=get_dynamic_shapes())
+    torch.export.save(program, export_path)
+    return program
+
+
+def load_exported_model(export_path: str) -> nn.Module:
+    return torch.export.load(export_path).module()
+
+
+def is_exported_model(model_path: str) -> bool:
+    return model_path.endswith('.pt2')
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--model_name', type=str)
+  parser.add_argument('--cutoff', type=float, default=5.0)
+  parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu')
+  args = parser.parse_args()
+
+  model_path = './checkpoints/' + args.model_name + '.pt'
+  export_path = './checkpoints/' + args.model_name + '.pt2'
+  export_model(model_path, export_path, cutoff=args.cutoff, device=torch.device(args.device))
+  print(f'Exported {model_path} to {export_path}')
@@ -0,0 +1,167 @@
+import os
+from typing import Dict, Iterator, List, Optional, Sequence
+import numpy as np
+import pytorch_lightning as pl
+import torch
+from tqdm import tqdm
+
+import schnetpack as spk
+import schnetpack.properties as structure
+
+from model.neighbor_list_cache import CachedNeighborList, get_neighbor_list_cache
+from model.packed_dataset import PackedAtomsData
+
+atom_keys = {structure.Z, structure.R}
+pair_keys = {structure.idx_i, structure.idx_j, structure.offsets}
+
+
+def concatenated_ranges(starts: torch.Tensor, counts: torch.Tensor) -> torch.Tensor:
+    """
+    Concatenation of arange(start, start + count) for all (start, count) pairs, without a Python loop
+    """
+    segment_starts = torch.cumsum(counts, dim=0) - counts
+    return torch.repeat_interleave(starts - segment_starts, counts) + torch.arange(int(counts.sum()), device=counts.device)
+
+
+class InMemoryAtomsData:
+    """
+    A set of structures preloaded, with their neighbour lists, into flat tensors on one device. Batches in the
+    format of _atoms_collate_fn are gathered for a set of sample indices with a few tensor operations.
+    """
+
+    def __init__(self, samples: List[Dict[str, torch.Tensor]], device: torch.device):
+        self.device = device
+        self.n_samples = len(samples)
+        self.n_atoms = torch.cat([s[structure.n_atoms] for s in samples]).to(device)
+        self.n_pairs = torch.tensor([len(s[structure.idx_i]) for s in samples], device=device)
+        self.atom_offsets = torch.cumsum(self.n_atoms, dim=0) - self.n_atoms
+        self.pair_offsets = torch.cumsum(self.n_pairs, dim=0) - self.n_pairs
+
+        self.atom_properties = {key: torch.cat([s[key] for s in samples]).to(device) for key in atom_keys}
+        self.pair_properties = {key: torch.cat([s[key] for s in samples]).to(device) for key in pair_keys}
+        self.sample_properties = {
+            key: torch.stack([s[key] for s in samples]).to(device)
+            for key in samples[0] if key not in atom_keys and key not in pair_keys
+        }
+
+        # same atoms in every sample: atoms are gathered as dense (B, n_atoms, ...) blocks
+        self.n_atoms_fixed = int(self.n_atoms[0]) if bool((self.n_atoms == self.n_atoms[0]).all()) else None
+        if self.n_atoms_fixed is not None:
+            self.atom_properties = {
+                key: values.reshape(self.n_samples, self.n_atoms_fixed, *values.shape[1:])
+                for key, values in self.atom_properties.items()
+            }
+
+    def __len__(self) -> int:
+        return self.n_samples
+
+    def get_batch(self, sample_idxs: torch.Tensor) -> Dict[str, torch.Tensor]:
+        batch = {key: values[sample_idxs].flatten(0, 1) for key, values in self.sample_properties.items()}
+
+        molecules = torch.arange(len(sample_idxs), device=self.device)
+        if self.n_atoms_fixed is not None:
+            for key, values in self.atom_properties.items():
+                batch[key] = values[sample_idxs].flatten(0, 1)
+            batch_atom_offsets = molecules * self.n_atoms_fixed
+            batch[structure.idx_m] = torch.repeat_interleave(molecules, self.n_atoms_fixed)
+        else:
+            n_atoms = self.n_atoms[sample_idxs]
+            atom_idxs = concatenated_ranges(self.atom_offsets[sample_idxs], n_atoms)
+            for key, values in self.atom_properties.items():
+                batch[key] = values[atom_idxs]
+            batch_atom_offsets = torch.cumsum(n_atoms, dim=0) - n_atoms
+            batch[structure.idx_m] = torch.repeat_interleave(molecules, n_atoms)
+
+        n_pairs = self.n_pairs[sample_idxs]
+        pair_idxs = concatenated_ranges(self.pair_offsets[sample_idxs], n_pairs)
+        batch[structure.offsets] = self.pair_properties[structure.offsets][pair_idxs]
+        pair_atom_offsets = torch.repeat_interleave(batch_atom_offsets, n_pairs)
+        for key in [structure.idx_i, structure.idx_j]:
+            batch[key + "_local"] = self.pair_properties[key][pair_idxs]
+            batch[key] = batch[key + "_local"] + pair_atom_offsets
+        return batch
+
+
+class InMemoryBatchLoader:
+    """
+    Iterates over batches of an InMemoryAtomsData in (optionally shuffled) order, no workers or collation involved
+    """
+
+    def __init__(self, data: InMemoryAtomsData, batch_size: int, shuffle: bool = False):
+        self.data = data
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+
+    def __len__(self) -> int:
+        return (len(self.data) + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self) -> Iterator[Dict[str, torch.Tensor]]:
+        if self.shuffle:
+            order = torch.randperm(len(self.data), device=self.data.device)
+        else:
+            order = torch.arange(len(self.data), device=self.data.device)
+        for start in range(0, len(self.data), self.batch_size):
+            yield self.data.get_batch(order[start:start + self.batch_size])
+
+
+class InMemoryAtomsDataModule(pl.LightningDataModule):
+    """
+    Lightning data module that loads the train / val / test splits of an ASE db or packed dataset into
+    memory once, using the cached neighbour lists of the database.
+    """
+
+    def __init__(
+        self,
+        datapath: str,
+        batch_size: int,
+        split_file: str,
+        cutoff: float,
+        load_properties: Optional[List[str]] = None,
+        val_batch_size: Optional[int] = None,
+        test_batch_size: Optional[int] = None,
+        device: Optional[torch.device] = None,
+    ):
+        super().__init__()
+        if device is None:
+            device = torch.device('cuda') if torch.cuda.is_available() else torch.device('cpu')
+        self.datapath = datapath
+        self.batch_size = batch_size
+        self.val_batch_size = val_batch_size or batch_size
+        self.test_batch_size = test_batch_size or batch_size
+        self.split_file = split_file
+        self.cutoff = cutoff
+        self.load_properties = load_properties
+        self.device = device
+
+        self.train_dataset = None
+        self.val_dataset = None
+        self.test_dataset = None
+
+    def _load(self, indices: Sequence[int]) -> InMemoryAtomsData:
+        transforms = [
+            CachedNeighborList(get_neighbor_list_cache(self.datapath, self.cutoff)),
+            spk.transform.CastTo32()
+        ]
+        if os.path.isdir(self.datapath):
+            dataset = PackedAtomsData(self.datapath, self.load_properties, transforms, subset_idx=indices)
+        else:
+            dataset = spk.data.ASEAtomsData(self.datapath, load_properties=self.load_properties, transforms=transforms, subset_idx=indices)
+        samples = [dataset[idx] for idx in tqdm(range(len(dataset)), desc='loading samples into memory')]
+        return InMemoryAtomsData(samples, self.device)
+
+    def setup(self, stage: Optional[str] = None):
+        if self.train_dataset is None:
+            split = np.load(self.split_file)
+            self.train_dataset = self._load(split['train_idx'].tolist())
+            self.val_dataset = self._load(split['val_idx'].tolist())
+            if len(split['test_idx']) > 0:
+                self.test_dataset = self._load(split['test_idx'].tolist())
+
+    def train_dataloader(self) -> InMemoryBatchLoader:
+        return InMemoryBatchLoader(self.train_dataset, self.batch_size, shuffle=True)
+
+    def val_dataloader(self) -> InMemoryBatchLoader:
+        return InMemoryBatchLoader(self.val_dataset, self.val_batch_size)
+
+    def test_dataloader(self) -> InMemoryBatchLoader:
+        return InMemoryBatchLoader(self.test_dataset, self.test_batch_size)
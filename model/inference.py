@@ -1,9 +1,12 @@
+from typing import Dict, Optional, Sequence, Union
 import numpy as np
 import torch
 import schnetpack as spk
-from ase import io
+from ase import Atoms, io
 
 from data.utils import read_xyz_file
+from model.export import EXPORTED_INPUT_KEYS, is_exported_model
+from model.model_registry import load_model
 from phisnet_fork.utils.transform_hamiltonians import transform_hamiltonians_from_lm_to_ao
 
 def infer_orbitals_from_phisnet_model(model_path: str, 
@@ -15,8 +18,7 @@ def infer_orbitals_from_phisnet_model(model_path: str,
   else:
     device = torch.device('cpu')
 
-  model = torch.load(model_path, map_location=device).to(device)
-  model.eval()
+  model = load_model(model_path, device)
 
   geometry = read_xyz_file(geometry_path)
   R = np.array([[atom.x, atom.y, atom.z] for atom in geometry]) * 1.8897261258369282 # convert angstroms to bohr
@@ -33,56 +35,78 @@ def infer_orbitals_from_phisnet_model(model_path: str,
 
   return F
   
-def infer_orbitals_from_F_model(model_path: str, 
-                                geometry_path: str,
-                                basis_set_size: int = 36,
-                                cutoff=5.0) -> np.ndarray:
-  if torch.cuda.is_available():
-    device = torch.device('cuda')
-  else:
-    device = torch.device('cpu')
+class Predictor:
+  """
+  Loads an F or MO model (pickled, or a .pt2 program written by model/export.py) once and predicts the
+  matrices of many geometries (xyz paths or ase Atoms) in batches, returning them stacked as a
+  (n_geometries, basis_set_size, basis_set_size) array.
+  """
+  def __init__(self,
+               model_path: str,
+               property: str = 'F',
+               basis_set_size: int = 36,
+               cutoff: float = 5.0,
+               batch_size: int = 32,
+               device: Optional[torch.device] = None,
+               compile: bool = False,
+               precision: str = 'fp32') -> None:
+    if device is None:
+      device = torch.device('cuda') if torch.cuda.is_available() else torch.device('cpu')
+    self.device = device
+    self.property = property
+    self.basis_set_size = basis_set_size
+    self.batch_size = batch_size
 
-  # transform geometry into input batch
-  atoms = io.read(geometry_path)
-  converter = spk.interfaces.AtomsConverter(neighbor_list=spk.transform.ASENeighborList(cutoff=cutoff), dtype=torch.float32, device=device)
-  input = converter(atoms)
-  
-  # load model
-  model = torch.load(model_path, map_location=device).to(device)
-  model.eval()
+    # the registry converts int8 / bf16 models once and caches them next to the fp32 model
+    self.model = load_model(model_path, device, precision)
+    # programs written by model/export.py take the batch tensors positionally and return the prediction
+    self.exported = is_exported_model(model_path)
+    if compile:
+      # compiling takes about a minute up front, worth it for pipelines that predict many geometries
+      self.model = torch.compile(self.model, dynamic=True)
+    self.converter = spk.interfaces.AtomsConverter(neighbor_list=spk.transform.ASENeighborList(cutoff=cutoff), dtype=torch.float32, device=device)
 
-  # predicting Fock matrix
-  output = model(input)
-  values = output['F'].detach().cpu().numpy()
-  F = values.reshape(basis_set_size, basis_set_size)
-  F = 0.5 * (F + F.T)
+  def _get_output(self, output: Dict[str, torch.Tensor]) -> torch.Tensor:
+    if self.property == 'F':
+      return output['F']
+    for key in ['mo_coeffs', 'mo_coeffs_adjusted']:
+      if key in output.keys():
+        return output[key]
+    raise KeyError(f'Model output contains no MO coefficients: {list(output.keys())}')
 
-  return F
+  def predict(self, geometries: Sequence[Union[str, Atoms]]) -> np.ndarray:
+    atoms = [io.read(geometry) if isinstance(geometry, str) else geometry for geometry in geometries]
 
+    predictions = []
+    with torch.no_grad():
+      for start in range(0, len(atoms), self.batch_size):
+        inputs = self.converter(atoms[start:start + self.batch_size])
+        if self.exported:
+          values = self.model(*[inputs[key] for key in EXPORTED_INPUT_KEYS])
+        else:
+          values = self._get_output(self.model(inputs))
+        values = values.detach().cpu().numpy()
+        predictions.append(values.reshape(-1, self.basis_set_size, self.basis_set_size))
+    predictions = np.concatenate(predictions, axis=0)
 
-def infer_orbitals_from_mo_model(model_path: str, 
+    if self.property == 'F':
+      predictions = 0.5 * (predictions + np.swapaxes(predictions, -1, -2))
+    return np.ascontiguousarray(predictions)
+
+
+def infer_orbitals_from_F_model(model_path: str, 
                                 geometry_path: str,
                                 basis_set_size: int = 36,
-                                cutoff=5.0) -> np.ndarray:
-  if torch.cuda.is_available():
-    device = torch.device('cuda')
-  else:
-    device = torch.device('cpu')
+                                cutoff=5.0,
+                                precision: str = 'fp32') -> np.ndarray:
+  predictor = Predictor(model_path, property='F', basis_set_size=basis_set_size, cutoff=cutoff, precision=precision)
+  return predictor.predict([geometry_path])[0]
 
-  # transform geometry into input batch
-  atoms = io.read(geometry_path)
-  converter = spk.interfaces.AtomsConverter(neighbor_list=spk.transform.ASENeighborList(cutoff=cutoff), dtype=torch.float32, device=device)
-  input = converter(atoms)
-  
-  # load model
-  model = torch.load(model_path, map_location=device).to(device)
-  model.eval()
 
-  # predicting MO coefficient C matrix
-  output = model(input)
-  for key in ['mo_coeffs', 'mo_coeffs_adjusted']:
-    if key in output.keys():
-      values = output[key].detach().cpu().numpy()
-      mo = values.reshape(basis_set_size, basis_set_size)
-      mo = np.asarray(mo.tolist(), order='C')
-      return mo
\ No newline at end of file
+def infer_orbitals_from_mo_model(model_path: str, 
+                                geometry_path: str,
+                                basis_set_size: int = 36,
+                                cutoff=5.0,
+                                precision: str = 'fp32') -> np.ndarray:
+  predictor = Predictor(model_path, property='mo', basis_set_size=basis_set_size, cutoff=cutoff, precision=precision)
+  return predictor.predict([geometry_path])[0]
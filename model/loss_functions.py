@@ -1,23 +1,48 @@
+from typing import Sequence
 import torch
 
+# active orbitals of fulvene after casscf.sort_mo([19, 20, 21, 22, 23, 24]): 18 core orbitals, CAS(6,6)
+ACTIVE_ORBITALS = list(range(18, 24))
+
 
 def mean_squared_error(pred, targets, basis_set_size):
     pred = pred.reshape(-1, basis_set_size, basis_set_size)
     targets = targets.reshape(-1, basis_set_size, basis_set_size)
-    batch_size = pred.shape[0]
-    loss = 0
-    for i in range(batch_size):
-        loss += torch.sum(torch.square(targets[i].flatten() - pred[i].flatten())) / basis_set_size**2
-    return loss / batch_size
+    return torch.mean(torch.square(targets - pred))
 
 
 def symm_matrix_mse(pred, targets, basis_set_size):
     pred = pred.reshape(-1, basis_set_size, basis_set_size)
     targets = targets.reshape(-1, basis_set_size, basis_set_size)
 
-    batch_size = pred.shape[0]
-    loss = 0
-    for i in range(batch_size):
-        H = 0.5 * (pred[i] + pred[i].T)
-        loss += torch.sum(torch.square(targets[i].flatten() - H.flatten())) / len(targets[i].flatten())
-    return loss / batch_size
\ No newline at end of file
+    H = 0.5 * (pred + torch.transpose(pred, -1, -2))
+    return torch.mean(torch.square(targets - H))
+
+
+def overlap_weighted_mse(pred, targets, overlap, basis_set_size):
+    """
+    MSE of MO coefficient matrices measured in the metric of the AO overlap matrix S, i.e. the mean of
+    tr(E^T S E) / n^2 with E the error matrix, so that errors along overlapping basis functions are not
+    counted independently. Orbitals are columns, see active_space_mse. Train with it through
+    create_orbital_model(..., overlap_property='S'), which hands the overlap matrices of the batch to the loss.
+    """
+    pred = pred.reshape(-1, basis_set_size, basis_set_size)
+    targets = targets.reshape(-1, basis_set_size, basis_set_size)
+    overlap = overlap.reshape(-1, basis_set_size, basis_set_size)
+
+    error = targets - pred
+    return torch.sum(error * torch.bmm(overlap, error)) / error.numel()
+
+
+def active_space_mse(pred, targets, basis_set_size, active_orbitals: Sequence[int] = ACTIVE_ORBITALS, active_weight: float = 10.0):
+    """
+    MSE of MO coefficient matrices (orbitals as columns) where the columns of the active orbitals
+    are weighted by active_weight, normalized by the total weight. The PySCF data (mo_coeffs) stores the
+    orbitals as columns, OpenMolcas data (MO_VECTORS, INPORB files) as rows: transpose those first.
+    """
+    pred = pred.reshape(-1, basis_set_size, basis_set_size)
+    targets = targets.reshape(-1, basis_set_size, basis_set_size)
+
+    weights = torch.ones(basis_set_size, dtype=pred.dtype, device=pred.device)
+    weights[list(active_orbitals)] = active_weight
+    return torch.mean(torch.square(targets - pred) * weights) / torch.mean(weights)
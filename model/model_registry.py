@@ -0,0 +1,69 @@
+import os
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import torch
+
+from model.export import is_exported_model, load_exported_model
+from model.quantization import apply_precision
+
+
+class ModelRegistry:
+    """
+    In-process LRU cache of deserialized models. Entries are keyed by the absolute checkpoint path, its
+    modification time, the device and the inference precision, so a checkpoint that is overwritten on disk
+    is loaded again and int8 / bf16 models are converted only once.
+    Models are handed out in eval() mode and shared between callers, so they should not be modified.
+    """
+
+    def __init__(self, max_size: int = 4) -> None:
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._models: "OrderedDict[Tuple[str, float, str, str], torch.nn.Module]" = OrderedDict()
+
+    def get(self, model_path: str, device: Optional[torch.device] = None, precision: str = 'fp32') -> torch.nn.Module:
+        if device is None:
+            device = torch.device('cuda') if torch.cuda.is_available() else torch.device('cpu')
+        path = os.path.abspath(model_path)
+        key = (path, os.path.getmtime(path), str(device), precision)
+
+        if key in self._models:
+            self.hits += 1
+            self._models.move_to_end(key)
+            return self._models[key]
+
+        self.misses += 1
+        # drop versions of this checkpoint that are outdated on disk
+        for stale_key in [k for k in self._models if k[0] == path and k[1] != key[1] and k[2] == key[2]]:
+            del self._models[stale_key]
+
+        if precision != 'fp32':
+            # int8 dynamic quantization / bf16 autocast of the Dense layers, CPU only
+            if is_exported_model(path) or device.type != 'cpu':
+                raise ValueError(f'{precision} inference is only supported for pickled models on CPU')
+            model = apply_precision(self.get(model_path, device), precision)
+        elif is_exported_model(path):
+            # torch.export programs are bound to the device they were exported on
+            model = load_exported_model(path)
+        else:
+            model = torch.load(path, map_location=device).to(device)
+            model.eval()
+        self._models[key] = model
+        while len(self._models) > self.max_size:
+            self._models.popitem(last=False)
+        return model
+
+    def clear(self) -> None:
+        self._models.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._models), 'max_size': self.max_size}
+
+
+model_registry = ModelRegistry()
+
+
+def load_model(model_path: str, device: Optional[torch.device] = None, precision: str = 'fp32') -> torch.nn.Module:
+    return model_registry.get(model_path, device, precision)
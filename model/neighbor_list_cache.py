@@ -0,0 +1,99 @@
+import os
+from typing import Dict, Optional
+import numpy as np
+import torch
+from tqdm import tqdm
+
+import schnetpack as spk
+import schnetpack.properties as structure
+from schnetpack.transform import Transform
+
+from model.packed_dataset import PackedAtomsData
+
+
+def get_neighbor_list_cache_path(database_path: str, cutoff: float) -> str:
+    return f'{database_path.rstrip("/")}.nbl_{cutoff:g}.npz'
+
+
+def _database_stamp(database_path: str) -> float:
+    # packed datasets are folders, their index is rewritten whenever they are packed again
+    if os.path.isdir(database_path):
+        return os.path.getmtime(os.path.join(database_path, 'index.json'))
+    return os.path.getmtime(database_path)
+
+
+def build_neighbor_list_cache(database_path: str, cutoff: float, cache_path: Optional[str] = None) -> str:
+    """
+    Computes the ASE neighbour lists of all structures in an ASE db or packed dataset once and stores them,
+    concatenated over structures, next to the database. Structure k owns the pairs pair_offsets[k]:pair_offsets[k+1].
+    """
+    if cache_path is None:
+        cache_path = get_neighbor_list_cache_path(database_path, cutoff)
+
+    if os.path.isdir(database_path):
+        dataset = PackedAtomsData(database_path, load_properties=[])
+    else:
+        dataset = spk.data.ASEAtomsData(database_path, load_properties=[])
+    neighbor_list = spk.transform.ASENeighborList(cutoff=cutoff)
+
+    idx_i, idx_j, offsets = [], [], []
+    pair_offsets = np.zeros(len(dataset) + 1, dtype=np.int64)
+    for idx in tqdm(range(len(dataset)), desc='building neighbor lists'):
+        sample = neighbor_list(dataset[idx])
+        idx_i.append(sample[structure.idx_i].numpy())
+        idx_j.append(sample[structure.idx_j].numpy())
+        offsets.append(sample[structure.offsets].numpy())
+        pair_offsets[idx + 1] = pair_offsets[idx] + len(idx_i[-1])
+
+    np.savez(
+        cache_path,
+        idx_i=np.concatenate(idx_i).astype(np.int64),
+        idx_j=np.concatenate(idx_j).astype(np.int64),
+        offsets=np.concatenate(offsets).astype(np.float32),
+        pair_offsets=pair_offsets,
+        cutoff=cutoff,
+        database_stamp=_database_stamp(database_path),
+    )
+    return cache_path
+
+
+def get_neighbor_list_cache(database_path: str, cutoff: float) -> str:
+    """
+    Returns the path of the neighbour list cache of a database, (re)building it if it is missing or
+    older than the database
+    """
+    cache_path = get_neighbor_list_cache_path(database_path, cutoff)
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as cache:
+            if float(cache['database_stamp']) == _database_stamp(database_path):
+                return cache_path
+    return build_neighbor_list_cache(database_path, cutoff, cache_path)
+
+
+class CachedNeighborList(Transform):
+    """
+    Drop-in replacement of the ASENeighborList transform that looks up the precomputed neighbour list
+    of a sample by its dataset index instead of building it.
+    """
+    is_preprocessor: bool = True
+    is_postprocessor: bool = False
+
+    def __init__(self, cache_path: str):
+        super().__init__()
+        self.cache_path = cache_path
+        self._cache = None
+
+    def _load(self) -> Dict[str, torch.Tensor]:
+        with np.load(self.cache_path) as cache:
+            return {key: torch.from_numpy(cache[key]) for key in ['idx_i', 'idx_j', 'offsets', 'pair_offsets']}
+
+    def forward(self, inputs: Dict[str, torch.Tensor]) -> Dict[str, torch.Tensor]:
+        if self._cache is None:
+            self._cache = self._load()
+
+        idx = int(inputs[structure.idx][0])
+        start, end = self._cache['pair_offsets'][idx], self._cache['pair_offsets'][idx + 1]
+        inputs[structure.idx_i] = self._cache['idx_i'][start:end]
+        inputs[structure.idx_j] = self._cache['idx_j'][start:end]
+        inputs[structure.offsets] = self._cache['offsets'][start:end].to(inputs[structure.R].dtype)
+        return inputs
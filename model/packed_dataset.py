@@ -0,0 +1,154 @@
+import os
+import json
+from typing import Callable, Dict, List, Optional, Sequence
+import numpy as np
+import pytorch_lightning as pl
+import torch
+from torch.utils.data import Dataset
+
+import schnetpack.properties as structure
+from schnetpack.data import AtomsLoader
+from schnetpack.transform import Transform
+
+from model.data_loader import _atoms_collate_fn
+
+
+class PackedAtomsData(Dataset):
+    """
+    Dataset reading the packed format written by data/db/pack_db.py. All arrays are opened as read-only
+    memory maps, so dataloader workers share the same pages instead of each decoding SQLite blobs.
+    Samples have the same keys as schnetpack's ASEAtomsData and can use the same transforms.
+    """
+
+    def __init__(
+        self,
+        datapath: str,
+        load_properties: Optional[List[str]] = None,
+        transforms: Optional[List[Transform]] = None,
+        subset_idx: Optional[Sequence[int]] = None,
+    ):
+        self.datapath = datapath
+        with open(os.path.join(datapath, 'index.json'), 'r') as f:
+            self.metadata = json.load(f)
+
+        if load_properties is None:
+            load_properties = list(self.metadata['properties'].keys())
+        self.load_properties = load_properties
+        self.transforms = transforms
+        self.subset_idx = subset_idx
+        self._transform_module = torch.nn.Sequential(*transforms) if transforms else None
+
+        self.atom_offsets = np.load(os.path.join(datapath, 'atom_offsets.npy'))
+        self.Z = self._open('Z')
+        self.R = self._open('R')
+        self.cell = self._open('cell')
+        self.pbc = self._open('pbc')
+        self.properties = {name: self._open(name) for name in self.load_properties}
+
+    def _open(self, name: str) -> np.memmap:
+        return np.load(os.path.join(self.datapath, f'{name}.npy'), mmap_mode='r')
+
+    def __len__(self) -> int:
+        if self.subset_idx is not None:
+            return len(self.subset_idx)
+        return self.metadata['n_structures']
+
+    def subset(self, subset_idx: Sequence[int]) -> 'PackedAtomsData':
+        if self.subset_idx is not None:
+            subset_idx = [self.subset_idx[i] for i in subset_idx]
+        return PackedAtomsData(self.datapath, self.load_properties, self.transforms, subset_idx)
+
+    def __getitem__(self, idx: int) -> Dict[str, torch.Tensor]:
+        if self.subset_idx is not None:
+            idx = self.subset_idx[idx]
+        start, end = self.atom_offsets[idx], self.atom_offsets[idx + 1]
+
+        props = {}
+        props[structure.idx] = torch.tensor([idx])
+        for name in self.load_properties:
+            props[name] = torch.from_numpy(np.array(self.properties[name][idx]))
+        props[structure.n_atoms] = torch.tensor([end - start])
+        props[structure.Z] = torch.from_numpy(np.array(self.Z[start:end]))
+        props[structure.position] = torch.from_numpy(np.array(self.R[start:end]))
+        props[structure.cell] = torch.from_numpy(np.array(self.cell[idx:idx + 1]))
+        props[structure.pbc] = torch.from_numpy(np.array(self.pbc[idx]))
+
+        if self._transform_module is not None:
+            props = self._transform_module(props)
+        return props
+
+
+class PackedAtomsDataModule(pl.LightningDataModule):
+    """
+    Lightning data module over a packed dataset, taking the train / val / test indices from a split file.
+    """
+
+    def __init__(
+        self,
+        datapath: str,
+        batch_size: int,
+        split_file: str,
+        transforms: Optional[List[Transform]] = None,
+        load_properties: Optional[List[str]] = None,
+        val_batch_size: Optional[int] = None,
+        test_batch_size: Optional[int] = None,
+        num_workers: int = 8,
+        pin_memory: bool = False,
+        collate_fn: Callable = _atoms_collate_fn,
+    ):
+        super().__init__()
+        self.datapath = datapath
+        self.batch_size = batch_size
+        self.val_batch_size = val_batch_size or batch_size
+        self.test_batch_size = test_batch_size or batch_size
+        self.split_file = split_file
+        self.transforms = transforms
+        self.load_properties = load_properties
+        self.num_workers = num_workers
+        self.pin_memory = pin_memory
+        self.collate_fn = collate_fn
+
+        self.dataset = None
+        self._train_dataset = None
+        self._val_dataset = None
+        self._test_dataset = None
+
+    def setup(self, stage: Optional[str] = None):
+        if self.dataset is None:
+            self.dataset = PackedAtomsData(self.datapath, self.load_properties, self.transforms)
+            split = np.load(self.split_file)
+            self._train_dataset = self.dataset.subset(split['train_idx'].tolist())
+            self._val_dataset = self.dataset.subset(split['val_idx'].tolist())
+            self._test_dataset = self.dataset.subset(split['test_idx'].tolist())
+
+    @property
+    def train_dataset(self) -> PackedAtomsData:
+        return self._train_dataset
+
+    @property
+    def val_dataset(self) -> PackedAtomsData:
+        return self._val_dataset
+
+    @property
+    def test_dataset(self) -> PackedAtomsData:
+        return self._test_dataset
+
+    def _dataloader(self, dataset: PackedAtomsData, batch_size: int, shuffle: bool) -> AtomsLoader:
+        return AtomsLoader(
+            dataset,
+            batch_size=batch_size,
+            shuffle=shuffle,
+            num_workers=self.num_workers,
+            collate_fn=self.collate_fn,
+            pin_memory=self.pin_memory,
+            persistent_workers=self.num_workers > 0,
+        )
+
+    def train_dataloader(self) -> AtomsLoader:
+        return self._dataloader(self.train_dataset, self.batch_size, shuffle=True)
+
+    def val_dataloader(self) -> AtomsLoader:
+        return self._dataloader(self.val_dataset, self.val_batch_size, shuffle=False)
+
+    def test_dataloader(self) -> AtomsLoader:
+        return self._dataloader(self.test_dataset, self.test_batch_size, shuffle=False)
@@ -0,0 +1,75 @@
+import copy
+from typing import Callable, Union
+import torch
+from torch import nn
+import torch.ao.nn.quantized.dynamic as nnqd
+import schnetpack as spk
+
+PRECISIONS = ['fp32', 'int8', 'bf16']
+
+
+class DynamicQuantizedDense(nn.Module):
+    """
+    int8 dynamically quantized version of schnetpack's Dense (a Linear followed by an activation).
+    torch.ao.quantization.quantize_dynamic only swaps modules of exactly type nn.Linear, so Dense layers
+    are converted through a plain Linear with the same parameters.
+    """
+
+    def __init__(self, dense: spk.nn.Dense):
+        super().__init__()
+        linear = nn.Linear(dense.in_features, dense.out_features, bias=dense.bias is not None)
+        linear.load_state_dict(dense.state_dict())
+        linear.qconfig = torch.ao.quantization.default_dynamic_qconfig
+        self.linear = nnqd.Linear.from_float(linear)
+        self.activation = dense.activation
+
+    def forward(self, input: torch.Tensor) -> torch.Tensor:
+        return self.activation(self.linear(input))
+
+
+def quantize_dense_layers(model: nn.Module) -> nn.Module:
+    """
+    Returns a copy of the model in which all Dense / Linear layers (PaiNN filters, interaction and mixing
+    blocks and the gated equivariant output MLP) use int8 weights with dynamically quantized activations.
+    """
+    model = copy.deepcopy(model)
+    if isinstance(model, spk.nn.Dense):
+        return DynamicQuantizedDense(model)
+
+    def convert(module: nn.Module) -> None:
+        for name, child in module.named_children():
+            if isinstance(child, spk.nn.Dense):
+                setattr(module, name, DynamicQuantizedDense(child))
+            elif type(child) == nn.Linear:
+                child.qconfig = torch.ao.quantization.default_dynamic_qconfig
+                setattr(module, name, nnqd.Linear.from_float(child))
+            else:
+                convert(child)
+
+    convert(model)
+    return model
+
+
+class Bfloat16Autocast(nn.Module):
+    """ Runs the wrapped model under CPU bf16 autocast, returning the outputs in fp32 """
+
+    def __init__(self, model: nn.Module):
+        super().__init__()
+        self.model = model
+
+    def forward(self, *args, **kwargs):
+        with torch.autocast('cpu', dtype=torch.bfloat16):
+            outputs = self.model(*args, **kwargs)
+        if isinstance(outputs, dict):
+            return {key: value.float() for key, value in outputs.items()}
+        return outputs.float()
+
+
+def apply_precision(model: nn.Module, precision: str) -> Union[nn.Module, Callable]:
+    if precision not in PRECISIONS:
+        raise ValueError(f'Unknown precision {precision}, expected one of {PRECISIONS}')
+    if precision == 'int8':
+        return quantize_dense_layers(model)
+    if precision == 'bf16':
+        return Bfloat16Autocast(model)
+    return model
@@ -1,12 +1,25 @@
 import logging
-from typing import Callable
+import os
+from typing import Callable, List, Optional
 import pytorch_lightning
 from pytorch_lightning.loggers import WandbLogger
 import torch
 import schnetpack as schnetpack
+from ase.db import connect
 
 from model.loss_functions import mean_squared_error, symm_matrix_mse
 from model.caschnet_model import create_orbital_model
+from model.data_loader import _atoms_collate_fn, _fixed_size_atoms_collate_fn
+from model.in_memory_dataset import InMemoryAtomsDataModule
+from model.neighbor_list_cache import CachedNeighborList, get_neighbor_list_cache
+from model.packed_dataset import PackedAtomsData, PackedAtomsDataModule
+
+def get_first_atomic_numbers(database_path: str) -> List[int]:
+  """ atomic numbers of the first structure in an ASE database or a packed dataset (data/db/pack_db.py) """
+  if os.path.isdir(database_path):
+    return PackedAtomsData(database_path, load_properties=[])[0][schnetpack.properties.Z].tolist()
+  with connect(database_path) as conn:
+    return next(conn.select(limit=1)).numbers.tolist()
 
 def train_model(
     save_path: str,
@@ -21,28 +34,70 @@ def train_model(
     use_wandb: bool = False,
     create_model_fn = create_orbital_model,
     initial_model_path: str = None,
-    cutoff: float = 5.0
+    cutoff: float = 5.0,
+    cache_neighbor_lists: bool = True,
+    in_memory: bool = False,
+    n_atoms_fixed: int = None,
+    overlap_property: Optional[str] = None
   ):
   import os
   os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
 
   """ Initializing a dataset """
-  dataset = schnetpack.data.datamodule.AtomsDataModule(
-    datapath=database_path,
-    batch_size=batch_size,
-    split_file=split_file,
-    transforms=[
-      schnetpack.transform.ASENeighborList(cutoff=cutoff),
+  # losses in the metric of the overlap matrix (overlap_weighted_mse) also need S from the database
+  load_properties = [property] if overlap_property is None else [property, overlap_property]
+  if in_memory:
+    # whole split resident in device memory, batches are gathered without workers / collation,
+    # the neighbor lists are computed while loading it
+    dataset = InMemoryAtomsDataModule(
+      datapath=database_path,
+      batch_size=batch_size,
+      split_file=split_file,
+      cutoff=cutoff,
+      load_properties=load_properties
+    )
+  else:
+    if cache_neighbor_lists:
+      # neighbor lists are computed once per (database, cutoff) and stored next to the database
+      neighbor_list = CachedNeighborList(get_neighbor_list_cache(database_path, cutoff))
+    else:
+      neighbor_list = schnetpack.transform.ASENeighborList(cutoff=cutoff)
+    transforms = [
+      neighbor_list,
       schnetpack.transform.CastTo32()
-    ],
-    property_units={property: 1.0},
-    num_workers=8,
-    pin_memory=True,
-    load_properties=[property]
-  )
+    ]
+    if os.path.isdir(database_path):
+      # packed dataset written by data/db/pack_db.py
+      dataset = PackedAtomsDataModule(
+        datapath=database_path,
+        batch_size=batch_size,
+        split_file=split_file,
+        transforms=transforms,
+        load_properties=load_properties,
+        num_workers=8,
+        pin_memory=True,
+        # dense collate when every molecule has the same atoms
+        collate_fn=_atoms_collate_fn if n_atoms_fixed is None else _fixed_size_atoms_collate_fn
+      )
+    else:
+      dataset = schnetpack.data.datamodule.AtomsDataModule(
+        datapath=database_path,
+        batch_size=batch_size,
+        split_file=split_file,
+        transforms=transforms,
+        property_units={name: 1.0 for name in load_properties},
+        num_workers=8,
+        pin_memory=True,
+        load_properties=load_properties
+      )
 
   """ Initiating the Model """
-  model = create_model_fn(loss_function=loss_fn, lr=lr, output_property_key=property, basis_set_size=basis_set_size, cutoff=cutoff)
+  model_kwargs = {} if n_atoms_fixed is None else {'n_atoms_fixed': n_atoms_fixed}
+  # the atom-pair output lays its blocks out for the molecule of the dataset
+  model_kwargs['atomic_numbers'] = get_first_atomic_numbers(database_path)
+  if overlap_property is not None:
+    model_kwargs['overlap_property'] = overlap_property
+  model = create_model_fn(loss_function=loss_fn, lr=lr, output_property_key=property, basis_set_size=basis_set_size, cutoff=cutoff, **model_kwargs)
 
   if initial_model_path is not None:
     state_dict = torch.load(initial_model_path).state_dict()
@@ -0,0 +1,33 @@
+import pytest
+import torch
+
+from model.benchmark_collate import random_sample, reference_atoms_collate_fn
+from model.data_loader import CollateBuffers, _atoms_collate_fn, _fixed_size_atoms_collate_fn
+
+
+def assert_batches_equal(batch, reference):
+    assert set(batch.keys()) == set(reference.keys())
+    for key in reference:
+        assert batch[key].dtype == reference[key].dtype
+        assert torch.equal(batch[key], reference[key]), key
+
+
+@pytest.mark.parametrize("with_triples", [False, True])
+def test_collate_matches_reference(with_triples):
+    torch.manual_seed(0)
+    batch = [random_sample(idx, n_atoms=n, with_triples=with_triples) for idx, n in enumerate([12, 5, 9, 12])]
+    assert_batches_equal(_atoms_collate_fn(batch), reference_atoms_collate_fn(batch))
+
+
+def test_collate_with_buffers_matches_reference():
+    torch.manual_seed(0)
+    buffers = CollateBuffers()
+    for sizes in [[12, 12, 12], [4, 7], [12, 3, 8, 12, 6]]:
+        batch = [random_sample(idx, n_atoms=n) for idx, n in enumerate(sizes)]
+        assert_batches_equal(_atoms_collate_fn(batch, buffers=buffers), reference_atoms_collate_fn(batch))
+
+
+def test_fixed_size_collate_matches_reference():
+    torch.manual_seed(0)
+    batch = [random_sample(idx, with_triples=True) for idx in range(5)]
+    assert_batches_equal(_fixed_size_atoms_collate_fn(batch), reference_atoms_collate_fn(batch))
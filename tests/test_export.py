@@ -0,0 +1,42 @@
+import schnetpack as spk
+import torch
+from ase import io
+
+from data.casscf import EQUILIBRIUM_GEOMETRY_PATH
+from model.caschnet_model import create_orbital_model
+from model.export import EXPORTED_INPUT_KEYS, export_model
+from model.model_registry import ModelRegistry
+
+
+def get_inputs(n_molecules):
+    atoms = io.read(EQUILIBRIUM_GEOMETRY_PATH)
+    batch = []
+    for idx in range(n_molecules):
+        displaced = atoms.copy()
+        displaced.positions += 0.1 * torch.randn(len(atoms), 3).numpy()
+        batch.append(displaced)
+    converter = spk.interfaces.AtomsConverter(neighbor_list=spk.transform.ASENeighborList(cutoff=5.0), dtype=torch.float32)
+    return converter(batch)
+
+
+def test_exported_model_matches_eager(tmp_path, monkeypatch):
+    # checkpoints are pickled schnetpack modules
+    monkeypatch.setenv('TORCH_FORCE_NO_WEIGHTS_ONLY_LOAD', '1')
+    torch.manual_seed(0)
+    model = create_orbital_model(loss_function=torch.nn.functional.mse_loss, basis_set_size=36).model.eval()
+    torch.save(model, tmp_path / 'model.pt')
+    export_model(str(tmp_path / 'model.pt'), str(tmp_path / 'model.pt2'))
+
+    registry = ModelRegistry()
+    exported = registry.get(str(tmp_path / 'model.pt2'), torch.device('cpu'))
+    assert registry.get(str(tmp_path / 'model.pt2'), torch.device('cpu')) is exported
+    assert registry.stats()['misses'] == 1
+
+    # batch sizes other than the two molecules the model was exported with
+    for n_molecules in [1, 3, 5]:
+        inputs = get_inputs(n_molecules)
+        with torch.no_grad():
+            F = exported(*[inputs[key] for key in EXPORTED_INPUT_KEYS])
+            F_eager = model(inputs)['F']
+        assert F.shape == (n_molecules * 36 * 36,)
+        assert torch.allclose(F, F_eager, atol=1e-5)
@@ -0,0 +1,42 @@
+import numpy as np
+
+from data.benchmark_geometry_sorting import reference_sort_geometry_files_by_distance, write_normal_distribution_geometries
+from data.casscf import EQUILIBRIUM_GEOMETRY_PATH
+from data.utils import build_geometry_tree, read_xyz_file, read_xyz_positions, get_pos_matrix, sort_geometry_files_by_distance
+
+
+def test_read_xyz_positions(tmp_path):
+  np.random.seed(0)
+  geometry_files = write_normal_distribution_geometries(str(tmp_path), 5)
+  positions = read_xyz_positions(geometry_files)
+
+  assert positions.shape == (5, 12, 3)
+  for file, pos in zip(geometry_files, positions):
+    assert np.allclose(pos, get_pos_matrix(read_xyz_file(file)))
+
+
+def test_sort_matches_greedy_reference(tmp_path):
+  np.random.seed(0)
+  geometry_files = write_normal_distribution_geometries(str(tmp_path), 100)
+
+  sorted_files, selected_idxs = sort_geometry_files_by_distance(geometry_files, EQUILIBRIUM_GEOMETRY_PATH)
+  reference_files, reference_idxs = reference_sort_geometry_files_by_distance(geometry_files, EQUILIBRIUM_GEOMETRY_PATH)
+
+  assert selected_idxs == reference_idxs
+  assert sorted_files == reference_files
+
+
+def test_geometry_tree_parents_precede_children(tmp_path):
+  np.random.seed(0)
+  geometry_files = write_normal_distribution_geometries(str(tmp_path), 50)
+
+  tree_files, parents = build_geometry_tree(geometry_files, EQUILIBRIUM_GEOMETRY_PATH)
+
+  assert sorted(tree_files) == sorted(geometry_files)
+  assert parents[0] == -1
+  assert all(0 <= parent < idx for idx, parent in enumerate(parents) if idx > 0)
+
+
+def test_empty_geometry_list():
+  assert sort_geometry_files_by_distance([], EQUILIBRIUM_GEOMETRY_PATH) == ([], [])
+  assert build_geometry_tree([], EQUILIBRIUM_GEOMETRY_PATH) == ([], [])
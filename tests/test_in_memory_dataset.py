@@ -0,0 +1,37 @@
+import pytest
+import schnetpack.properties as structure
+import torch
+
+from model.benchmark_collate import random_sample
+from model.data_loader import _atoms_collate_fn
+from model.in_memory_dataset import InMemoryAtomsData
+
+
+def make_samples(sizes):
+    samples = []
+    for idx, n_atoms in enumerate(sizes):
+        sample = random_sample(idx, n_atoms=n_atoms)
+        # neighbour lists of different lengths and non-zero offsets, as a cutoff would give
+        keep = torch.rand(len(sample[structure.idx_i])) < 0.7
+        sample[structure.idx_i], sample[structure.idx_j] = sample[structure.idx_i][keep], sample[structure.idx_j][keep]
+        sample[structure.offsets] = torch.randn(int(keep.sum()), 3)
+        samples.append(sample)
+    return samples
+
+
+@pytest.mark.parametrize('sizes', [[12] * 10, [12, 5, 9, 12, 3, 7, 12, 8, 4, 11]], ids=['fixed_size', 'ragged'])
+def test_get_batch_matches_collate(sizes):
+    torch.manual_seed(0)
+    samples = make_samples(sizes)
+    data = InMemoryAtomsData(samples, torch.device('cpu'))
+    assert (data.n_atoms_fixed is not None) == (len(set(sizes)) == 1)
+
+    for _ in range(5):
+        sample_idxs = torch.randperm(len(samples))[:4]
+        batch = data.get_batch(sample_idxs)
+        reference = _atoms_collate_fn([samples[idx] for idx in sample_idxs.tolist()])
+
+        assert set(batch.keys()) == set(reference.keys())
+        for key in reference:
+            assert batch[key].dtype == reference[key].dtype, key
+            assert torch.equal(batch[key], reference[key]), key
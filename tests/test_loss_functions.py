@@ -0,0 +1,64 @@
+from functools import partial
+
+import schnetpack as spk
+import torch
+from ase import io
+
+from data.casscf import EQUILIBRIUM_GEOMETRY_PATH
+from model.caschnet_model import create_orbital_model
+from model.loss_functions import active_space_mse, mean_squared_error, overlap_weighted_mse, symm_matrix_mse
+
+
+def reference_mean_squared_error(pred, targets, basis_set_size):
+    pred = pred.reshape(-1, basis_set_size, basis_set_size)
+    targets = targets.reshape(-1, basis_set_size, basis_set_size)
+    loss = 0
+    for i in range(pred.shape[0]):
+        loss += torch.sum(torch.square(targets[i].flatten() - pred[i].flatten())) / basis_set_size**2
+    return loss / pred.shape[0]
+
+
+def reference_symm_matrix_mse(pred, targets, basis_set_size):
+    pred = pred.reshape(-1, basis_set_size, basis_set_size)
+    targets = targets.reshape(-1, basis_set_size, basis_set_size)
+    loss = 0
+    for i in range(pred.shape[0]):
+        H = 0.5 * (pred[i] + pred[i].T)
+        loss += torch.sum(torch.square(targets[i].flatten() - H.flatten())) / len(targets[i].flatten())
+    return loss / pred.shape[0]
+
+
+def test_batched_losses_match_per_sample_loop():
+    torch.manual_seed(0)
+    pred, targets = torch.randn(8 * 36 * 36), torch.randn(8 * 36 * 36)
+
+    assert torch.allclose(mean_squared_error(pred, targets, 36), reference_mean_squared_error(pred, targets, 36))
+    assert torch.allclose(symm_matrix_mse(pred, targets, 36), reference_symm_matrix_mse(pred, targets, 36))
+
+
+def test_weighted_losses_reduce_to_mse():
+    torch.manual_seed(0)
+    pred, targets = torch.randn(4 * 36 * 36), torch.randn(4 * 36 * 36)
+    identity = torch.eye(36).repeat(4, 1, 1)
+
+    assert torch.allclose(overlap_weighted_mse(pred, targets, identity, 36), mean_squared_error(pred, targets, 36))
+    assert torch.allclose(active_space_mse(pred, targets, 36, active_weight=1.0), mean_squared_error(pred, targets, 36))
+
+
+def test_overlap_weighted_loss_gets_the_batch_overlap():
+    torch.manual_seed(0)
+    task = create_orbital_model(partial(overlap_weighted_mse, basis_set_size=36), overlap_property='S')
+    converter = spk.interfaces.AtomsConverter(neighbor_list=spk.transform.ASENeighborList(cutoff=5.0), dtype=torch.float32)
+    batch = converter([io.read(EQUILIBRIUM_GEOMETRY_PATH)] * 2)
+    F, S = torch.randn(2 * 36 * 36), torch.randn(2, 36, 36)
+    S = (S @ S.transpose(1, 2)).flatten()
+    batch.update(F=F, S=S)
+
+    # what AtomisticTask.training_step does before it logs
+    targets = {output.target_property: batch[output.target_property] for output in task.outputs}
+    pred = task.predict_without_postprocessing(batch)
+    loss = task.loss_fn(pred, targets)
+
+    # the model writes its prediction to batch['F']
+    assert torch.allclose(loss, overlap_weighted_mse(pred['F'], F, S, 36))
+    assert not torch.allclose(loss, mean_squared_error(pred['F'], F, 36))
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+import torch
+import schnetpack as spk
+from ase import Atoms, io
+
+from data.casscf import EQUILIBRIUM_GEOMETRY_PATH
+from data.db.pack_db import pack_ase_db
+from data.db.utils import atoms_to_db
+from model.architecture.model_output import AtomPairHamiltonianOutput
+from model.caschnet_model import ORBITALS_PER_ELEMENT, create_orbital_model
+from model.training import get_first_atomic_numbers
+
+
+def get_inputs(n_molecules: int = 2):
+    atoms = io.read(EQUILIBRIUM_GEOMETRY_PATH)
+    batch = []
+    for idx in range(n_molecules):
+        displaced = atoms.copy()
+        displaced.positions += 0.05 * idx
+        batch.append(displaced)
+    converter = spk.interfaces.AtomsConverter(neighbor_list=spk.transform.ASENeighborList(cutoff=5.0), dtype=torch.float32)
+    return converter(batch)
+
+
+@pytest.mark.parametrize('basis_set_size', [36, 114])
+def test_atom_pair_output_shape_and_symmetry(basis_set_size):
+    torch.manual_seed(0)
+    atomic_numbers = io.read(EQUILIBRIUM_GEOMETRY_PATH).numbers.tolist()
+    model = create_orbital_model(loss_function=torch.nn.functional.mse_loss, basis_set_size=basis_set_size,
+                                 atom_pair_output=True, atomic_numbers=atomic_numbers).model
+
+    F = model(get_inputs())['F'].reshape(-1, basis_set_size, basis_set_size)
+
+    assert F.shape == (2, basis_set_size, basis_set_size)
+    assert torch.allclose(F, F.transpose(-1, -2))
+
+
+def test_atom_pair_output_rejects_mismatched_orbitals():
+    atomic_numbers = io.read(EQUILIBRIUM_GEOMETRY_PATH).numbers.tolist()
+
+    with pytest.raises(ValueError):
+        AtomPairHamiltonianOutput('F', n_in=64, basis_set_size=114, orbitals_per_element=ORBITALS_PER_ELEMENT['sto_6g'],
+                                  atomic_numbers=atomic_numbers)
+    with pytest.raises(ValueError):
+        create_orbital_model(loss_function=torch.nn.functional.mse_loss, basis_set_size=100, atom_pair_output=True,
+                             atomic_numbers=atomic_numbers)
+    with pytest.raises(ValueError):
+        create_orbital_model(loss_function=torch.nn.functional.mse_loss, basis_set_size=36, atom_pair_output=True)
+
+
+def test_atomic_numbers_are_read_from_the_dataset(tmp_path):
+    # water rather than fulvene, the layout follows the dataset
+    atoms = [Atoms('OH2', positions=[[0, 0, 0], [0.96, 0, 0], [-0.24, 0.93, 0]])]
+    atoms_to_db(atoms, str(tmp_path / 'water.db'), molecular_properties=[{'F': np.zeros(7 * 7)}])
+    pack_ase_db(str(tmp_path / 'water.db'), str(tmp_path / 'water_packed'))
+
+    assert get_first_atomic_numbers(str(tmp_path / 'water.db')) == [8, 1, 1]
+    assert get_first_atomic_numbers(str(tmp_path / 'water_packed')) == [8, 1, 1]
@@ -0,0 +1,44 @@
+import os
+
+import pytest
+
+from data.casscf.openmolcas.utils import get_s1_energy, get_s2_energy, parse_log_file, read_log_file
+
+# excerpts of OpenMolcas RASSCF outputs, reduced to the lines around the parsed quantities
+LOG_FOLDER = os.path.join(os.path.dirname(__file__), 'data', 'molcas_logs')
+
+EXPECTED = {
+    'converged.log': (5, 3.0, 5.21, {1: -229.46143583, 2: -229.29071509}),
+    'converged_three_roots.log': (14, 38.0, 41.07, {1: -229.461435830, 2: -229.290715090, 3: -229.215504120}),
+    'not_converged.log': (None, 78.0, 80.30, {1: -229.46143012, 2: -229.29070010}),
+    'truncated.log': (None, None, None, {}),
+    'empty.log': (None, None, None, {}),
+}
+
+
+@pytest.mark.parametrize('log_file', sorted(EXPECTED))
+def test_parse_log_file(log_file):
+    n_iterations, rasscf_timing, wall_timing, root_energies = EXPECTED[log_file]
+
+    result = parse_log_file(os.path.join(LOG_FOLDER, log_file))
+
+    assert result.n_iterations == n_iterations
+    assert result.converged == (n_iterations is not None)
+    assert result.rasscf_timing == rasscf_timing
+    assert result.wall_timing == wall_timing
+    assert result.root_energies == pytest.approx(root_energies)
+
+
+def test_corpus_is_covered():
+    assert sorted(os.listdir(LOG_FOLDER)) == sorted(EXPECTED)
+
+
+@pytest.mark.parametrize('log_file', sorted(EXPECTED))
+def test_wrappers_match_parser(log_file):
+    path = os.path.join(LOG_FOLDER, log_file)
+    result = parse_log_file(path)
+
+    assert read_log_file(path) == (result.rasscf_timing, result.wall_timing, result.n_iterations)
+    assert read_log_file(path, read_iterations=False)[2] is None
+    assert get_s1_energy(path) == result.root_energies.get(1)
+    assert get_s2_energy(path) == result.root_energies.get(2)
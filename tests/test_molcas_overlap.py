@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+from pyscf import gto
+
+from data.casscf import EQUILIBRIUM_GEOMETRY_PATH
+from data.casscf.openmolcas import get_guess_orb_file
+from data.casscf.openmolcas.overlap import build_molecule, compute_overlap_matrix, get_molcas_ao_permutation, read_orb_overlap_matrix
+
+
+def write_molcas_library_file(path, library_name, pyscf_basis, elements):
+    """ writes PySCF basis sets in the Molcas basis library format, one exponent block per angular momentum """
+    lines = []
+    for element, charge in elements.items():
+        shells = gto.basis.load(pyscf_basis, element)
+        max_l = max(shell[0] for shell in shells)
+        lines += [f'/{element}.{library_name}....', 'test reference', 'test reference', f'{charge:.1f} {max_l}']
+        for l in range(max_l + 1):
+            blocks = [np.array(shell[1:]) for shell in shells if shell[0] == l]
+            exponents = np.concatenate([block[:, 0] for block in blocks])
+            n_contracted = sum(block.shape[1] - 1 for block in blocks)
+            coefficients = np.zeros((len(exponents), n_contracted))
+            row, column = 0, 0
+            for block in blocks:
+                coefficients[row:row + len(block), column:column + block.shape[1] - 1] = block[:, 1:]
+                row, column = row + len(block), column + block.shape[1] - 1
+            lines += [f'* {"spdfghi"[l]}-type functions', f'{len(exponents)} {n_contracted}', ' '.join(f'{e:.8E}' for e in exponents)]
+            lines += [' '.join(f'{c:.8E}' for c in coefficient_row) for coefficient_row in coefficients]
+    (path / library_name).write_text('\n'.join(lines) + '\n')
+
+
+def test_molcas_ao_order():
+    molecule = gto.M(atom='C 0 0 0', basis='cc-pvdz', spin=2, verbose=0)
+    labels = [label.split()[-1] for label in molecule.ao_labels()]
+    ordered = [labels[idx] for idx in get_molcas_ao_permutation(molecule)]
+
+    assert ordered == ['1s', '2s', '3s', '2px', '3px', '2py', '3py', '2pz', '3pz',
+                       '3dxy', '3dyz', '3dz^2', '3dxz', '3dx2-y2']
+
+
+def get_ao_centers(geometry_path, basis, basis_library):
+    molecule = build_molecule(geometry_path, basis, basis_library=basis_library)
+    centers = np.array([int(label.split()[0]) for label in molecule.ao_labels()])
+    return centers[get_molcas_ao_permutation(molecule)]
+
+
+def test_library_basis_matches_pyscf(tmp_path):
+    write_molcas_library_file(tmp_path, 'cc-pVDZ', 'cc-pvdz', {'C': 6, 'H': 1})
+
+    S = compute_overlap_matrix(EQUILIBRIUM_GEOMETRY_PATH, 'cc-pVDZ', basis_library=str(tmp_path))
+    molecule = gto.M(atom=EQUILIBRIUM_GEOMETRY_PATH, basis='cc-pvdz', verbose=0)
+    permutation = get_molcas_ao_permutation(molecule)
+    S_reference = molecule.intor('int1e_ovlp')[np.ix_(permutation, permutation)]
+
+    assert S.shape == (6 * 14 + 6 * 5, 6 * 14 + 6 * 5)
+    assert np.allclose(S, S_reference, atol=1e-10)
+
+
+def test_missing_basis_library_raises(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        compute_overlap_matrix(EQUILIBRIUM_GEOMETRY_PATH, 'cc-pVDZ', basis_library=str(tmp_path))
+
+
+def test_ao_order_matches_molcas_orbitals(tmp_path):
+    # the OpenMolcas cc-pVDZ orbitals of the equilibrium geometry, which has interleaved C and H atoms
+    S_molcas = read_orb_overlap_matrix(get_guess_orb_file('cc-pVDZ'))
+    assert np.allclose(np.diag(S_molcas), 1.0, atol=1e-10)
+
+    # the PySCF cc-pVDZ contractions differ from the Molcas library, so only compare what follows from the AO order
+    write_molcas_library_file(tmp_path, 'cc-pVDZ', 'cc-pvdz', {'C': 6, 'H': 1})
+    S = compute_overlap_matrix(EQUILIBRIUM_GEOMETRY_PATH, 'cc-pVDZ', basis_library=str(tmp_path))
+    centers = get_ao_centers(EQUILIBRIUM_GEOMETRY_PATH, 'cc-pVDZ', str(tmp_path))
+    same_center = centers[:, None] == centers[None, :]
+
+    # functions of different l or m on one atom are orthogonal
+    assert np.array_equal(np.abs(S_molcas[same_center]) > 1e-8, np.abs(S[same_center]) > 1e-8)
+    # the largest overlap between two atoms depends on their distance
+    n_atoms = centers.max() + 1
+    pair_max = lambda M: np.array([[np.abs(M[np.ix_(centers == a, centers == b)]).max() for b in range(n_atoms)]
+                                   for a in range(n_atoms)])
+    assert np.allclose(pair_max(S), pair_max(S_molcas), atol=0.05)
+
+
+def test_minimal_basis_takes_first_contractions(tmp_path):
+    write_molcas_library_file(tmp_path, 'ANO-S', 'ano', {'C': 6, 'H': 1})
+
+    molecule = build_molecule(EQUILIBRIUM_GEOMETRY_PATH, 'ANO-S-MB', basis_library=str(tmp_path))
+    S = compute_overlap_matrix(EQUILIBRIUM_GEOMETRY_PATH, 'ANO-S-MB', basis_library=str(tmp_path))
+
+    assert [molecule.bas_nctr(idx) for idx in molecule.atom_shell_ids(0)] == [2, 1]
+    assert S.shape == (36, 36)
+    assert np.allclose(S, S.T)
+    assert np.allclose(np.diag(S), 1.0)
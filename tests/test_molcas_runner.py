@@ -0,0 +1,69 @@
+import os
+import stat
+import time
+
+import pytest
+
+from data.casscf.openmolcas import runner
+from data.casscf.openmolcas.runner import MolcasCalculationError, MolcasRunner, run_molcas_calculation
+
+
+@pytest.fixture
+def fake_molcas(tmp_path, monkeypatch):
+    """ stands in for pymolcas: the input file holds the seconds to sleep and the exit code """
+    script = tmp_path / 'pymolcas'
+    script.write_text('#!/bin/sh\n'
+                      'read seconds code < "$1"\n'
+                      'echo "WorkDir $WorkDir"\n'
+                      'touch CASSCF.rasscf.h5 CASSCF.JobIph "$WorkDir/CASSCF.OneInt"\n'
+                      'sleep "$seconds"\n'
+                      'exit "$code"\n')
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setattr(runner, 'MOLCAS_PATH', str(script))
+
+    def make_calculation(name: str, seconds: float, code: int = 0) -> str:
+        dir_path = tmp_path / name
+        dir_path.mkdir()
+        (dir_path / 'CASSCF.input').write_text(f'{seconds} {code}\n')
+        return str(dir_path)
+    return make_calculation
+
+
+def test_run_copies_back_results_from_scratch(fake_molcas, tmp_path):
+    dir_path = fake_molcas('calculation_0', 0)
+    scratch_path = tmp_path / 'scratch'
+    scratch_path.mkdir()
+
+    log_file = run_molcas_calculation(dir_path, scratch_path=str(scratch_path))
+
+    with open(log_file) as f:
+        assert f.read().strip().startswith(f'WorkDir {scratch_path}')
+    assert sorted(os.listdir(dir_path)) == ['CASSCF.input', 'CASSCF.rasscf.h5', 'calc.log']
+    assert os.listdir(scratch_path) == []
+
+
+def test_failed_run_raises_and_cleans_up(fake_molcas, tmp_path):
+    dir_path = fake_molcas('calculation_0', 0, code=3)
+    scratch_path = tmp_path / 'scratch'
+    scratch_path.mkdir()
+
+    with pytest.raises(MolcasCalculationError) as error:
+        run_molcas_calculation(dir_path, scratch_path=str(scratch_path))
+    assert error.value.returncode == 3
+    assert os.path.exists(os.path.join(dir_path, 'calc.log'))
+    assert os.listdir(scratch_path) == []
+
+
+def test_runner_limits_concurrency_and_times_out(fake_molcas):
+    # the slow run goes first, so it holds one of the two slots while the others run one after another in the second
+    dir_paths = [fake_molcas('calculation_slow', 30)] + [fake_molcas(f'calculation_{idx}', 0.5) for idx in range(4)]
+
+    tic = time.perf_counter()
+    results = MolcasRunner(max_concurrency=2, timeout=2).run_all(dir_paths)
+    wall_time = time.perf_counter() - tic
+
+    assert isinstance(results[0], MolcasCalculationError)
+    assert 'timed out after 2 s' in str(results[0])
+    assert all(isinstance(result, str) for result in results[1:])
+    # the slow run is killed at the timeout instead of sleeping for 30 s
+    assert wall_time < 10
@@ -0,0 +1,90 @@
+import os
+
+import numpy as np
+import pytest
+import schnetpack as spk
+import schnetpack.properties as structure
+import torch
+from ase import io
+
+from data.casscf import EQUILIBRIUM_GEOMETRY_PATH
+from data.db.pack_db import pack_ase_db
+from data.db.utils import atoms_to_db
+from model.neighbor_list_cache import CachedNeighborList, get_neighbor_list_cache
+from model.packed_dataset import PackedAtomsData
+
+# small enough that the displaced geometries have different neighbour lists
+CUTOFF = 2.5
+
+
+def write_database(db_path, n_structures, seed):
+    np.random.seed(seed)
+    equilibrium = io.read(EQUILIBRIUM_GEOMETRY_PATH)
+    atoms_list = []
+    for _ in range(n_structures):
+        atoms = equilibrium.copy()
+        atoms.positions += np.random.normal(scale=0.3, size=atoms.positions.shape)
+        atoms_list.append(atoms)
+    atoms_to_db(atoms_list, str(db_path), molecular_properties=[{'F': np.zeros(36 * 36)}] * n_structures,
+                metadata={'_distance_unit': 'angstrom', '_property_unit_dict': {'F': 1.0}})
+    return str(db_path)
+
+
+def open_dataset(database_path, transforms):
+    if os.path.isdir(database_path):
+        return PackedAtomsData(database_path, load_properties=['F'], transforms=transforms)
+    return spk.data.ASEAtomsData(database_path, load_properties=['F'], transforms=transforms)
+
+
+def assert_neighbor_lists_equal(dataset, reference):
+    assert len(dataset) == len(reference)
+    n_pairs = set()
+    for idx in range(len(reference)):
+        sample, reference_sample = dataset[idx], reference[idx]
+        assert torch.equal(sample[structure.idx], reference_sample[structure.idx])
+        for key in [structure.idx_i, structure.idx_j, structure.offsets]:
+            assert sample[key].dtype == reference_sample[key].dtype
+            assert torch.equal(sample[key], reference_sample[key]), key
+        n_pairs.add(len(reference_sample[structure.idx_i]))
+    # otherwise a lookup by the wrong index could go unnoticed
+    assert len(n_pairs) > 1
+
+
+@pytest.fixture(params=['db', 'packed'])
+def database_path(request, tmp_path):
+    db_path = write_database(tmp_path / 'fulvene.db', 8, seed=0)
+    if request.param == 'packed':
+        pack_ase_db(db_path, str(tmp_path / 'fulvene_packed'))
+        return str(tmp_path / 'fulvene_packed')
+    return db_path
+
+
+def test_cached_neighbor_lists_match_ase(database_path):
+    cached = CachedNeighborList(get_neighbor_list_cache(database_path, CUTOFF))
+
+    assert_neighbor_lists_equal(open_dataset(database_path, [cached]),
+                                open_dataset(database_path, [spk.transform.ASENeighborList(cutoff=CUTOFF)]))
+
+
+def test_cached_neighbor_lists_match_ase_on_subsets(database_path):
+    cached = CachedNeighborList(get_neighbor_list_cache(database_path, CUTOFF))
+    dataset = open_dataset(database_path, [cached])
+    reference = open_dataset(database_path, [spk.transform.ASENeighborList(cutoff=CUTOFF)])
+
+    for subset_idx in ([6, 1, 4, 3], [7, 0, 2, 5]):
+        assert_neighbor_lists_equal(dataset.subset(subset_idx), reference.subset(subset_idx))
+
+
+def test_rewritten_database_rebuilds_cache(tmp_path):
+    db_path = write_database(tmp_path / 'fulvene.db', 8, seed=0)
+    cache_path = get_neighbor_list_cache(db_path, CUTOFF)
+
+    os.remove(db_path)
+    write_database(tmp_path / 'fulvene.db', 8, seed=1)
+    # the stamp is the modification time, which may not have moved on a coarse clock
+    stamp = os.path.getmtime(cache_path) + 10
+    os.utime(db_path, (stamp, stamp))
+
+    assert get_neighbor_list_cache(db_path, CUTOFF) == cache_path
+    assert_neighbor_lists_equal(open_dataset(db_path, [CachedNeighborList(cache_path)]),
+                                open_dataset(db_path, [spk.transform.ASENeighborList(cutoff=CUTOFF)]))
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from data.casscf.openmolcas import get_guess_orb_file
+from data.casscf.openmolcas.utils import OrbFileTemplate, numpy_to_string, read_orb_file, write_coeffs_to_orb_file
+
+
+@pytest.mark.parametrize('n', [35, 36, 114])
+def test_writer_matches_numpy_to_string(tmp_path, n):
+    np.random.seed(0)
+    coeffs = np.random.randn(n * n) * 10.0 ** np.random.randint(-12, 2, n * n)
+    template = OrbFileTemplate.from_file(get_guess_orb_file('ANO-S-MB'))
+
+    write_coeffs_to_orb_file(coeffs, get_guess_orb_file('ANO-S-MB'), str(tmp_path / 'geom.orb'), n)
+
+    reference = template.header
+    for i in range(1, n + 1):
+        reference += f'* ORBITAL \t 1 \t {i} \n' + numpy_to_string(coeffs[(i - 1) * n:i * n])
+    reference += template.footer
+    assert (tmp_path / 'geom.orb').read_text() == reference
+
+
+def test_read_orb_file_round_trip(tmp_path):
+    reference = read_orb_file(get_guess_orb_file('ANO-S-MB'))
+    assert reference.shape == (36, 36)
+    assert reference[0, 0] == 1.40088122237507E-03
+
+    write_coeffs_to_orb_file(reference.flatten(), get_guess_orb_file('ANO-S-MB'), str(tmp_path / 'geom.orb'), 36)
+    assert np.array_equal(read_orb_file(str(tmp_path / 'geom.orb')), reference)
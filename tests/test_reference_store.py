@@ -0,0 +1,113 @@
+import numpy as np
+import pytest
+
+from data.benchmark_geometry_sorting import write_normal_distribution_geometries
+from data.db.utils import atoms_to_db, xyz_files_to_atoms
+from data.utils import CasscfResult, get_geometry_hash
+from evaluation import reference_store as reference_store_module
+from evaluation.reference_store import ReferenceStore
+
+
+def make_result(e_tot, converged=True, n=4):
+    return CasscfResult(converged=converged, basis='sto_6g', e_tot=e_tot,
+                        mo_energies=np.full(n, e_tot), mo_coeffs=np.full((n, n), e_tot),
+                        S=np.eye(n), F=np.eye(n), imacro=1)
+
+
+@pytest.fixture
+def computed(monkeypatch):
+    """ replaces the SA-CASSCF by a result with e_tot -100 and records the geometries it was run for """
+    geometry_files = []
+    def compute_reference_casscf_result(geometry_path, basis):
+        geometry_files.append(geometry_path)
+        return make_result(-100.0)
+    monkeypatch.setattr(reference_store_module, 'compute_reference_casscf_result', compute_reference_casscf_result)
+    return geometry_files
+
+
+@pytest.fixture
+def geometry_files(tmp_path):
+    np.random.seed(0)
+    (tmp_path / 'geometries').mkdir()
+    return write_normal_distribution_geometries(str(tmp_path / 'geometries'), 4)
+
+
+def write_database(db_path, geometry_files, values):
+    atoms_to_db(xyz_files_to_atoms(geometry_files), str(db_path),
+                molecular_properties=[{'mo_coeffs': make_result(value).mo_coeffs.flatten(),
+                                       'mo_energies': make_result(value).mo_energies} for value in values])
+
+
+def test_database_hash_matches_xyz(tmp_path, geometry_files):
+    write_database(tmp_path / 'references.db', geometry_files, [0.0] * len(geometry_files))
+    store = ReferenceStore(str(tmp_path / 'store'))
+    store.add_database(str(tmp_path / 'references.db'), 'sto-6g')
+
+    assert set(store._db_rows) == {(get_geometry_hash(file), 'sto_6g') for file in geometry_files}
+
+
+def test_lookup_priority(tmp_path, geometry_files, computed):
+    # geometry 0 is in the store, the campaign and the database, geometry 1 in the campaign and the database,
+    # geometry 2 only in the database and geometry 3 nowhere
+    output_folder = tmp_path / 'output'
+    output_folder.mkdir()
+    for idx in (0, 1):
+        make_result(-2.0 - idx).store_as_npz(str(output_folder / f'geometry_{idx}.npz'))
+    write_database(tmp_path / 'references.db', geometry_files[:3], [-10.0, -11.0, -12.0])
+    store_folder = tmp_path / 'store'
+    store_folder.mkdir()
+    make_result(-1.0).store_as_npz(str(store_folder / f'sto_6g__{get_geometry_hash(geometry_files[0])}.npz'))
+
+    store = ReferenceStore(str(store_folder))
+    store.add_output_folder(str(tmp_path / 'geometries'), str(output_folder), 'sto-6g')
+    store.add_database(str(tmp_path / 'references.db'), 'sto-6g')
+
+    assert store.get_casscf_energy(geometry_files[0], 'sto-6g') == -1.0
+    assert store.get_casscf_energy(geometry_files[1], 'sto-6g') == -3.0
+    assert store.get_converged_orbitals(geometry_files[2], 'sto-6g')[0][0] == -12.0
+    assert computed == []
+
+    # the database has no energies, so they are computed
+    assert store.get_casscf_energy(geometry_files[2], 'sto-6g') == -100.0
+    assert store.get_casscf_energy(geometry_files[3], 'sto-6g') == -100.0
+    assert computed == [geometry_files[2], geometry_files[3]]
+    assert store.stats() == {'hits': 3, 'misses': 2, 'known': 4}
+
+
+def test_non_converged_campaign_result_is_recomputed(tmp_path, geometry_files, computed):
+    output_folder = tmp_path / 'output'
+    output_folder.mkdir()
+    make_result(-2.0, converged=False).store_as_npz(str(output_folder / 'geometry_0.npz'))
+
+    store = ReferenceStore(str(tmp_path / 'store'))
+    store.add_output_folder(str(tmp_path / 'geometries'), str(output_folder), 'sto-6g')
+
+    assert store.get_casscf_energy(geometry_files[0], 'sto-6g') == -100.0
+    assert computed == [geometry_files[0]]
+
+
+def test_computed_results_are_persisted(tmp_path, geometry_files, computed):
+    store = ReferenceStore(str(tmp_path / 'store'))
+    assert store.get_casscf_energy(geometry_files[0], 'sto-6g') == -100.0
+
+    # a new store finds the result in the store folder
+    store = ReferenceStore(str(tmp_path / 'store'))
+    assert store.get_casscf_energy(geometry_files[0], 'sto-6g') == -100.0
+    assert computed == [geometry_files[0]]
+    assert store.stats() == {'hits': 1, 'misses': 0, 'known': 1}
+
+
+def test_database_lookup_is_memoized(tmp_path, geometry_files, monkeypatch):
+    write_database(tmp_path / 'references.db', geometry_files[:1], [-10.0])
+    store = ReferenceStore(str(tmp_path / 'store'))
+    store.add_database(str(tmp_path / 'references.db'), 'sto-6g')
+    store.get_converged_orbitals(geometry_files[0], 'sto-6g')
+
+    def connect(*args, **kwargs):
+        raise AssertionError('the database is opened again')
+    monkeypatch.setattr(reference_store_module, 'connect', connect)
+
+    mo_energies, mo_coeffs = store.get_converged_orbitals(geometry_files[0], 'sto-6g')
+    assert mo_energies[0] == -10.0
+    assert mo_coeffs.shape == (4, 4)
+    assert store.stats()['hits'] == 2
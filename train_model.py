@@ -2,10 +2,11 @@
 Script for training NN on CAS orbitals
 """
 import argparse
+from functools import partial
 import torch
 from model.caschnet_model import create_orbital_model
 
-from model.loss_functions import mean_squared_error, symm_matrix_mse
+from model.loss_functions import mean_squared_error, overlap_weighted_mse, symm_matrix_mse
 from model.training import train_model
 
 
@@ -22,6 +23,8 @@ if __name__ == "__main__":
   parser.add_argument('--split_name', type=str)
   parser.add_argument('--property', type=str)
   parser.add_argument('--model_name', type=str)
+  parser.add_argument('--in_memory', action='store_true')
+  parser.add_argument('--overlap_weighted', action='store_true', help='MO coefficient loss in the metric of the overlap matrix S')
   args = parser.parse_args()
 
   database_path = './data_storage/' + args.db_name
@@ -31,6 +34,10 @@ if __name__ == "__main__":
 
   property = args.property
   loss_fn = torch.nn.functional.mse_loss
+  overlap_property = None
+  if args.overlap_weighted:
+    loss_fn = partial(overlap_weighted_mse, basis_set_size=basis_set_size)
+    overlap_property = 'S'
 
   train_model(save_path='./checkpoints/' + model_name + '.pt',
                   property=property, 
@@ -43,4 +50,6 @@ if __name__ == "__main__":
                   create_model_fn=create_model_fn,
                   split_file=split_file,
                   use_wandb=use_wandb,
-                  cutoff=cutoff) 
\ No newline at end of file
+                  cutoff=cutoff,
+                  in_memory=args.in_memory,
+                  overlap_property=overlap_property) 
\ No newline at end of file